@@ -1,11 +1,80 @@
 #!/usr/bin/env python3
 
+import os
+import re
 import socket
+import hashlib
 import threading
 import json
 import tkinter as tk
-from tkinter import messagebox, scrolledtext
+from tkinter import messagebox, scrolledtext, filedialog
 import queue
+import time
+from collections import deque
+
+
+class JsonStreamParser:
+    """Split the server's stream of concatenated JSON objects into messages.
+
+    Received bytes go into one bytearray that is scanned once, from a cursor,
+    for the brace closing the current top-level object (skipping strings), so a
+    large reply arriving in many chunks costs linear time. Only complete
+    objects are decoded, all with the same decoder.
+    """
+    SCAN_OUTSIDE = re.compile(rb'[{}\[\]"]')
+    SCAN_STRING = re.compile(rb'["\\]')
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.start = 0  # Offset of the message being received
+        self.cursor = 0  # Bytes before this offset are scanned
+        self.depth = 0
+        self.in_string = False
+        self.decoder = json.JSONDecoder()
+
+    def feed(self, data):
+        """Add received bytes; return the messages they complete, in order"""
+        buffer = self.buffer
+        buffer += data
+        messages = []
+        pos = self.cursor
+        while True:
+            if self.in_string:
+                match = self.SCAN_STRING.search(buffer, pos)
+                if match is None:
+                    break
+                if buffer[match.start()] == 0x5c:  # Backslash: skip the escaped byte, possibly not received yet
+                    pos = match.start() + 2
+                else:
+                    self.in_string = False
+                    pos = match.end()
+                continue
+
+            match = self.SCAN_OUTSIDE.search(buffer, pos)
+            if match is None:
+                break
+            char = buffer[match.start()]
+            pos = match.end()
+            if char == 0x22:  # Quote
+                self.in_string = True
+            elif char in (0x7b, 0x5b):  # { or [
+                self.depth += 1
+            else:
+                self.depth -= 1
+                if self.depth <= 0:
+                    self.depth = 0
+                    try:
+                        messages.append(self.decoder.decode(buffer[self.start:pos].decode('utf-8')))
+                    except ValueError:
+                        pass  # Malformed message; carry on with the next one
+                    self.start = pos
+
+        self.cursor = max(pos, len(buffer))  # Past the end while an escaped byte is still to come
+        if self.start:
+            del buffer[:self.start]
+            self.cursor -= self.start
+            self.start = 0
+        return messages
 
 
 class ChatClient:
@@ -16,8 +85,20 @@ class ChatClient:
         self.socket = None
         self.is_connected = False
         self.username = None
-        self.message_queue = queue.Queue()
-        self.message_handler = None  # Will be set by window
+        self.message_queue = queue.Queue()  # Lists of messages, one per received chunk
+        self.pending_messages = deque()  # Rest of the batch next_message() is handing out
+        self.message_handler = None  # Active window's handler, called on the Tk main loop
+        self.ui_root = None  # Tk root that dispatch_messages() runs on, set by attach_ui()
+        self.wakeup_pending = False  # A wakeup event is queued and has not been handled yet
+        self.session_token = None  # Issued by join_chat, used to resume after a network blip
+        self.last_seen = {}  # group_name -> highest message seq received
+        self.pending_files = {}  # sha256 -> local path declared with begin_upload
+
+    RECONNECT_ATTEMPTS = 5
+    RECONNECT_DELAY = 1.0
+    TRANSFER_CHUNK_SIZE = 256 * 1024
+    RECV_SIZE = 64 * 1024
+    WAKEUP_EVENT = '<<ChatMessages>>'
 
     def connect(self):
         try:
@@ -97,10 +178,105 @@ class ChatClient:
         except Exception:
             pass
 
-    def get_group_members(self):
-        """Get members of current group"""
+    def get_group_members(self, if_version=None):
+        """Get members of current group; the reply is not_modified if if_version is still current"""
         request = {
             'method': 'get_group_members',
+            'params': {} if if_version is None else {'if_version': if_version}
+        }
+        try:
+            self.socket.sendall(json.dumps(request).encode('utf-8'))
+        except Exception:
+            pass
+
+    def send_direct_message(self, peer, message):
+        """Send a private message to another user"""
+        request = {
+            'method': 'send_direct_message',
+            'params': {'to': peer, 'message': message}
+        }
+        try:
+            self.socket.sendall(json.dumps(request).encode('utf-8'))
+        except Exception:
+            pass
+
+    def open_direct_chat(self, peer):
+        """Request the direct-message history with peer; the reply opens the conversation"""
+        request = {
+            'method': 'get_direct_history',
+            'params': {'with': peer}
+        }
+        try:
+            self.socket.sendall(json.dumps(request).encode('utf-8'))
+        except Exception:
+            pass
+
+    def share_file(self, path):
+        """Hash and declare a file for the current group on a background thread; the upload starts when the server replies"""
+        def run():
+            hasher = hashlib.sha256()
+            size = 0
+            try:
+                with open(path, 'rb') as f:
+                    for chunk in iter(lambda: f.read(self.TRANSFER_CHUNK_SIZE), b''):
+                        hasher.update(chunk)
+                        size += len(chunk)
+            except OSError:
+                return
+            sha256 = hasher.hexdigest()
+            self.pending_files[sha256] = path
+            request = {
+                'method': 'begin_upload',
+                'params': {'sha256': sha256, 'size': size, 'file_name': os.path.basename(path)}
+            }
+            try:
+                self.socket.sendall(json.dumps(request).encode('utf-8'))
+            except Exception:
+                pass
+        threading.Thread(target=run, daemon=True).start()
+
+    def _open_transfer(self, header):
+        """Open a transfer connection and send its header line"""
+        transfer = socket.create_connection((self.host, self.port))
+        transfer.sendall(f"{header}\n".encode('ascii'))
+        return transfer
+
+    def _upload_file(self, path, upload_id, offset):
+        try:
+            with self._open_transfer(f"UPLOAD {upload_id} {offset}") as transfer, open(path, 'rb') as f:
+                transfer.sendfile(f, offset)
+                transfer.recv(1)  # Server closes once it has every byte
+        except Exception:
+            pass  # begin_upload again to resume from the server's offset
+
+    def download_attachment(self, attachment_id, dest_path, on_done=None):
+        """Fetch an attachment into dest_path on a background thread"""
+        def run():
+            ok = False
+            try:
+                with self._open_transfer(f"DOWNLOAD {attachment_id} 0") as transfer:
+                    reader = transfer.makefile('rb')
+                    header = reader.readline().split()
+                    if header[:1] == [b'OK']:
+                        remaining = int(header[1])
+                        with open(dest_path, 'wb') as f:
+                            while remaining:
+                                chunk = reader.read(min(remaining, self.TRANSFER_CHUNK_SIZE))
+                                if not chunk:
+                                    break
+                                f.write(chunk)
+                                remaining -= len(chunk)
+                        ok = remaining == 0
+            except Exception:
+                pass
+            if on_done:
+                on_done(ok)
+        threading.Thread(target=run, daemon=True).start()
+
+    def subscribe_presence(self):
+        """Ask the server to push users_delta events; the reply is a full presence snapshot"""
+        request = {
+            'method': 'subscribe_presence',
             'params': {}
         }
         try:
@@ -108,26 +284,157 @@ class ChatClient:
         except Exception:
             pass
 
+    def resume(self):
+        """Reattach to the previous session, asking only for messages missed since last_seen"""
+        request = {
+            'method': 'resume',
+            'params': {
+                'session_token': self.session_token,
+                'last_seen': dict(self.last_seen)
+            }
+        }
+        self.socket.sendall(json.dumps(request).encode('utf-8'))
+
+    def _reconnect(self):
+        """Open a new connection and resume the session after an unexpected disconnect"""
+        if not self.session_token:
+            return False
+        for attempt in range(self.RECONNECT_ATTEMPTS):
+            time.sleep(self.RECONNECT_DELAY * (attempt + 1))
+            if not self.is_connected:
+                return False
+            try:
+                self.socket.close()
+            except Exception:
+                pass
+            try:
+                self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                self.socket.connect((self.host, self.port))
+                self.resume()
+                return True
+            except Exception:
+                continue
+        return False
+
+    def _track_message(self, json_data):
+        """Remember session token and latest seq per group; return the messages to queue"""
+        if json_data.get('session_token'):
+            self.session_token = json_data['session_token']
+
+        path = self.pending_files.get(json_data.get('attachment_id'))
+        if path and 'status' in json_data:
+            if json_data.get('upload_id'):
+                threading.Thread(target=self._upload_file, daemon=True,
+                                 args=(path, json_data['upload_id'], json_data.get('offset', 0))).start()
+            del self.pending_files[json_data['attachment_id']]
+
+        for msg in json_data.get('message_history', []):
+            self._track_seq(msg)
+        self._track_seq(json_data)
+
+        # Deliver a resumed gap as ordinary broadcasts so windows render it as live traffic
+        missed_messages = json_data.pop('missed_messages', [])
+        for msg in missed_messages:
+            self._track_seq(msg)
+        return [json_data] + missed_messages
+
+    def _track_seq(self, msg):
+        group_name = msg.get('group_name')
+        seq = msg.get('seq')
+        if group_name and isinstance(seq, int) and seq > self.last_seen.get(group_name, 0):
+            self.last_seen[group_name] = seq
+
+    @staticmethod
+    def apply_members_delta(members, member_version, delta):
+        """Apply a members_delta to a member list.
+
+        Returns the new list, the unchanged list for stale deltas, or None when a
+        version gap means the full list must be requested with get_group_members.
+        """
+        if member_version is not None and delta.get('member_version', 0) <= member_version:
+            return members
+        if member_version is None or delta.get('base_version') != member_version:
+            return None
+        removed = set(delta.get('removed', []))
+        merged = [member for member in members if member not in removed]
+        present = set(merged)
+        merged.extend(name for name in delta.get('added', []) if name not in present)
+        return merged
+
+    @staticmethod
+    def apply_users_delta(users, users_version, delta):
+        """Apply a users_delta to an online-user list.
+
+        A delta holds the latest state of every user it names, so it applies to
+        any snapshot taken since base_version. Returns the new list, the unchanged
+        list for stale deltas, or None when subscribe_presence must resync.
+        """
+        if users_version is not None and delta.get('users_version', 0) <= users_version:
+            return users
+        if users_version is None or delta.get('base_version', 0) > users_version:
+            return None
+        removed = set(delta.get('removed', []))
+        merged = [user for user in users if user not in removed]
+        present = set(merged)
+        merged.extend(name for name in delta.get('added', []) if name not in present)
+        return merged
+
     def listen_for_messages(self):
-        buffer = ""
+        parser = JsonStreamParser()
         while self.is_connected:
             try:
-                data = self.socket.recv(1024).decode('utf-8')
+                data = self.socket.recv(self.RECV_SIZE)
                 if data:
-                    buffer += data
-                    while buffer:
-                        try:
-                            decoder = json.JSONDecoder()
-                            json_data, idx = decoder.raw_decode(buffer)
-                            buffer = buffer[idx:].lstrip()
-                            self.message_queue.put(json_data)
-                        except json.JSONDecodeError:
-                            break
-                else:
-                    break
+                    batch = []
+                    for json_data in parser.feed(data):
+                        batch.extend(self._track_message(json_data))
+                    if batch:
+                        self.message_queue.put(batch)
+                        self._wake_ui()
+                    continue
             except Exception:
-                if self.is_connected:
-                    break
+                pass
+            if not self.is_connected or not self._reconnect():
+                break
+            parser = JsonStreamParser()
+
+    def attach_ui(self, root):
+        """Deliver received messages to message_handler on root's main loop as soon as they arrive"""
+        self.ui_root = root
+        root.bind(self.WAKEUP_EVENT, lambda event: self.dispatch_messages())
+        root.after_idle(self.dispatch_messages)  # Anything received before the window existed
+
+    def _wake_ui(self):
+        """Called by the reader thread after queueing a batch; one wakeup covers every batch until handled"""
+        if self.wakeup_pending or self.ui_root is None:
+            return
+        self.wakeup_pending = True
+        try:
+            # Thread-safe: tkinter hands the call to the thread running the main loop
+            self.ui_root.event_generate(self.WAKEUP_EVENT, when='tail')
+        except (RuntimeError, tk.TclError):
+            # Main loop not running yet or window closed; attach_ui() drains the queue later
+            self.wakeup_pending = False
+
+    def dispatch_messages(self):
+        """Hand every queued message to the active window's handler"""
+        self.wakeup_pending = False  # Cleared first, so a batch queued while draining sends a new wakeup
+        try:
+            while True:
+                json_data = self.next_message()
+                if self.message_handler:
+                    try:
+                        self.message_handler(json_data)
+                    except Exception as e:
+                        print(f"Error handling message: {e}")
+        except queue.Empty:
+            pass
+
+    def next_message(self, timeout=0.0):
+        """Next received message; raises queue.Empty if none arrives within timeout seconds"""
+        if not self.pending_messages:
+            self.pending_messages.extend(self.message_queue.get(timeout=timeout))
+        return self.pending_messages.popleft()
 
     def disconnect(self):
         if self.is_connected:
@@ -147,6 +454,111 @@ class ChatClient:
 
 
 
+class ChatDisplay:
+    """Bounded view of a conversation in a Text widget.
+
+    Every entry (one message, as text/tags segments) is kept in a list, but only
+    the newest are in the widget: old lines are trimmed as messages arrive and
+    rendered again a page at a time when the view is scrolled to the top. Each
+    page is a single insert call, so opening a long history costs one page.
+    """
+    MAX_RENDERED = 300  # Entries left in the widget after a new message
+    PAGE_SIZE = 100  # Entries rendered when a history opens and per scroll-back
+    MAX_ENTRIES = 5000  # Entries kept for scroll-back
+
+    def __init__(self, text, scrollbar):
+        self.text = text
+        self.scrollbar = scrollbar
+        self.entries = []  # Tuples of (text, tags, text, tags, ...), oldest first
+        self.rendered = 0  # Newest entries currently in the widget
+        self.loading = False  # An older page is scheduled
+        text.config(yscrollcommand=self._on_scroll)
+
+    def append(self, *segments):
+        """Add one entry at the bottom and scroll to it"""
+        self.entries.append(segments)
+        self._insert(tk.END, [segments])
+        self.rendered += 1
+        if self.rendered > self.MAX_RENDERED:
+            self._trim(self.rendered - self.MAX_RENDERED)
+        if len(self.entries) > self.MAX_ENTRIES + self.PAGE_SIZE:
+            del self.entries[:self.PAGE_SIZE]
+        self.text.see(tk.END)
+
+    def show(self, entries):
+        """Replace the conversation, rendering only its newest page"""
+        self.entries = list(entries[-self.MAX_ENTRIES:])
+        self._delete_all()
+        page = self.entries[-self.PAGE_SIZE:]
+        self._insert(tk.END, page)
+        self.rendered = len(page)
+        self.text.see(tk.END)
+
+    def clear(self):
+        self.entries = []
+        self._delete_all()
+
+    def _insert(self, index, entries):
+        parts = [part for entry in entries for part in entry]
+        if parts:
+            self.text.config(state=tk.NORMAL)
+            self.text.insert(index, *parts)
+            self.text.config(state=tk.DISABLED)
+
+    def _delete_all(self):
+        self.text.config(state=tk.NORMAL)
+        self.text.delete(1.0, tk.END)
+        self.text.config(state=tk.DISABLED)
+        self.rendered = 0
+
+    @staticmethod
+    def _line_count(entries):
+        return sum(part.count('\n') for entry in entries for part in entry[0::2])
+
+    def _trim(self, count):
+        """Remove the oldest count rendered entries from the widget"""
+        start = len(self.entries) - self.rendered
+        lines = self._line_count(self.entries[start:start + count])
+        self.text.config(state=tk.NORMAL)
+        self.text.delete(1.0, f"{lines + 1}.0")
+        self.text.config(state=tk.DISABLED)
+        self.rendered -= count
+
+    def _on_scroll(self, first, last):
+        self.scrollbar.set(first, last)
+        if float(first) <= 0.0 and self.rendered < len(self.entries) and not self.loading:
+            self.loading = True
+            self.text.after_idle(self._load_older_page)  # Not while Tk is still updating the view
+
+    def _load_older_page(self):
+        self.loading = False
+        start = len(self.entries) - self.rendered
+        page = self.entries[max(0, start - self.PAGE_SIZE):start]
+        if not page:
+            return
+        self._insert(1.0, page)
+        self.rendered += len(page)
+        self.text.yview(f"{self._line_count(page) + 1}.0")  # Keep the previous top line in place
+
+
+def add_attachment_line(window, display, client, attachment):
+    """Show a shared file in display; clicking the line saves it"""
+    file_name = attachment.get('file_name', 'file')
+    tag = f"attachment_{attachment.get('attachment_id')}"
+
+    def save(event):
+        dest_path = filedialog.asksaveasfilename(parent=window, initialfile=file_name)
+        if dest_path:
+            client.download_attachment(attachment['attachment_id'], dest_path, lambda ok: window.after(
+                0, lambda: None if ok else messagebox.showerror("Download failed", f"Could not download {file_name}")))
+
+    # Tag options and bindings outlive the text, so a trimmed line keeps working when paged back in
+    display.text.tag_config(tag, underline=True)
+    display.text.tag_bind(tag, "<Button-1>", save)
+    display.append(f"📎 {attachment.get('username', 'Unknown')} shared {file_name} "
+                   f"({attachment.get('size', 0) / 1024:.0f} KB) - click to save\n", ("system", tag))
+
+
 class LoginWindow:
     """Login window for username input"""
     def __init__(self, on_login_callback):
@@ -258,18 +670,20 @@ class LobbyWindow:
         self.window.geometry(f"600x500+{x}+{y}")
 
         self.chat_window = None
-        self.pending_private_chat = None  # Store pending private chat group name
+        self.direct_chat_window = None  # Open direct-message conversation, if any
+        self.users = []
+        self.users_version = None  # Version of self.users, advanced by users_delta
 
         # Set message handler to this window
         self.client.message_handler = self._handle_message
 
         self._create_widgets()
 
-        # Start processing messages
-        self.window.after(100, self._process_messages)
+        # Received messages are delivered to the active window's handler as they arrive
+        self.client.attach_ui(self.window)
 
-        # Auto refresh users
-        self.window.after(500, self._auto_refresh_users)
+        # Online users are pushed by the server from now on
+        self.client.subscribe_presence()
 
         # Handle window close
         self.window.protocol("WM_DELETE_WINDOW", self._on_close)
@@ -454,14 +868,11 @@ class LobbyWindow:
             cursor="hand2"
         ).pack(pady=20, ipady=8, ipadx=30)
 
-    def _auto_refresh_users(self):
-        """Auto refresh users every 3 seconds"""
-        if self.client.is_connected:
-            self.client.get_users()
-            self.window.after(3000, self._auto_refresh_users)
-
-    def _update_users_list(self, users):
+    def _update_users_list(self, users, users_version=None):
         """Update the users listbox"""
+        self.users = list(users)
+        if users_version is not None:
+            self.users_version = users_version
         self.users_listbox.delete(0, tk.END)
         for user in users:
             username = user.get('username', user) if isinstance(user, dict) else user
@@ -469,7 +880,7 @@ class LobbyWindow:
             self.users_listbox.insert(tk.END, display_name)
 
     def _on_user_double_click(self, event):
-        """Handle double click on user in the list - Create private chat"""
+        """Handle double click on user in the list - Open direct chat"""
         selection = self.users_listbox.curselection()
         if selection:
             index = selection[0]
@@ -480,36 +891,13 @@ class LobbyWindow:
 
             # Don't create chat with yourself
             if selected_user == self.username:
-                print(f"✗ Cannot create private chat with yourself")
+                print(f"✗ Cannot open a direct chat with yourself")
                 return
 
             print(f"✓ Double clicked on user: {selected_user}")
 
-            # Create a private group name (sorted to ensure consistency)
-            users = sorted([self.username, selected_user])
-            private_group_name = f"private_{users[0]}_{users[1]}"
-
-            print(f"→ Creating/joining private chat: {private_group_name}")
-
-            # Store pending private chat request
-            self.pending_private_chat = private_group_name
-
-            # Try to create the group first (will fail if exists, then join)
-            self.client.create_group(private_group_name)
-
-    def _process_messages(self):
-        """Process messages from queue"""
-        try:
-            while True:
-                json_data = self.client.message_queue.get_nowait()
-                # Only process if this window's handler is active
-                if self.client.message_handler == self._handle_message:
-                    self._handle_message(json_data)
-        except queue.Empty:
-            pass
-        finally:
-            if self.client.is_connected:
-                self.window.after(100, self._process_messages)
+            print(f"→ Opening direct chat with {selected_user}")
+            self.client.open_direct_chat(selected_user)
 
     def _handle_message(self, json_data):
         """Handle incoming JSON messages"""
@@ -518,17 +906,27 @@ class LobbyWindow:
             status = json_data['status']
 
             if status == 'success':
+                # Presence snapshot from subscribe_presence
+                if 'presence' in json_data:
+                    presence = json_data['presence']
+                    self._update_users_list(presence['users'], presence['users_version'])
+
+                # Handle direct chat opened - show it over the lobby
+                elif 'direct_peer' in json_data:
+                    self.window.withdraw()
+                    self.direct_chat_window = ChatWindow(self.username, self.client, None, [], self,
+                                                         json_data.get('message_history', []),
+                                                         direct_peer=json_data['direct_peer'])
+
                 # Handle group creation/join
-                if 'group_name' in json_data:
+                elif 'group_name' in json_data:
                     group_name = json_data['group_name']
                     members = json_data.get('members', [])
 
-                    # Clear pending private chat flag
-                    self.pending_private_chat = None
-
                     # Open chat window for this group
                     self.window.withdraw()  # Hide lobby
-                    self.chat_window = ChatWindow(self.username, self.client, group_name, members, self)
+                    self.chat_window = ChatWindow(self.username, self.client, group_name, members, self,
+                                                  member_version=json_data.get('member_version'))
                     # Don't call run() - Toplevel windows don't need mainloop()
 
                 # Handle users list
@@ -538,17 +936,15 @@ class LobbyWindow:
 
             elif status == 'error':
                 message = json_data.get('message', 'Unknown error')
+                messagebox.showerror("Error", message)
 
-                # Check if this is a failed private chat creation (group already exists)
-                if self.pending_private_chat and 'already exists' in message:
-                    print(f"→ Group already exists, joining instead: {self.pending_private_chat}")
-                    # Try to join the existing group
-                    self.client.join_group(self.pending_private_chat)
-                    # Don't clear pending_private_chat yet, wait for join response
-                else:
-                    # Clear pending flag and show error
-                    self.pending_private_chat = None
-                    messagebox.showerror("Error", message)
+        # Online users came or went
+        elif json_data.get('type') == 'users_delta':
+            users = self.client.apply_users_delta(self.users, self.users_version, json_data)
+            if users is None:
+                self.client.subscribe_presence()
+            elif users is not self.users:
+                self._update_users_list(users, json_data['users_version'])
 
     def show(self):
         """Show the lobby window again"""
@@ -556,8 +952,8 @@ class LobbyWindow:
         self.client.message_handler = self._handle_message
         self.window.deiconify()
 
-        # Refresh users list
-        self.client.get_users()
+        # Deltas that arrived while a chat window was active went unhandled; resync
+        self.client.subscribe_presence()
 
     def _on_close(self):
         """Handle window close"""
@@ -571,15 +967,16 @@ class LobbyWindow:
 class GeneralChatWindow:
     """Main chat window for General group (uses Tk as main window)"""
 
-    def __init__(self, username, client, group_name, members, message_history=None):
+    def __init__(self, username, client, group_name, members, message_history=None, member_version=None):
         self.username = username
         self.client = client
         self.group_name = group_name
         self.is_active = True
-        self.refresh_job = None
         self.other_chat_window = None  # Track other group chat windows
         self.message_history = message_history or []  # Store initial message history
-        self.pending_private_chat = None  # Store pending private chat group name
+        self.direct_chat_window = None  # Open direct-message conversation, if any
+        self.members = []
+        self.member_version = None  # Version of self.members, advanced by members_delta
 
         # Create main window (Tk instead of Toplevel)
         self.window = tk.Tk()
@@ -602,17 +999,14 @@ class GeneralChatWindow:
         self._setup_ui()
 
         # Update members list
-        self._update_members_list(members)
+        self._update_members_list(members, member_version)
 
         # Display initial message history if available
         if self.message_history:
             self._display_message_history(self.message_history)
 
-        # Start auto-refresh
-        self._auto_refresh_members()
-
-        # Start message processing
-        self.window.after(100, self._process_messages)
+        # Received messages are delivered to the active window's handler as they arrive
+        self.client.attach_ui(self.window)
 
         # Handle window close
         self.window.protocol("WM_DELETE_WINDOW", self._on_close)
@@ -751,6 +1145,7 @@ class GeneralChatWindow:
         # Configure username tags
         self.chat_display.tag_config("username_self", justify=tk.RIGHT, foreground="#666666", font=("Segoe UI", 8), spacing1=2)
         self.chat_display.tag_config("username_other", justify=tk.LEFT, foreground="#666666", font=("Segoe UI", 8), spacing1=2)
+        self.display = ChatDisplay(self.chat_display, scrollbar)
 
         # Message input area
         input_frame = tk.Frame(right_panel, bg="#FFFFFF")
@@ -783,6 +1178,17 @@ class GeneralChatWindow:
         )
         send_btn.pack(side=tk.RIGHT, ipady=8)
 
+        # Share file button
+        tk.Button(
+            input_frame,
+            text="📎",
+            font=("Segoe UI", 10),
+            bg="#F0F0F0",
+            relief=tk.FLAT,
+            cursor="hand2",
+            command=self._share_file
+        ).pack(side=tk.RIGHT, ipady=8, padx=(0, 5))
+
     # Copy all other methods from ChatWindow
     def _create_group(self):
         """Show dialog to create a new group"""
@@ -972,25 +1378,24 @@ class GeneralChatWindow:
         message = self.message_entry.get().strip()
         if message:
             # Display own message immediately
-            self.chat_display.config(state=tk.NORMAL)
-            self.chat_display.insert(tk.END, "You\n", "username_self")
-            self.chat_display.insert(tk.END, f"{message}\n", "self")
-            self.chat_display.config(state=tk.DISABLED)
-            self.chat_display.see(tk.END)
+            self.display.append(*self._message_segments(self.username, message, True))
 
             # Send to server
             self.client.send_message(message)
             self.message_entry.delete(0, tk.END)
 
-    def _update_members_list(self, members):
+    def _update_members_list(self, members, member_version=None):
         """Update the members list"""
+        self.members = list(members)
+        if member_version is not None:
+            self.member_version = member_version
         self.members_listbox.delete(0, tk.END)
         for member in members:
             prefix = "👤 " if member != self.username else "👤 (You) "
             self.members_listbox.insert(tk.END, f"{prefix}{member}")
 
     def _on_member_double_click(self, event):
-        """Handle double click on member in the list - Create private chat"""
+        """Handle double click on member in the list - Open direct chat"""
         selection = self.members_listbox.curselection()
         if selection:
             index = selection[0]
@@ -1001,53 +1406,34 @@ class GeneralChatWindow:
 
             # Don't create chat with yourself
             if selected_member == self.username:
-                print(f"✗ Cannot create private chat with yourself")
+                print(f"✗ Cannot open a direct chat with yourself")
                 return
 
             print(f"✓ Double clicked on member: {selected_member}")
 
-            # Create a private group name (sorted to ensure consistency)
-            users = sorted([self.username, selected_member])
-            private_group_name = f"private_{users[0]}_{users[1]}"
-
-            print(f"→ Creating/joining private chat: {private_group_name}")
-
-            # Store pending private chat request
-            self.pending_private_chat = private_group_name
+            print(f"→ Opening direct chat with {selected_member}")
+            self.client.open_direct_chat(selected_member)
 
-            # Try to create the group first
-            self.client.create_group(private_group_name)
-
-    def _auto_refresh_members(self):
-        """Auto-refresh members list every 3 seconds"""
-        if not self.is_active:
-            return
-
-        self.client.get_group_members()
-        self.refresh_job = self.window.after(3000, self._auto_refresh_members)
-
-    def _process_messages(self):
-        """Process messages from queue"""
-        if not self.is_active:
-            return
-
-        try:
-            while True:
-                json_data = self.client.message_queue.get_nowait()
-                # Only process if this window's handler is active
-                if self.client.message_handler == self._handle_message:
-                    self._handle_message(json_data)
-        except queue.Empty:
-            pass
-        finally:
-            if self.client.is_connected and self.is_active:
-                self.window.after(100, self._process_messages)
+    def _apply_members_delta(self, delta):
+        """Apply a members_delta, falling back to a full refresh on a version gap"""
+        members = self.client.apply_members_delta(self.members, self.member_version, delta)
+        if members is None:
+            self.client.get_group_members()
+        elif members is not self.members:
+            self._update_members_list(members, delta['member_version'])
 
     def _handle_message(self, json_data):
         """Handle incoming messages"""
         # Handle group creation/join - open new ChatWindow
         if 'status' in json_data:
             if json_data['status'] == 'success':
+                if 'direct_peer' in json_data:
+                    # Direct chat opened - show it over the General window
+                    self.window.withdraw()
+                    self.direct_chat_window = ChatWindow(self.username, self.client, None, [], self,
+                                                         json_data.get('message_history', []),
+                                                         direct_peer=json_data['direct_peer'])
+                    return
                 if 'group_name' in json_data:
                     group_name = json_data['group_name']
                     # Only open new window if it's not the General group
@@ -1056,9 +1442,6 @@ class GeneralChatWindow:
                         message_history = json_data.get('message_history', [])
                         print(f"[DEBUG] GeneralChatWindow: creating ChatWindow for {group_name} with {len(message_history)} messages")
 
-                        # Clear pending private chat flag
-                        self.pending_private_chat = None
-
                         # Close previous other chat window if exists
                         if self.other_chat_window:
                             try:
@@ -1068,7 +1451,8 @@ class GeneralChatWindow:
                         # Hide General window
                         self.window.withdraw()
                         # Open new chat window for other group with message history
-                        self.other_chat_window = ChatWindow(self.username, self.client, group_name, members, self, message_history)
+                        self.other_chat_window = ChatWindow(self.username, self.client, group_name, members, self, message_history,
+                                                            json_data.get('member_version'))
                         return
                     else:
                         # Client rejoined General group - clear chat display and show history
@@ -1082,21 +1466,14 @@ class GeneralChatWindow:
                             # Update members list
                             members = json_data.get('members', [])
                             if members:
-                                self._update_members_list(members)
+                                self._update_members_list(members, json_data.get('member_version'))
+                        elif 'members' in json_data:
+                            # Full member list (get_group_members or resume)
+                            self._update_members_list(json_data['members'], json_data.get('member_version'))
                         return
             elif json_data['status'] == 'error':
                 message = json_data.get('message', 'Unknown error')
-
-                # Check if this is a failed private chat creation (group already exists)
-                if self.pending_private_chat and 'already exists' in message:
-                    print(f"→ Group already exists, joining instead: {self.pending_private_chat}")
-                    # Try to join the existing group
-                    self.client.join_group(self.pending_private_chat)
-                    # Don't clear pending_private_chat yet, wait for join response
-                else:
-                    # Clear pending flag and show error
-                    self.pending_private_chat = None
-                    self.show_error_message_pop_up(message)
+                self.show_error_message_pop_up(message)
                 return
 
             # Handle members list update
@@ -1105,13 +1482,13 @@ class GeneralChatWindow:
                 self._update_members_list(members)
                 return
 
-        # Handle members update
-        if 'type' in json_data and json_data['type'] == 'members_update':
-            message_group = json_data.get('group_name', None)
+        # Handle members delta (aggregated join/leave presence)
+        if 'type' in json_data and json_data['type'] == 'members_delta':
             # Only update if it's for this group
-            if message_group == self.group_name:
-                members = json_data.get('members', [])
-                self._update_members_list(members)
+            if json_data.get('group_name') == self.group_name:
+                self._apply_members_delta(json_data)
+                if json_data.get('message'):
+                    self.display.append(f"{json_data['message']}\n", "system")
             return
 
         # Handle chat messages
@@ -1125,20 +1502,22 @@ class GeneralChatWindow:
             if msg_type == 'message' and message_group != self.group_name:
                 return  # Ignore messages from other groups
 
-            self.chat_display.config(state=tk.NORMAL)
-
-            if msg_type == 'system':
-                self.chat_display.insert(tk.END, f"{message}\n", "system")
+            if msg_type == 'direct_message':
+                self.display.append(f"📩 New direct message from {username} (double-click their name to reply)\n", "system")
+            elif msg_type == 'attachment':
+                if message_group == self.group_name:
+                    add_attachment_line(self.window, self.display, self.client, json_data)
+            elif msg_type == 'system':
+                self.display.append(f"{message}\n", "system")
             elif msg_type == 'message':
                 # Only show messages from others (sender already displayed their own)
                 if username != self.username:
-                    # Show username label
-                    self.chat_display.insert(tk.END, f"{username}\n", "username_other")
-                    # Show message
-                    self.chat_display.insert(tk.END, f"{message}\n", "other")
+                    self.display.append(*self._message_segments(username, message, False))
 
-            self.chat_display.config(state=tk.DISABLED)
-            self.chat_display.see(tk.END)
+    def _share_file(self):
+        path = filedialog.askopenfilename(parent=self.window, title="Share a file")
+        if path:
+            self.client.share_file(path)
 
     def show(self):
         """Show the window again"""
@@ -1148,47 +1527,41 @@ class GeneralChatWindow:
         # Clear chat display when returning to General group
         self._clear_chat_display()
 
-        self.client.get_group_members()
+        # Deltas for General went unhandled while hidden; only a changed list is sent back
+        self.client.get_group_members(self.member_version)
 
     def _clear_chat_display(self):
         """Clear all messages from chat display"""
-        self.chat_display.config(state=tk.NORMAL)
-        self.chat_display.delete(1.0, tk.END)
-        self.chat_display.config(state=tk.DISABLED)
+        self.display.clear()
+
+    @staticmethod
+    def _message_segments(username, message, is_own_message):
+        if is_own_message:
+            # Own message - display on right
+            return "You\n", "username_self", f"{message}\n", "self"
+        # Other's message - display on left
+        return f"{username}\n", "username_other", f"{message}\n", "other"
 
     def _display_message_history(self, message_history):
         """Display message history from server"""
         if not message_history:
             return
 
-        self.chat_display.config(state=tk.NORMAL)
-
+        entries = []
         for msg in message_history:
             msg_type = msg.get('type', 'message')
-            username = msg.get('username', 'Unknown')
             message = msg.get('message', '')
-            is_own_message = msg.get('is_own_message', False)
 
             if msg_type == 'system':
-                self.chat_display.insert(tk.END, f"{message}\n", "system")
+                entries.append((f"{message}\n", "system"))
             elif msg_type == 'message':
-                if is_own_message:
-                    # Own message - display on right
-                    self.chat_display.insert(tk.END, "You\n", "username_self")
-                    self.chat_display.insert(tk.END, f"{message}\n", "self")
-                else:
-                    # Other's message - display on left
-                    self.chat_display.insert(tk.END, f"{username}\n", "username_other")
-                    self.chat_display.insert(tk.END, f"{message}\n", "other")
-
-        self.chat_display.config(state=tk.DISABLED)
-        self.chat_display.see(tk.END)
+                entries.append(self._message_segments(msg.get('username', 'Unknown'), message,
+                                                      msg.get('is_own_message', False)))
+        self.display.show(entries)
 
     def _on_close(self):
         """Handle window close"""
         self.is_active = False
-        if self.refresh_job:
-            self.window.after_cancel(self.refresh_job)
         self.client.disconnect()
         self.window.destroy()
 
@@ -1198,15 +1571,18 @@ class GeneralChatWindow:
 
 class ChatWindow:
     """Chat window for other groups (Toplevel)"""
-    def __init__(self, username, client, group_name, members, parent_window, message_history=None):
+    def __init__(self, username, client, group_name, members, parent_window, message_history=None, member_version=None,
+                 direct_peer=None):
         self.username = username
         self.client = client
         self.group_name = group_name
+        self.direct_peer = direct_peer  # Set for a direct-message conversation instead of a group
         self.parent_window = parent_window  # Can be GeneralChatWindow or LobbyWindow
         self.is_active = True  # Flag to track if window is active
-        self.refresh_job = None  # Store refresh job ID
         self.message_history = message_history or []  # Store initial message history
-        self.pending_private_chat = None  # Store pending private chat group name
+        self.direct_chat_window = None  # Open direct-message conversation, if any
+        self.members = []
+        self.member_version = None  # Version of self.members, advanced by members_delta
         print(f"[DEBUG] ChatWindow constructor: received {len(self.message_history)} messages for group {group_name}")
 
         # Create window
@@ -1227,18 +1603,14 @@ class ChatWindow:
         self._create_widgets()
 
         # Initialize members list
-        self._update_users_list(members)
+        if self.direct_peer:
+            members = [self.username, self.direct_peer]
+        self._update_users_list(members, member_version)
 
         # Display initial message history if available (AFTER widgets are created)
         if self.message_history:
             self._display_message_history(self.message_history)
 
-        # Start processing messages
-        self.window.after(100, self._process_messages)
-
-        # Auto refresh group members every 3 seconds
-        self.refresh_job = self.window.after(1000, self._auto_refresh_members)
-
         # Handle window close
         self.window.protocol("WM_DELETE_WINDOW", self._on_close)
 
@@ -1297,7 +1669,7 @@ class ChatWindow:
 
         tk.Label(
             header_frame,
-            text=f"💬 Chat - {self.group_name}",
+            text=f"💬 Direct - {self.direct_peer}" if self.direct_peer else f"💬 Chat - {self.group_name}",
             font=("Segoe UI", 12, "bold"),
             bg="#FFFFFF",
             fg="#333333"
@@ -1348,6 +1720,7 @@ class ChatWindow:
                                      foreground="#666666",
                                      font=("Segoe UI", 8, "bold"),
                                      justify="left")
+        self.display = ChatDisplay(self.chat_display, self.chat_display.vbar)
 
         # Message input area
         input_frame = tk.Frame(right_panel, bg="#FFFFFF", relief=tk.SOLID, bd=1)
@@ -1382,6 +1755,18 @@ class ChatWindow:
             width=10
         ).pack(side=tk.RIGHT, ipady=8)
 
+        # Share file button (group chats only)
+        if self.direct_peer is None:
+            tk.Button(
+                input_inner,
+                text="📎",
+                command=self._share_file,
+                bg="#F0F0F0",
+                font=("Segoe UI", 11),
+                relief=tk.FLAT,
+                cursor="hand2"
+            ).pack(side=tk.RIGHT, ipady=8, padx=(0, 5))
+
         # Add welcome message
         self._add_system_message(f"Welcome {self.username}! You are now connected.")
 
@@ -1394,16 +1779,20 @@ class ChatWindow:
         self._add_chat_message(self.username, message)
 
         # Send to server
-        self.client.send_message(message)
+        if self.direct_peer:
+            self.client.send_direct_message(self.direct_peer, message)
+        else:
+            self.client.send_message(message)
         self.message_entry.delete(0, tk.END)
         self.message_entry.focus_set()
 
     def _back_to_parent(self):
         """Leave group and go back to parent window"""
-        # Stop auto refresh
+        if self.direct_peer:
+            self._close_direct_chat()
+            return
+
         self.is_active = False
-        if self.refresh_job:
-            self.window.after_cancel(self.refresh_job)
 
         # Leave group
         self.client.leave_group()
@@ -1415,48 +1804,47 @@ class ChatWindow:
         self.window.destroy()
         self.parent_window.show()
 
-    def _auto_refresh_members(self):
-        """Auto refresh group members every 3 seconds"""
-        if not self.is_active:
-            return  # Stop refreshing if window is not active
-
-        if self.client.is_connected:
-            self.client.get_group_members()
-            self.refresh_job = self.window.after(3000, self._auto_refresh_members)
-
     def _add_chat_message(self, username, message):
-        self.chat_display.config(state=tk.NORMAL)
+        self.display.append(*self._message_segments(username, message, username == self.username))
 
-        if username == self.username:
+    @staticmethod
+    def _message_segments(username, message, is_own_message):
+        if is_own_message:
             # Own message - right aligned with blue bubble
-            self.chat_display.insert(tk.END, f"{username}\n", "username_self")
-            self.chat_display.insert(tk.END, f"  {message}  \n", "self_bubble")
-            self.chat_display.insert(tk.END, "\n", "self_align")
-        else:
-            # Other's message - left aligned with white bubble
-            self.chat_display.insert(tk.END, f"{username}\n", "username_other")
-            self.chat_display.insert(tk.END, f"  {message}  \n", "other_bubble")
-            self.chat_display.insert(tk.END, "\n", "other_align")
+            return f"{username}\n", "username_self", f"  {message}  \n", "self_bubble", "\n", "self_align"
+        # Other's message - left aligned with white bubble
+        return f"{username}\n", "username_other", f"  {message}  \n", "other_bubble", "\n", "other_align"
 
-        self.chat_display.see(tk.END)
-        self.chat_display.config(state=tk.DISABLED)
+    def _share_file(self):
+        path = filedialog.askopenfilename(parent=self.window, title="Share a file")
+        if path:
+            self.client.share_file(path)
+            self._add_system_message(f"Uploading {os.path.basename(path)}...")
 
     def _add_system_message(self, message):
-        self.chat_display.config(state=tk.NORMAL)
-        self.chat_display.insert(tk.END, f"[SYSTEM] {message}\n", "system")
-        self.chat_display.see(tk.END)
-        self.chat_display.config(state=tk.DISABLED)
+        self.display.append(f"[SYSTEM] {message}\n", "system")
 
-    def _update_users_list(self, members):
+    def _update_users_list(self, members, member_version=None):
         """Update group members list"""
+        self.members = list(members)
+        if member_version is not None:
+            self.member_version = member_version
         self.users_listbox.delete(0, tk.END)
         for member in members:
             username = member if isinstance(member, str) else member.get('username', member)
             display_name = username + (" (You)" if username == self.username else "")
             self.users_listbox.insert(tk.END, display_name)
 
+    def _apply_members_delta(self, delta):
+        """Apply a members_delta, falling back to a full refresh on a version gap"""
+        members = self.client.apply_members_delta(self.members, self.member_version, delta)
+        if members is None:
+            self.client.get_group_members()
+        elif members is not self.members:
+            self._update_users_list(members, delta['member_version'])
+
     def _on_user_double_click_other_group(self, event):
-        """Handle double click on user in the other group list - Create private chat"""
+        """Handle double click on user in the other group list - Open direct chat"""
         selection = self.users_listbox.curselection()
         if selection:
             index = selection[0]
@@ -1467,22 +1855,13 @@ class ChatWindow:
 
             # Don't create chat with yourself
             if selected_user == self.username:
-                print(f"✗ Cannot create private chat with yourself")
+                print(f"✗ Cannot open a direct chat with yourself")
                 return
 
             print(f"✓ Double clicked on user in group '{self.group_name}': {selected_user}")
 
-            # Create a private group name (sorted to ensure consistency)
-            users = sorted([self.username, selected_user])
-            private_group_name = f"private_{users[0]}_{users[1]}"
-
-            print(f"→ Creating/joining private chat: {private_group_name}")
-
-            # Store pending private chat request
-            self.pending_private_chat = private_group_name
-
-            # Try to create the group first
-            self.client.create_group(private_group_name)
+            print(f"→ Opening direct chat with {selected_user}")
+            self.client.open_direct_chat(selected_user)
 
     def _display_message_history(self, message_history):
         """Display message history from server"""
@@ -1491,53 +1870,18 @@ class ChatWindow:
             print("[DEBUG] No message history to display")
             return
 
-        # Clear existing messages first
-        self.chat_display.config(state=tk.NORMAL)
-        self.chat_display.delete(1.0, tk.END)
-
+        # Replaces the messages shown so far; only the newest page is rendered
+        entries = []
         for msg in message_history:
             msg_type = msg.get('type', 'message')
-            username = msg.get('username', 'Unknown')
             message = msg.get('message', '')
-            is_own_message = msg.get('is_own_message', False)
-
-
 
             if msg_type == 'system':
-                # Add system message directly without calling _add_system_message
-                self.chat_display.insert(tk.END, f"[SYSTEM] {message}\n", "system")
-            elif msg_type == 'message':
-                # Add chat message directly based on ownership
-                if is_own_message:
-                    # Own message - right aligned with blue bubble
-                    self.chat_display.insert(tk.END, f"{username}\n", "username_self")
-                    self.chat_display.insert(tk.END, f"  {message}  \n", "self_bubble")
-                    self.chat_display.insert(tk.END, "\n", "self_align")
-                else:
-                    # Other's message - left aligned with white bubble
-                    self.chat_display.insert(tk.END, f"{username}\n", "username_other")
-                    self.chat_display.insert(tk.END, f"  {message}  \n", "other_bubble")
-                    self.chat_display.insert(tk.END, "\n", "other_align")
-
-        self.chat_display.config(state=tk.DISABLED)
-        self.chat_display.see(tk.END)
-
-    def _process_messages(self):
-        """Process messages from queue"""
-        if not self.is_active:
-            return  # Stop processing if window is not active
-
-        try:
-            while True:
-                json_data = self.client.message_queue.get_nowait()
-                # Only process if this window's handler is active
-                if self.client.message_handler == self._handle_message:
-                    self._handle_message(json_data)
-        except queue.Empty:
-            pass
-        finally:
-            if self.client.is_connected and self.is_active:
-                self.window.after(100, self._process_messages)
+                entries.append((f"[SYSTEM] {message}\n", "system"))
+            elif msg_type in ('message', 'direct_message'):
+                entries.append(self._message_segments(msg.get('username', 'Unknown'), message,
+                                                      msg.get('is_own_message', False)))
+        self.display.show(entries)
 
     def _handle_message(self, json_data):
         """Handle incoming JSON messages"""
@@ -1547,39 +1891,44 @@ class ChatWindow:
             message = json_data.get('message', '')
 
             if status == 'success':
+                # Handle direct chat opened
+                if 'direct_peer' in json_data:
+                    if json_data['direct_peer'] == self.direct_peer:
+                        self._display_message_history(json_data.get('message_history', []))
+                    else:
+                        self.window.withdraw()
+                        self.direct_chat_window = ChatWindow(self.username, self.client, None, [], self,
+                                                             json_data.get('message_history', []),
+                                                             direct_peer=json_data['direct_peer'])
                 # Handle group creation/join - switch to new group
-                if 'group_name' in json_data:
+                elif 'group_name' in json_data:
                     group_name = json_data['group_name']
                     # If it's a different group, switch to it
                     if group_name != self.group_name:
                         members = json_data.get('members', [])
                         message_history = json_data.get('message_history', [])
 
-                        # Clear pending private chat flag
-                        self.pending_private_chat = None
-
                         # Leave current group and switch to new one
                         self.client.leave_group()
 
                         # Update this window to show the new group
                         self.group_name = group_name
                         self.window.title(f"Chat - {group_name}")
-                        self._update_users_list(members)
+                        self.member_version = None
+                        self._update_users_list(members, json_data.get('member_version'))
 
                         # Clear and display new message history
-                        self.chat_display.config(state=tk.NORMAL)
-                        self.chat_display.delete(1.0, tk.END)
-                        self.chat_display.config(state=tk.DISABLED)
+                        self.display.clear()
 
                         if message_history:
                             self._display_message_history(message_history)
 
                         self._add_system_message(f"Switched to {group_name}")
                         return
-                    else:
+                    elif not json_data.get('not_modified'):
                         # Same group - just update members
                         members = json_data.get('members', [])
-                        self._update_users_list(members)
+                        self._update_users_list(members, json_data.get('member_version'))
 
                         # Display message history if available (for new joins)
                         message_history = json_data.get('message_history', [])
@@ -1592,33 +1941,34 @@ class ChatWindow:
                 elif message and not message.startswith('Message sent'):
                     self._add_system_message(message)
             elif status == 'error':
-                # Check if this is a failed private chat creation (group already exists)
-                if self.pending_private_chat and 'already exists' in message:
-                    print(f"→ Group already exists, joining instead: {self.pending_private_chat}")
-                    # Try to join the existing group
-                    self.client.join_group(self.pending_private_chat)
-                    # Don't clear pending_private_chat yet, wait for join response
-                else:
-                    # Clear pending flag and show error
-                    self.pending_private_chat = None
-                    self._add_system_message(f"Error: {message}")
+                self._add_system_message(f"Error: {message}")
 
         # Handle broadcast messages
         elif 'type' in json_data:
             msg_type = json_data['type']
             message_group = json_data.get('group_name', None)
 
-            # Handle members update
-            if msg_type == 'members_update':
+            # Handle members delta (aggregated join/leave presence)
+            if msg_type == 'members_delta':
                 # Only update if it's for this group
                 if message_group == self.group_name:
-                    members = json_data.get('members', [])
-                    self._update_users_list(members)
+                    self._apply_members_delta(json_data)
+                    if json_data.get('message'):
+                        self._add_system_message(json_data['message'])
                 return
 
             message = json_data.get('message', '')
             username = json_data.get('username', 'Unknown')
 
+            # Handle direct messages
+            if msg_type == 'direct_message':
+                if json_data.get('direct_peer') == self.direct_peer:
+                    if username != self.username:
+                        self._add_chat_message(username, message)
+                else:
+                    self._add_system_message(f"📩 New direct message from {username} (double-click their name to reply)")
+                return
+
             # Filter: Only show messages from this group
             if msg_type == 'message' and message_group != self.group_name:
                 return  # Ignore messages from other groups
@@ -1627,6 +1977,9 @@ class ChatWindow:
                 # Only display messages from others (sender already displayed their own)
                 if username != self.username:
                     self._add_chat_message(username, message)
+            elif msg_type == 'attachment':
+                if message_group == self.group_name:
+                    add_attachment_line(self.window, self.display, self.client, json_data)
             elif msg_type == 'system':
                 self._add_system_message(message)
 
@@ -1635,12 +1988,20 @@ class ChatWindow:
             error_msg = json_data.get('error', 'Unknown error')
             self._add_system_message(f"Error: {error_msg}")
 
+    def _close_direct_chat(self):
+        """Close a direct conversation; the group membership is untouched"""
+        self.is_active = False
+        self.client.message_handler = self.parent_window._handle_message
+        self.window.destroy()
+        self.parent_window.window.deiconify()
+
     def _on_close(self):
         """Handle window close"""
-        # Stop auto refresh
+        if self.direct_peer:
+            self._close_direct_chat()
+            return
+
         self.is_active = False
-        if self.refresh_job:
-            self.window.after_cancel(self.refresh_job)
 
         # Leave group
         self.client.leave_group()
@@ -1673,11 +2034,11 @@ def main():
 
         # Wait for join_chat response with General group info
         try:
-            response = client.message_queue.get(timeout=5)
+            response = client.next_message(timeout=5)
 
-            # Skip system messages and members_update, get the actual join response
-            while response.get('type') in ['system', 'members_update']:
-                response = client.message_queue.get(timeout=5)
+            # Skip system messages and members_delta, get the actual join response
+            while response.get('type') in ['system', 'members_delta']:
+                response = client.next_message(timeout=5)
 
             if response.get('status') == 'success' and 'group_name' in response:
                 group_name = response['group_name']
@@ -1685,7 +2046,8 @@ def main():
                 message_history = response.get('message_history', [])
 
                 # Create main window (Tk) as ChatWindow for General group
-                main_window = GeneralChatWindow(username, client, group_name, members, message_history)
+                main_window = GeneralChatWindow(username, client, group_name, members, message_history,
+                                                response.get('member_version'))
                 main_window.run()
             else:
                 messagebox.showerror("Error", "Failed to join General group")
@@ -0,0 +1,97 @@
+import os
+import sys
+import tkinter as tk
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class FakeRoot:
+    """Stands in for a Tk root: records bindings, idle callbacks and generated events"""
+
+    def __init__(self):
+        self.bindings = {}
+        self.idle = []
+        self.generated = []
+        self.running = True  # event_generate fails like Tk's before mainloop starts or after destroy
+
+    def bind(self, sequence, callback):
+        self.bindings[sequence] = callback
+
+    def after_idle(self, callback):
+        self.idle.append(callback)
+
+    def event_generate(self, sequence, when=None):
+        if not self.running:
+            raise tk.TclError('application has been destroyed')
+        self.generated.append(sequence)
+
+    def run_idle(self):
+        idle, self.idle = self.idle, []
+        for callback in idle:
+            callback()
+
+    def deliver(self):
+        """Handle the generated events, as the main loop would"""
+        generated, self.generated = self.generated, []
+        for sequence in generated:
+            self.bindings[sequence](None)
+
+
+@pytest.fixture
+def root():
+    return FakeRoot()
+
+
+class FakeText:
+    """Stands in for a Text widget: its content as a string, indexes 1.0, "<line>.0" and END"""
+
+    def __init__(self):
+        self.content = ''
+        self.options = {}
+        self.idle = []
+        self.inserts = 0
+        self.top_line = None  # Last yview() target
+
+    def config(self, **options):
+        self.options.update(options)
+
+    def insert(self, index, *parts):
+        text = ''.join(parts[0::2])
+        self.inserts += 1
+        self.content = self.content + text if index == tk.END else text + self.content
+
+    def delete(self, start, end):
+        if end == tk.END:
+            self.content = ''
+        else:
+            lines = int(str(end).split('.')[0]) - 1
+            self.content = self.content.split('\n', lines)[-1]
+
+    def lines(self):
+        return self.content.splitlines()
+
+    def see(self, index):
+        pass
+
+    def yview(self, index):
+        self.top_line = index
+
+    def after_idle(self, callback):
+        self.idle.append(callback)
+
+
+class FakeScrollbar:
+    def set(self, first, last):
+        self.position = (first, last)
+
+
+@pytest.fixture
+def text():
+    return FakeText()
+
+
+@pytest.fixture
+def scrollbar():
+    return FakeScrollbar()
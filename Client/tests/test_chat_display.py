@@ -0,0 +1,55 @@
+import pytest
+
+from chat_app import ChatDisplay
+
+
+@pytest.fixture
+def display(text, scrollbar, monkeypatch):
+    monkeypatch.setattr(ChatDisplay, 'MAX_RENDERED', 5)
+    monkeypatch.setattr(ChatDisplay, 'PAGE_SIZE', 3)
+    monkeypatch.setattr(ChatDisplay, 'MAX_ENTRIES', 12)
+    return ChatDisplay(text, scrollbar)
+
+
+def entry(n):
+    return f"user{n}\n", 'username_other', f"message {n}\n", 'other'
+
+
+def test_widget_keeps_only_the_newest_entries(display, text):
+    for n in range(8):
+        display.append(*entry(n))
+
+    assert len(display.entries) == 8 and display.rendered == 5
+    assert text.lines()[0] == 'user3' and text.lines()[-1] == 'message 7'
+
+
+def test_show_renders_one_page_in_one_insert(display, text):
+    display.show([entry(n) for n in range(10)])
+
+    assert text.inserts == 1 and display.rendered == 3
+    assert text.lines() == ['user7', 'message 7', 'user8', 'message 8', 'user9', 'message 9']
+
+
+def test_scrolling_to_the_top_renders_the_previous_page(display, text, scrollbar):
+    display.show([entry(n) for n in range(10)])
+    display._on_scroll('0.0', '0.6')
+    display._on_scroll('0.0', '0.6')  # One page per idle callback, however many scroll events
+    assert scrollbar.position == ('0.0', '0.6') and len(text.idle) == 1
+
+    text.idle.pop()()
+    assert display.rendered == 6 and text.lines()[0] == 'user4'
+    assert text.top_line == '7.0'  # The line that was on top stays in view
+
+
+def test_nothing_more_to_load_at_the_oldest_entry(display, text):
+    display.show([entry(n) for n in range(2)])
+    display._on_scroll('0.0', '1.0')
+    assert text.idle == []
+
+
+def test_scroll_back_is_bounded(display):
+    for n in range(16):
+        display.append(*entry(n))
+    assert len(display.entries) == 13  # Oldest page dropped once MAX_ENTRIES + PAGE_SIZE is passed
+    display.clear()
+    assert display.entries == [] and display.rendered == 0
@@ -0,0 +1,34 @@
+import hashlib
+import json
+import socket
+import threading
+
+import chat_app
+from chat_app import ChatClient
+
+
+def test_share_file_hashes_off_the_calling_thread(tmp_path, monkeypatch):
+    path = tmp_path / 'report.bin'
+    data = bytes(range(256)) * 4000
+    path.write_bytes(data)
+    digest = hashlib.sha256(data).hexdigest()
+    hashing_threads = []
+    real_sha256 = hashlib.sha256
+
+    def sha256():
+        hashing_threads.append(threading.current_thread())
+        return real_sha256()
+    monkeypatch.setattr(chat_app.hashlib, 'sha256', sha256)
+
+    client = ChatClient()
+    client.socket, server = socket.socketpair()
+    client.share_file(str(path))
+
+    server.settimeout(5)
+    request = json.loads(server.recv(4096))
+    assert request == {'method': 'begin_upload',
+                       'params': {'sha256': digest, 'size': len(data), 'file_name': 'report.bin'}}
+    assert client.pending_files == {digest: str(path)}
+    assert hashing_threads and threading.current_thread() not in hashing_threads
+    server.close()
+    client.socket.close()
@@ -0,0 +1,81 @@
+import json
+import socket
+import threading
+
+from chat_app import ChatClient
+
+
+def test_messages_received_before_the_window_are_dispatched_once_attached(root):
+    client = ChatClient()
+    client.message_queue.put([{'n': 1}, {'n': 2}])
+    handled = []
+    client.message_handler = handled.append
+
+    client.attach_ui(root)
+    assert handled == []
+    root.run_idle()
+    assert handled == [{'n': 1}, {'n': 2}]
+
+
+def test_one_wakeup_covers_every_batch_until_handled(root):
+    client = ChatClient()
+    handled = []
+    client.message_handler = handled.append
+    client.attach_ui(root)
+
+    for n in range(3):
+        client.message_queue.put([{'n': n}])
+        client._wake_ui()
+    assert root.generated == [ChatClient.WAKEUP_EVENT]
+
+    root.deliver()
+    assert handled == [{'n': 0}, {'n': 1}, {'n': 2}]
+    client.message_queue.put([{'n': 3}])
+    client._wake_ui()
+    assert root.generated == [ChatClient.WAKEUP_EVENT]
+
+
+def test_wakeup_without_a_running_main_loop_is_retried(root):
+    client = ChatClient()
+    client.attach_ui(root)
+    root.running = False
+    client._wake_ui()
+    assert not client.wakeup_pending
+
+    root.running = True
+    client._wake_ui()
+    assert root.generated == [ChatClient.WAKEUP_EVENT]
+
+
+def test_failing_handler_does_not_stop_dispatch(root):
+    client = ChatClient()
+    handled = []
+
+    def handler(message):
+        if message['n'] == 0:
+            raise ValueError('bad message')
+        handled.append(message)
+    client.message_handler = handler
+    client.message_queue.put([{'n': 0}, {'n': 1}])
+    client.dispatch_messages()
+    assert handled == [{'n': 1}]
+
+
+def test_reader_thread_queues_each_chunk_as_one_batch(root):
+    client = ChatClient()
+    client.socket, server = socket.socketpair()
+    client.is_connected = True
+    client.attach_ui(root)
+    reader = threading.Thread(target=client.listen_for_messages)
+    reader.start()
+
+    server.sendall(json.dumps({'type': 'message', 'group_name': 'General', 'seq': 7}).encode() + b'{"type": "sys')
+    assert client.message_queue.get(timeout=5) == [{'type': 'message', 'group_name': 'General', 'seq': 7}]
+    server.sendall(b'tem"}')
+    assert client.message_queue.get(timeout=5) == [{'type': 'system'}]
+    assert client.last_seen == {'General': 7} and root.generated == [ChatClient.WAKEUP_EVENT]
+
+    client.is_connected = False
+    server.close()
+    reader.join(timeout=5)
+    client.socket.close()
@@ -0,0 +1,40 @@
+import json
+
+from chat_app import JsonStreamParser
+
+
+def feed_in_chunks(data, size):
+    parser = JsonStreamParser()
+    messages = []
+    for start in range(0, len(data), size):
+        messages.extend(parser.feed(data[start:start + size]))
+    return messages
+
+
+def test_concatenated_messages_are_split():
+    parser = JsonStreamParser()
+    assert parser.feed(b'{"a": 1}{"b": [2, {"c": 3}]}\n{"d"') == [{'a': 1}, {'b': [2, {'c': 3}]}]
+    assert parser.feed(b': 4}') == [{'d': 4}]
+
+
+def test_any_split_gives_the_same_messages():
+    messages = [{'text': 'braces } { and "quotes" and \\ backslash'}, {'text': 'héllo ✓'}, {'n': list(range(5))}]
+    data = b''.join(json.dumps(message, ensure_ascii=False).encode('utf-8') for message in messages)
+    for size in (1, 2, 3, 7, len(data)):
+        assert feed_in_chunks(data, size) == messages
+
+
+def test_malformed_message_is_skipped():
+    parser = JsonStreamParser()
+    assert parser.feed(b'{"a": tru}{"b": true}') == [{'b': True}]
+
+
+def test_large_message_in_many_chunks_is_scanned_once():
+    data = json.dumps({'history': [{'message': 'x' * 100, 'seq': seq} for seq in range(2000)]}).encode('utf-8')
+    chunks = [data[start:start + 1000] for start in range(0, len(data), 1000)]
+    parser = JsonStreamParser()
+    for chunk in chunks[:-1]:
+        assert parser.feed(chunk) == []
+        assert parser.cursor == len(parser.buffer)  # Nothing left to rescan on the next chunk
+    message, = parser.feed(chunks[-1])
+    assert len(message['history']) == 2000 and parser.buffer == bytearray()
@@ -0,0 +1,197 @@
+import hmac
+import time
+import heapq
+import itertools
+import logging
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from constants import ChatServerConfig
+from session import Session
+
+
+class AdminApi:
+    """Introspection methods for operators: admin_summary, admin_connections, admin_groups,
+    admin_flight_recorder.
+
+    Enabled only when a token is configured; every call passes it as
+    ``params['token']``. The figures come from counters RpcServer and
+    ChatServer keep as they go, so a call costs a pass over the page it
+    returns, plus one pass over the groups for the top-N rankings.
+    """
+
+    # sort parameter of admin_connections -> key, largest first
+    CONNECTION_ORDER: Dict[str, Callable[[Session, float], float]] = {
+        'rate': lambda session, now: session.request_rate.value(now),
+        'queued': lambda session, now: session.out_bytes,
+        'bytes_out': lambda session, now: session.bytes_out,
+        'bytes_in': lambda session, now: session.bytes_in,
+        'idle': lambda session, now: now - session.last_active
+    }
+
+    def __init__(self, chat_server, rpc_server, token: str):
+        self.chat_server = chat_server
+        self.rpc_server = rpc_server
+        self.token = token
+        self.started_at = time.time()
+        self.logger = logging.getLogger(f"{self.__class__.__name__}")
+        rpc_server.register_handler('admin_summary', self._guarded(self._handle_summary))
+        rpc_server.register_handler('admin_connections', self._guarded(self._handle_connections))
+        rpc_server.register_handler('admin_groups', self._guarded(self._handle_groups))
+        rpc_server.register_handler('admin_flight_recorder', self._guarded(self._handle_flight_recorder))
+
+    def _guarded(self, handler: Callable) -> Callable:
+        def check_token(params: Dict[str, Any], session: Session) -> Dict[str, Any]:
+            token = params.get('token')
+            if not isinstance(token, str) or not hmac.compare_digest(token.encode('utf-8'), self.token.encode('utf-8')):
+                self.logger.warning(f"Rejected admin request from {session.address}")
+                return {
+                    'status': 'error',
+                    'message': 'Not authorized'
+                }
+            return handler(params, session)
+        return check_token
+
+    def _handle_summary(self, params: Dict[str, Any], session: Session) -> Dict[str, Any]:
+        chat = self.chat_server
+        clients = self.rpc_server.clients
+        streams = sum(1 for client in clients.values() if client.stream is not None)
+        summary = {
+            'uptime': time.time() - self.started_at,
+            'connections': len(clients),
+            'stream_connections': streams,
+            'users': len(chat.user_sessions),
+            'detached_sessions': len(chat.detached_sessions),
+            'presence_subscribers': len(chat.presence_subscribers),
+            'groups': len(chat.groups),
+            'fanout': chat.fanout.stats()
+        }
+        if chat.cluster is not None:
+            summary['cluster'] = {
+                'node_id': chat.cluster.node_id,
+                'links': sorted(chat.cluster.links),
+                'remote_users': len(chat.remote_users),
+                'frames_forwarded': chat.cluster.frames_forwarded
+            }
+        return {
+            'status': 'success',
+            'summary': summary
+        }
+
+    def _handle_connections(self, params: Dict[str, Any], session: Session) -> Dict[str, Any]:
+        """A page of the connection table, in session id order or largest first by sort"""
+        page = self._parse_page(params)
+        if page is None:
+            return {
+                'status': 'error',
+                'message': 'offset and limit must be integers'
+            }
+        offset, limit = page
+
+        sort = params.get('sort', 'id')
+        if sort != 'id' and sort not in self.CONNECTION_ORDER:
+            return {
+                'status': 'error',
+                'message': f"sort must be one of: id, {', '.join(self.CONNECTION_ORDER)}"
+            }
+
+        now = time.time()
+        clients = self.rpc_server.clients
+        if sort == 'id':
+            selected = list(itertools.islice(clients.values(), offset, offset + limit))
+        else:
+            order = self.CONNECTION_ORDER[sort]
+            selected = heapq.nlargest(offset + limit, clients.values(), key=lambda client: order(client, now))[offset:]
+
+        connections = [self._describe_connection(client, now) for client in selected]
+        return {
+            'status': 'success',
+            'connections': connections,
+            'count': len(connections),
+            'total': len(clients),
+            'offset': offset,
+            'limit': limit,
+            'sort': sort
+        }
+
+    def _describe_connection(self, client: Session, now: float) -> Dict[str, Any]:
+        queued_frames = len(client.sending) if client.sending else 0
+        if client.outbox is not None:
+            queued_frames += len(client.outbox[0]) + len(client.outbox[1])
+        return {
+            'id': client.id,
+            'address': f"{client.address[0]}:{client.address[1]}",
+            'kind': 'chat' if client.stream is None else type(client.stream).__name__,
+            'username': client.username,
+            'group_name': client.group_name,
+            'bytes_in': client.bytes_in,
+            'bytes_out': client.bytes_out,
+            'queued_bytes': client.out_bytes,
+            'queued_frames': queued_frames,
+            'requests': client.requests,
+            'requests_per_sec': round(client.request_rate.value(now), 3),
+            'connected_at': client.connected_at,
+            'last_active': client.last_active
+        }
+
+    def _handle_groups(self, params: Dict[str, Any], session: Session) -> Dict[str, Any]:
+        """The busiest groups by message rate and the groups holding the most history"""
+        try:
+            top = int(params.get('top', ChatServerConfig.ADMIN_DEFAULT_TOP))
+        except (TypeError, ValueError):
+            return {
+                'status': 'error',
+                'message': 'top must be an integer'
+            }
+        top = max(1, min(top, ChatServerConfig.ADMIN_MAX_LIMIT))
+
+        now = time.time()
+        chat = self.chat_server
+        groups = chat.groups.items()
+        busiest = heapq.nlargest(top, groups, key=lambda item: item[1]['message_rate'].value(now))
+        largest = heapq.nlargest(top, groups, key=lambda item: self._history_length(*item))
+        return {
+            'status': 'success',
+            'busiest': [{
+                'name': group_name,
+                'messages_per_sec': round(group['message_rate'].value(now), 3),
+                'members': len(group['members']) + len(group['remote_members'])
+            } for group_name, group in busiest],
+            'largest_histories': [{
+                'name': group_name,
+                'messages': self._history_length(group_name, group)
+            } for group_name, group in largest],
+            'total': len(chat.groups)
+        }
+
+    def _handle_flight_recorder(self, params: Dict[str, Any], session: Session) -> Dict[str, Any]:
+        """The newest flight recorder events, also written to a dump file when dump is true"""
+        try:
+            limit = int(params.get('limit', ChatServerConfig.ADMIN_DEFAULT_LIMIT))
+        except (TypeError, ValueError):
+            return {
+                'status': 'error',
+                'message': 'limit must be an integer'
+            }
+        recorder = self.rpc_server.recorder
+        response = {
+            'status': 'success',
+            'events': recorder.recent(max(1, min(limit, recorder.size))),
+            'recorded': recorder.recorded
+        }
+        if params.get('dump'):
+            response['dump_path'] = recorder.dump('request')
+        return response
+
+    def _history_length(self, group_name: str, group: Dict[str, Any]) -> int:
+        # Restored history not loaded yet still counts
+        pending = self.chat_server.pending_restore.get(group_name)
+        return len(pending) if pending is not None else len(group['message_history'])
+
+    @staticmethod
+    def _parse_page(params: Dict[str, Any]) -> Optional[Tuple[int, int]]:
+        try:
+            offset = max(0, int(params.get('offset', 0)))
+            limit = int(params.get('limit', ChatServerConfig.ADMIN_DEFAULT_LIMIT))
+        except (TypeError, ValueError):
+            return None
+        return offset, max(1, min(limit, ChatServerConfig.ADMIN_MAX_LIMIT))
@@ -0,0 +1,195 @@
+import os
+import re
+import hashlib
+import logging
+import secrets
+from typing import Callable, Dict, List, Optional
+
+from constants import ChatServerConfig
+from session import Session
+
+SHA256_HEX = re.compile(r'[0-9a-f]{64}$')
+HAS_SENDFILE = hasattr(os, 'sendfile')  # Not on Windows: downloads fall back to read + send
+O_BINARY = getattr(os, 'O_BINARY', 0)  # Windows opens files in text mode otherwise
+
+
+class PendingUpload:
+    """A declared upload; survives transfer-connection drops so it can be resumed"""
+    __slots__ = ('upload_id', 'sha256', 'file_name', 'size', 'username', 'group_name',
+                 'received', 'hasher', 'active')
+
+    def __init__(self, upload_id: str, sha256: str, file_name: str, size: int, username: str, group_name: str):
+        self.upload_id = upload_id
+        self.sha256 = sha256
+        self.file_name = file_name
+        self.size = size
+        self.username = username
+        self.group_name = group_name
+        self.received = 0
+        self.hasher = hashlib.sha256()  # Running hash of the bytes received so far
+        self.active = False  # A transfer connection is writing to it
+
+
+class UploadStream:
+    """Receives raw bytes for a PendingUpload straight from the socket into the part file"""
+
+    def __init__(self, store: 'AttachmentStore', session: Session, upload: PendingUpload):
+        self.store = store
+        self.session = session
+        self.upload = upload
+        self.fd = os.open(store.part_path(upload), os.O_WRONLY | os.O_CREAT | O_BINARY, 0o644)
+        os.ftruncate(self.fd, upload.received)
+        os.lseek(self.fd, upload.received, os.SEEK_SET)
+        upload.active = True
+
+    def on_readable(self) -> None:
+        upload = self.upload
+        view = self.store.recv_view[:min(len(self.store.recv_view), upload.size - upload.received)]
+        try:
+            count = self.session.socket.recv_into(view)
+        except BlockingIOError:
+            return
+        except OSError:
+            count = 0
+        if count == 0:
+            self.store.rpc_server.close_later(self.session)  # Resumable from upload.received
+            return
+
+        os.write(self.fd, view[:count])
+        upload.hasher.update(view[:count])
+        upload.received += count
+        if upload.received == upload.size:
+            self.store.finish_upload(upload, self.session)
+
+    def on_writable(self) -> None:
+        pass
+
+    def close(self) -> None:
+        os.close(self.fd)
+        self.upload.active = False
+
+
+class DownloadStream:
+    """Sends a stored attachment with os.sendfile where available, a slice per writable event"""
+
+    def __init__(self, store: 'AttachmentStore', session: Session, path: str, offset: int):
+        self.store = store
+        self.session = session
+        self.fd = os.open(path, os.O_RDONLY | O_BINARY)
+        self.size = os.fstat(self.fd).st_size
+        self.offset = min(offset, self.size)
+        self.header = memoryview(f"OK {self.size}\n".encode('ascii'))
+        store.rpc_server.set_write_interest(session, True)
+
+    def on_readable(self) -> None:
+        try:
+            if self.session.socket.recv(1) == b'':
+                self.store.rpc_server.close_later(self.session)
+        except BlockingIOError:
+            pass
+        except OSError:
+            self.store.rpc_server.close_later(self.session)
+
+    def on_writable(self) -> None:
+        sock = self.session.socket
+        try:
+            if self.header:
+                self.header = self.header[sock.send(self.header):]
+                if self.header:
+                    return
+            if self.offset < self.size:
+                count = min(ChatServerConfig.ATTACHMENT_CHUNK_SIZE, self.size - self.offset)
+                if HAS_SENDFILE:
+                    self.offset += os.sendfile(sock.fileno(), self.fd, self.offset, count)
+                else:
+                    os.lseek(self.fd, self.offset, os.SEEK_SET)
+                    self.offset += sock.send(os.read(self.fd, count))
+        except BlockingIOError:
+            return
+        except OSError:
+            self.store.rpc_server.close_later(self.session)
+            return
+
+        if self.offset >= self.size:
+            self.store.rpc_server.set_write_interest(self.session, False)
+            self.store.rpc_server.close_later(self.session)
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+class AttachmentStore:
+    """Content-addressed attachment files plus the uploads in progress.
+
+    Files live under ``directory`` named by their SHA-256. Bytes move over a
+    separate transfer connection that opens with one header line, so nothing
+    large passes through JSON, base64 or the RPC buffers:
+
+        UPLOAD <upload_id> <offset>\\n<raw bytes...>
+        DOWNLOAD <attachment_id> <offset>\\n   ->   OK <size>\\n<raw bytes...>
+    """
+
+    def __init__(self, rpc_server, directory: str, on_complete: Callable[[PendingUpload], None]):
+        self.rpc_server = rpc_server
+        self.directory = directory
+        self.on_complete = on_complete
+        self.uploads: Dict[str, PendingUpload] = {}  # upload_id -> upload
+        self.recv_view = memoryview(bytearray(ChatServerConfig.ATTACHMENT_CHUNK_SIZE))  # Shared; the loop is single-threaded
+        self.logger = logging.getLogger(f"{self.__class__.__name__}")
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, sha256: str) -> str:
+        return os.path.join(self.directory, sha256)
+
+    def part_path(self, upload: PendingUpload) -> str:
+        """Each upload writes its own part file, even when several users upload the same content at once"""
+        return os.path.join(self.directory, f"{upload.sha256}.{upload.upload_id}.part")
+
+    def has(self, sha256: str) -> bool:
+        return bool(SHA256_HEX.match(sha256)) and os.path.exists(self.path(sha256))
+
+    def begin_upload(self, sha256: str, file_name: str, size: int, username: str, group_name: str) -> PendingUpload:
+        """Declare an upload, or return the unfinished one for the same file and user so it resumes"""
+        for upload in self.uploads.values():
+            if upload.sha256 == sha256 and upload.username == username:
+                upload.file_name, upload.group_name = file_name, group_name
+                return upload
+
+        upload = PendingUpload(secrets.token_urlsafe(12), sha256, file_name, size, username, group_name)
+        self.uploads[upload.upload_id] = upload
+        return upload
+
+    def cancel_uploads(self, username: str) -> None:
+        for upload_id, upload in list(self.uploads.items()):
+            if upload.username == username and not upload.active:
+                del self.uploads[upload_id]
+                try:
+                    os.remove(self.part_path(upload))
+                except OSError:
+                    pass
+
+    def finish_upload(self, upload: PendingUpload, session: Session) -> None:
+        del self.uploads[upload.upload_id]
+        self.rpc_server.close_later(session)
+        if upload.hasher.hexdigest() != upload.sha256:
+            self.logger.warning(f"Upload {upload.upload_id} from {upload.username} does not match its SHA-256, discarded")
+            os.remove(self.part_path(upload))
+            return
+        # Verified, so an identical file stored meanwhile by a concurrent upload is simply replaced
+        os.replace(self.part_path(upload), self.path(upload.sha256))
+        self.logger.info(f"Stored attachment {upload.sha256} ({upload.size} bytes) from {upload.username}")
+        self.on_complete(upload)
+
+    def open_upload(self, session: Session, args: List[str]) -> Optional[UploadStream]:
+        """Stream handler for ``UPLOAD <upload_id> <offset>``"""
+        upload = self.uploads.get(args[0]) if len(args) == 2 else None
+        if upload is None or upload.active or args[1] != str(upload.received):
+            # The client must continue exactly where the server stopped (see begin_upload's offset)
+            return None
+        return UploadStream(self, session, upload)
+
+    def open_download(self, session: Session, args: List[str]) -> Optional[DownloadStream]:
+        """Stream handler for ``DOWNLOAD <attachment_id> <offset>``"""
+        if len(args) != 2 or not self.has(args[0]) or not args[1].isdigit():
+            return None
+        return DownloadStream(self, session, self.path(args[0]), int(args[1]))
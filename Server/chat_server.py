@@ -1,57 +1,266 @@
-import socket
+import os
+import sys
+import gc
+import json
 import logging
+import bisect
+import itertools
+import secrets
+import socket
 import time
-from typing import Tuple, Dict, Any, List
+from collections import OrderedDict
+from typing import Tuple, Dict, Any, List, Optional, Iterator, Set, Union
 from rpc_server import RpcServer
-from constants import ChatServerConfig, Messages, ValidationRules
+from session import Session
+from search_index import MessageSearchIndex
+from snapshot import SnapshotStore, Record
+from fanout import FanoutScheduler
+from timers import Timer
+from rate_meter import RateMeter
+import handoff
+from attachments import AttachmentStore, PendingUpload, SHA256_HEX
+from direct_messages import DirectMessageStore, DirectChannel, DirectRecord
+from constants import ChatServerConfig, ErrorCodes, Messages, ValidationRules, Lane
 
 
 class ChatServer:
     GENERAL_GROUP = "General"  # Default group name
+    PRESENCE_FANOUT_KEY = " users"  # Fan-out queue for users_delta; group names are stripped, so it cannot collide
 
-    def __init__(self, rpc_server: RpcServer):
+    def __init__(self, rpc_server: RpcServer, snapshot_dir: Optional[str] = ChatServerConfig.SNAPSHOT_DIR):
         self.rpc_server = rpc_server
-        self.user_names: Dict[Tuple[str, int], str] = {}
-        self.groups: Dict[str, Dict[str, Any]] = {}  # group_name -> {members: set, creator: str}
-        self.user_current_group: Dict[Tuple[str, int], str] = {}  # client_address -> group_name
+        self.user_sessions: Dict[str, Session] = {}  # username -> session of the connection using it
+        self.groups: Dict[str, Dict[str, Any]] = {}  # group_name -> {members: set of session ids, creator: str}
+        self.search_index = MessageSearchIndex()
+        self.direct_messages = DirectMessageStore()
+        self.sessions: Dict[str, Dict[str, Any]] = {}  # session_token -> {username, session, group_name}
+        self.detached_sessions: 'OrderedDict[str, float]' = OrderedDict()  # session_token -> detach time, oldest first
+        self.reserved_usernames: Dict[str, str] = {}  # username -> token of the detached session holding it
+        self.pending_presence: Dict[str, Dict[str, bool]] = {}  # group_name -> {username: joined} awaiting flush
+        self.presence_timers: Dict[str, Timer] = {}  # group_name -> scheduled flush of its pending presence
+        self.presence_subscribers: Set[int] = set()  # Session ids receiving users_delta
+        self.users_version = 0  # Bumped whenever a username comes online or goes offline
+        self.users_flushed_version = 0  # users_version last announced to subscribers
+        self.users_flushed_at = 0.0
+        self.pending_users: Dict[str, bool] = {}  # username -> online, awaiting flush
+        self.users_timer: Optional[Timer] = None  # Scheduled flush of pending_users
+        self.users_response: Optional[Tuple[int, bytes]] = None  # (version, encoded get_users reply)
+        self.group_directory: List[Tuple[str, str]] = []  # Sorted (casefolded name, name) of public groups
+        self.directory_version = 0  # Bumped when a public group is created or deleted
+        self.fanout = FanoutScheduler(rpc_server)
+        self.attachments = AttachmentStore(rpc_server, ChatServerConfig.ATTACHMENT_DIR, self._on_upload_complete)
+        self.snapshots = SnapshotStore(snapshot_dir) if snapshot_dir else None
+        self.snapshot_epoch = 0  # Bumped on capture; histories from an older epoch are copied before mutation
+        self.log_flush_scheduled = False  # Records appended this loop iteration get written at its end
+        # Restored (seq, username, timestamp, text) history not yet turned into records and indexed
+        self.pending_restore: Dict[str, List[Tuple[int, str, float, str]]] = {}
+        self.handoff_listener: Optional[socket.socket] = None  # Unix socket a successor process connects to
+        self.handoff_conn: Optional[socket.socket] = None  # Successor connection while waiting for its ACK
+        self.handoff_ack = b''  # ACK bytes received so far
+        self.handoff_started = 0.0
+        self.handoff_count = 0  # Connections passed to the successor
+        self.handed_off = False  # Connections now belong to a successor process
+        self.cluster = None  # ClusterNode when running as one node of several
+        self.remote_users: Dict[str, str] = {}  # username -> id of the cluster node it is online on
         self.logger = logging.getLogger(f"{self.__class__.__name__}")
         self._create_general_group()
+        self._restore_state()
         self._register_handlers()
         # Set disconnect callback
         self.rpc_server.disconnect_callback = self._handle_client_disconnect
+        if self.snapshots is not None:
+            self.rpc_server.call_every(ChatServerConfig.SNAPSHOT_INTERVAL, self._take_snapshot)
+        if self.pending_restore:
+            self.rpc_server.call_soon(self._load_restored_groups)
 
     def _create_general_group(self):
         """Create the default General group"""
-        self.groups[self.GENERAL_GROUP] = {
+        self._register_group(self.GENERAL_GROUP, self._new_group_data(self.GENERAL_GROUP, 'SYSTEM'))
+        self.logger.info(f"Created default group: {self.GENERAL_GROUP}")
+
+    def _new_group_data(self, group_name: str, creator: str) -> Dict[str, Any]:
+        """Data of a group with no members"""
+        return {
             'members': set(),
-            'creator': 'SYSTEM',
-            'name': self.GENERAL_GROUP,
-            'message_history': []  # List to store message history
+            'message_rate': RateMeter(),  # Messages per second appended to the history, for admin_groups
+            'remote_members': {},  # username -> cluster node id, for members connected to other nodes
+            'member_version': 0,  # Bumped on every membership change
+            'member_names': None,  # Cached member name list, rebuilt after a change
+            'members_response': None,  # Encoded get_group_members reply for member_version
+            'flushed_version': 0,  # member_version last announced to members
+            'presence_flushed_at': 0.0,
+            'creator': creator,
+            'name': group_name,
+            'message_history': [],  # List to store message history
+            'history_epoch': self.snapshot_epoch,  # snapshot_epoch the history list was last copied in
+            'next_seq': 1  # Sequence number for the next history record
         }
-        self.logger.info(f"Created default group: {self.GENERAL_GROUP}")
+
+    def _restore_state(self) -> None:
+        """Rebuild groups, histories, direct messages and resumable sessions from the latest snapshot and log"""
+        if self.snapshots is None:
+            return
+
+        started = time.perf_counter()
+        # Everything restored lives until shutdown, so skip collector passes while loading it
+        gc.disable()
+        try:
+            count = self.snapshots.restore(self._restore_record)
+        finally:
+            gc.enable()
+            gc.freeze()
+        self.snapshots.open_log()
+
+        if count:
+            self.logger.info(f"Restored {len(self.groups)} groups from {count} records in "
+                             f"{time.perf_counter() - started:.3f}s")
+
+    def _restore_record(self, record: Record) -> None:
+        kind = record[0]
+        if kind == 'group':
+            _, group_name, creator, history = record
+            group = self.groups.get(group_name)
+            if group is None:
+                group = self._new_group_data(group_name, creator)
+                self._register_group(group_name, group)
+            if history:
+                self.pending_restore[group_name] = history
+                group['next_seq'] = history[-1][0] + 1
+        elif kind == 'message':
+            _, group_name, seq, username, timestamp, text = record
+            group = self.groups.get(group_name)
+            if group is None or seq < group['next_seq']:
+                return
+            history = self.pending_restore.setdefault(group_name, [])
+            history.append((seq, username, timestamp, text))
+            del history[:-ChatServerConfig.MAX_HISTORY_LENGTH]
+            group['next_seq'] = seq + 1
+        elif kind == 'delete':
+            if record[1] in self.groups and record[1] != self.GENERAL_GROUP:
+                self._delete_group(record[1])
+        elif kind == 'channel':
+            _, users, next_seq, history = record
+            channel = self.direct_messages.get(*users)
+            channel.history.extend(history)
+            channel.next_seq = next_seq
+        elif kind == 'direct':
+            _, sender, peer, timestamp, text = record
+            self.direct_messages.get(sender, peer).append(sender, text, timestamp)
+        elif kind == 'forget':
+            self.direct_messages.forget(record[1])
+        elif kind == 'session':
+            _, token, username, group_name = record
+            # Restored sessions wait for their clients to reconnect and resume
+            self.sessions[token] = {'username': username, 'session': None, 'group_name': group_name}
+            self.detached_sessions[token] = time.time()
+            self.reserved_usernames[username] = token
+
+    def _ensure_restored(self, group_name: str) -> None:
+        """Turn a group's restored history into history records and index it, on first use"""
+        history = self.pending_restore.pop(group_name, None)
+        if history is None:
+            return
+
+        group = self.groups[group_name]
+        group['message_history'] = [
+            {
+                'type': 'message',
+                'message': text,
+                'username': sys.intern(username),
+                'timestamp': timestamp,
+                'sender_id': 0,  # Session ids do not survive a restart
+                'seq': seq
+            }
+            for seq, username, timestamp, text in history
+        ]
+        for msg_record in group['message_history']:
+            self.search_index.add(group_name, msg_record['seq'], msg_record['message'], msg_record['timestamp'])
+
+    def _load_restored_groups(self) -> None:
+        """Load restored history a slice per loop iteration so a restart does not wait for all of it"""
+        deadline = time.perf_counter() + ChatServerConfig.RESTORE_SLICE_BUDGET
+        while self.pending_restore and time.perf_counter() < deadline:
+            self._ensure_restored(next(iter(self.pending_restore)))
+        if self.pending_restore:
+            self.rpc_server.call_soon(self._load_restored_groups)
+
+    def _log_state(self, record: Record) -> None:
+        if self.snapshots is not None:
+            self.snapshots.append(record)
+            if not self.log_flush_scheduled:
+                self.log_flush_scheduled = True
+                self.rpc_server.call_soon(self._flush_log)
+
+    def _flush_log(self) -> None:
+        """Write the records logged during a loop iteration with one flush, not one per message"""
+        self.log_flush_scheduled = False
+        self.snapshots.flush()
+
+    def _take_snapshot(self) -> None:
+        """Start a background snapshot every SNAPSHOT_INTERVAL; one still being written skips this turn"""
+        if self.snapshots.log_records and not self.snapshots.is_writing():
+            self.snapshots.start_snapshot(self._capture_state())
+
+    def _capture_state(self) -> Iterator[Record]:
+        """Capture state for a snapshot in O(groups) without copying any history.
+
+        Bumping snapshot_epoch makes _append_history copy a group's history list
+        before its next change, so the captured lists stay frozen while the
+        returned generator converts them on the writer thread.
+        """
+        self.snapshot_epoch += 1
+        groups = [(group_name, group['creator'], group['message_history'], self.pending_restore.get(group_name))
+                  for group_name, group in self.groups.items()]
+        channels = [(users, channel.next_seq, tuple(channel.history))
+                    for users, channel in self.direct_messages.channels.items()]
+        sessions = [(token, saved['username'], saved['session'].group_name if saved['session'] else saved['group_name'])
+                    for token, saved in self.sessions.items()]
+        return self._snapshot_records(groups, channels, sessions)
+
+    @staticmethod
+    def _snapshot_records(groups, channels, sessions) -> Iterator[Record]:
+        for group_name, creator, history, restored in groups:
+            if restored is not None:
+                yield ('group', group_name, creator, restored)
+            else:
+                yield ('group', group_name, creator,
+                       [(msg['seq'], msg['username'], msg['timestamp'], msg['message']) for msg in history])
+        for users, next_seq, history in channels:
+            yield ('channel', users, next_seq, list(history))
+        for token, username, group_name in sessions:
+            yield ('session', token, username, group_name)
 
     def _register_handlers(self):
         self.rpc_server.register_handler('join_chat', self._handle_join_chat)
+        self.rpc_server.register_handler('resume', self._handle_resume)
         self.rpc_server.register_handler('leave_chat', self._handle_leave_chat)
         self.rpc_server.register_handler('send_message', self._handle_send_message)
         self.rpc_server.register_handler('get_users', self._handle_get_users)
+        self.rpc_server.register_handler('subscribe_presence', self._handle_subscribe_presence)
         self.rpc_server.register_handler('create_group', self._handle_create_group)
         self.rpc_server.register_handler('join_group', self._handle_join_group)
         self.rpc_server.register_handler('leave_group', self._handle_leave_group)
         self.rpc_server.register_handler('get_group_members', self._handle_get_group_members)
         self.rpc_server.register_handler('get_groups', self._handle_get_groups)
+        self.rpc_server.register_handler('search_messages', self._handle_search_messages)
+        self.rpc_server.register_handler('send_direct_message', self._handle_send_direct_message)
+        self.rpc_server.register_handler('get_direct_history', self._handle_get_direct_history)
+        self.rpc_server.register_handler('begin_upload', self._handle_begin_upload)
+        self.rpc_server.register_stream_handler('UPLOAD', self.attachments.open_upload)
+        self.rpc_server.register_stream_handler('DOWNLOAD', self.attachments.open_download)
 
     def _validate_message(self, message: str) -> bool:
         return ValidationRules.is_valid_message(message)
 
-    def _get_username(self, client_address: Tuple[str, int]) -> str:
-        return self.user_names.get(client_address, f"{ChatServerConfig.DEFAULT_USERNAME_PREFIX}{client_address[1]}")
+    def _get_username(self, session: Session) -> str:
+        return session.username or f"{ChatServerConfig.DEFAULT_USERNAME_PREFIX}{session.address[1]}"
 
     def _format_chat_message(self, username: str, message: str) -> str:
         return f"{username}: {message.strip()}"
 
-    def _handle_join_chat(self, params: Dict[str, Any], client_socket: socket.socket, client_address: Tuple[str, int]) -> Dict[str, Any]:
-        username = self._validate_and_get_username(params, client_address)
+    def _handle_join_chat(self, params: Dict[str, Any], session: Session) -> Dict[str, Any]:
+        self._expire_detached_sessions()
+        username = self._validate_and_get_username(params, session)
 
         if not username:
             return {
@@ -59,131 +268,283 @@ class ChatServer:
                 'message': 'Invalid username'
             }
 
-        self.user_names[client_address] = username
+        self._set_username(session, username)
 
         # Auto-join user to General group
-        self.groups[self.GENERAL_GROUP]['members'].add(client_address)
-        self.user_current_group[client_address] = self.GENERAL_GROUP
+        self._add_member(self.GENERAL_GROUP, session)
+        session.group_name = self.GENERAL_GROUP
 
-        self._broadcast_join_message(username, client_socket)
-        self._send_welcome_message(username, client_socket)
+        self._send_welcome_message(username, session)
 
-        self.logger.info(f"{username} ({client_address}) joined the chat and General group")
+        self.logger.info(f"{username} ({session.address}) joined the chat and General group")
 
         # Get member list for General group
-        members = [self._get_username(addr) for addr in self.groups[self.GENERAL_GROUP]['members']]
+        members = self._get_member_names(self.GENERAL_GROUP)
 
         # Prepare message history for the new client
-        message_history = []
-        if 'message_history' in self.groups[self.GENERAL_GROUP]:
-            for msg_record in self.groups[self.GENERAL_GROUP]['message_history']:
-                # Convert message record to format client can understand
-                history_msg = {
-                    'type': msg_record['type'],
-                    'message': msg_record['message'],
-                    'username': msg_record['username'],
-                    'timestamp': msg_record['timestamp'],
-                    'is_own_message': msg_record['sender_address'] == client_address,  # Flag to identify own messages
-                    'group_name': self.GENERAL_GROUP
-                }
-                message_history.append(history_msg)
-
-        # Broadcast updated members list to all General group members
-        self._broadcast_members_update(self.GENERAL_GROUP)
+        self._ensure_restored(self.GENERAL_GROUP)
+        message_history = [
+            self._format_history_record(msg_record, self.GENERAL_GROUP, session)
+            for msg_record in self.groups[self.GENERAL_GROUP]['message_history']
+        ]
 
         return {
             'status': 'success',
             'message': f'Joined chat as {username}',
-            'users': list(self.user_names.values()),
+            'session_token': self._issue_session_token(session, username),
+            'users': list(self.user_sessions),
             'group_name': self.GENERAL_GROUP,
             'members': members,
+            'member_version': self.groups[self.GENERAL_GROUP]['member_version'],
             'message_history': message_history  # Include message history
         }
 
-    def _validate_and_get_username(self, params: Dict[str, Any], client_address: Tuple[str, int]) -> str:
-        username = params.get('username', f"{ChatServerConfig.DEFAULT_USERNAME_PREFIX}{client_address[1]}")
+    def _validate_and_get_username(self, params: Dict[str, Any], session: Session) -> str:
+        username = params.get('username', f"{ChatServerConfig.DEFAULT_USERNAME_PREFIX}{session.address[1]}")
         username = ValidationRules.sanitize_username(username)
+        return self._free_username(username, session, session.address[1])
+
+    def _free_username(self, username: str, session: Optional[Session], suffix: Any) -> str:
+        """username if free, else the first free one of username_<suffix>, username_<suffix>_2, ..."""
+        # The suffixed name can itself be taken (e.g. by a user who picked that name), so count on from it
+        base_name = username
+        for attempt in itertools.count(1):
+            if not self._is_username_taken(username, session):
+                return username
+            username = base_name + (f"_{suffix}" if attempt == 1 else f"_{suffix}_{attempt}")
+
+    def _is_username_taken(self, username: str, session: Session) -> bool:
+        return (self.user_sessions.get(username, session) is not session
+                or username in self.reserved_usernames or username in self.remote_users)
+
+    def _set_username(self, session: Session, username: str) -> None:
+        """Bind username to session, keeping both lookup directions in sync"""
+        old_username = self._get_username(session)
+        self._remove_user(session)
+        # Interned so history records and member lists share one string per user
+        session.username = sys.intern(username)
+        self.user_sessions[session.username] = session
+        self._queue_user_presence(session.username, True)
+        if self.cluster:
+            self.cluster.publish_user(session.username, True)
+        if old_username != session.username:
+            self._release_username(old_username)
+
+        # A renamed member is a new member list version: the old name leaves and the new one joins
+        if session.group_name in self.groups and old_username != session.username:
+            self._bump_member_version(self.groups[session.group_name])
+            self._queue_presence(session.group_name, old_username, False)
+            self._queue_presence(session.group_name, session.username, True)
+            if self.cluster:
+                self.cluster.publish_member(session.group_name, old_username, False)
+                self.cluster.publish_member(session.group_name, session.username, True)
+
+    def _format_history_record(self, msg_record: Dict[str, Any], group_name: str, session: Session) -> Dict[str, Any]:
+        """Convert a history record to the format client can understand"""
+        return {
+            'type': msg_record['type'],
+            'message': msg_record['message'],
+            'username': msg_record['username'],
+            'timestamp': msg_record['timestamp'],
+            'seq': msg_record['seq'],
+            'is_own_message': msg_record['sender_id'] == session.id,  # Flag to identify own messages
+            'group_name': group_name
+        }
 
-        if username in self.user_names.values():
-            username = f"{username}_{client_address[1]}"
+    def _issue_session_token(self, session: Session, username: str) -> str:
+        """Create the token a client presents to `resume` after a reconnect"""
+        self._drop_session(session.token)
+        token = secrets.token_urlsafe(16)
+        self.sessions[token] = {
+            'username': username,
+            'session': session,
+            'group_name': self.GENERAL_GROUP
+        }
+        session.token = token
+        return token
 
-        return username
+    def _drop_session(self, token: Optional[str]) -> None:
+        saved = self.sessions.pop(token, None) if token else None
+        if saved is None:
+            return
+        self._release_detached(token, saved)
+        if saved['session'] is not None:
+            saved['session'].token = None
+        self._release_username(saved['username'])
+
+    def _detach_session(self, session: Session, group_name: Optional[str]) -> None:
+        """Keep a disconnected client's session (and its username) resumable for SESSION_RESUME_TIMEOUT seconds"""
+        token, session.token = session.token, None
+        if token is None:
+            return
+        saved = self.sessions[token]
+        saved['session'] = None
+        saved['group_name'] = group_name
+        self.detached_sessions[token] = time.time()
+        self.reserved_usernames[saved['username']] = token
+
+    def _release_detached(self, token: str, saved: Dict[str, Any]) -> None:
+        if self.detached_sessions.pop(token, None) is not None:
+            if self.reserved_usernames.get(saved['username']) == token:
+                del self.reserved_usernames[saved['username']]
+
+    def _expire_detached_sessions(self) -> None:
+        deadline = time.time() - ChatServerConfig.SESSION_RESUME_TIMEOUT
+        while self.detached_sessions:
+            token, detached_at = next(iter(self.detached_sessions.items()))
+            if detached_at > deadline:
+                break
+            self._drop_session(token)
+
+    def _handle_resume(self, params: Dict[str, Any], session: Session) -> Dict[str, Any]:
+        """Reattach a reconnecting client to its session and replay only the messages it missed"""
+        self._expire_detached_sessions()
+        token = params.get('session_token')
+        saved = self.sessions.get(token) if isinstance(token, str) else None
+
+        if saved is None:
+            return {
+                'status': 'error',
+                'message': 'Session expired or unknown, please join again'
+            }
 
-    def _broadcast_join_message(self, username: str, client_socket: socket.socket) -> None:
-        join_data = {
-            'type': 'system',
-            'message': f"{username} has joined the chat!",
-            'username': 'SYSTEM'
+        # The old connection may not have been noticed as dead yet
+        if saved['session'] is not None and saved['session'] is not session:
+            self.rpc_server.disconnect_session(saved['session'].id)
+
+        group_name = saved['group_name']
+        if group_name not in self.groups:
+            group_name = self.GENERAL_GROUP
+        # This connection may already have joined as someone else; a session is in one group at a time
+        if session.group_name != group_name:
+            self._leave_current_group(session)
+
+        if session.token not in (None, token):
+            self._drop_session(session.token)
+        self._release_detached(token, saved)
+        saved['session'] = session
+        session.token = token
+        username = saved['username']
+        self._set_username(session, username)
+
+        self._add_member(group_name, session)
+        session.group_name = group_name
+
+        last_seen = params.get('last_seen') or {}
+        if not isinstance(last_seen, dict):
+            last_seen = {}
+        last_seen.setdefault(group_name, 0)
+
+        missed_messages = []
+        history_truncated = False
+        for seen_group, seen_seq in last_seen.items():
+            if seen_group not in self.groups:
+                continue
+            self._ensure_restored(seen_group)
+            history = self.groups[seen_group]['message_history']
+            if not history or not isinstance(seen_seq, int):
+                continue
+            # History holds consecutive sequence numbers, so the gap starts at a fixed offset
+            start = seen_seq + 1 - history[0]['seq']
+            if start < 0:
+                history_truncated = history_truncated or seen_seq > 0
+                start = 0
+            missed_messages.extend(
+                self._format_history_record(msg_record, seen_group, session)
+                for msg_record in history[start:]
+            )
+
+        self.logger.info(f"{username} ({session.address}) resumed session in {group_name}, replaying {len(missed_messages)} messages")
+
+        return {
+            'status': 'success',
+            'message': f'Resumed session as {username}',
+            'session_token': token,
+            'username': username,
+            'group_name': group_name,
+            'members': self._get_member_names(group_name),
+            'member_version': self.groups[group_name]['member_version'],
+            'missed_messages': missed_messages,
+            'history_truncated': history_truncated
         }
-        self.rpc_server.broadcast_json_message(join_data, client_socket)
 
-    def _send_welcome_message(self, username: str, client_socket: socket.socket) -> None:
+    def _send_welcome_message(self, username: str, session: Session) -> None:
         welcome_data = {
             'type': 'system',
             'message': f"Welcome to the chat, {username}!",
             'username': 'SYSTEM'
         }
-        self.rpc_server.send_json_to_client(client_socket, welcome_data)
+        self.rpc_server.send_json_to_client(session, welcome_data)
 
-    def _handle_leave_chat(self, params: Dict[str, Any], client_socket: socket.socket, client_address: Tuple[str, int]) -> Dict[str, Any]:
-        username = self._get_username(client_address)
-        self._remove_user(client_address)
-        self._broadcast_leave_message(username, client_socket)
+    def _handle_leave_chat(self, params: Dict[str, Any], session: Session) -> Dict[str, Any]:
+        username = self._get_username(session)
+        self._drop_session(session.token)
+        self.presence_subscribers.discard(session.id)
+        self._leave_current_group(session)
+        self._remove_user(session)
+        self._release_username(username)
 
-        self.logger.info(f"{username} ({client_address}) left the chat")
+        self.logger.info(f"{username} ({session.address}) left the chat")
 
         return {
             'status': 'success',
             'message': f'{username} left the chat'
         }
 
-    def _remove_user(self, client_address: Tuple[str, int]) -> None:
-        if client_address in self.user_names:
-            del self.user_names[client_address]
+    def _remove_user(self, session: Session) -> None:
+        username, session.username = session.username, None
+        if username is not None and self.user_sessions.get(username) is session:
+            del self.user_sessions[username]
+            self._queue_user_presence(username, False)
+            if self.cluster:
+                self.cluster.publish_user(username, False)
+
+    def _release_username(self, username: str) -> None:
+        """Forget the direct messages and unfinished uploads of a username nobody holds any more.
+
+        Anyone may take a free name, so neither its conversations nor its
+        resumable uploads may outlive the identity that had them: a connection,
+        a resumable session or a user on another node.
+        """
+        if username in self.user_sessions or username in self.reserved_usernames or username in self.remote_users:
+            return
+        self.attachments.cancel_uploads(username)
+        if self.direct_messages.forget(username):
+            self._log_state(('forget', username))
 
-    def _handle_client_disconnect(self, client_socket: socket.socket, client_address: Tuple[str, int]) -> None:
+    def _handle_client_disconnect(self, session: Session) -> None:
         """Handle client disconnect - cleanup user data and notify others"""
-        username = self._get_username(client_address)
+        username = self._get_username(session)
 
         # Remove from current group
-        current_group = self.user_current_group.get(client_address)
-        if current_group and current_group in self.groups:
-            self.groups[current_group]['members'].discard(client_address)
-
-            # Notify group members
-            leave_data = {
-                'type': 'system',
-                'message': f"{username} has left the chat!",
-                'username': 'SYSTEM',
-                'group_name': current_group
-            }
-            self._broadcast_to_group(current_group, leave_data, None)
-
-            # Broadcast updated members list to remaining members
-            self._broadcast_members_update(current_group)
+        current_group = self._leave_current_group(session)
 
-            # Delete group if empty (but not General)
-            if len(self.groups[current_group]['members']) == 0 and current_group != self.GENERAL_GROUP:
-                del self.groups[current_group]
-                self.logger.info(f"Group {current_group} deleted (empty)")
+        # Remove user data, keeping the session resumable
+        self._detach_session(session, current_group)
+        self.presence_subscribers.discard(session.id)
+        self._remove_user(session)
+        self._release_username(username)
 
-        # Remove user data
-        if client_address in self.user_names:
-            del self.user_names[client_address]
-        if client_address in self.user_current_group:
-            del self.user_current_group[client_address]
+        self.logger.info(f"{username} ({session.address}) disconnected and cleaned up")
 
-        self.logger.info(f"{username} ({client_address}) disconnected and cleaned up")
-
-    def _broadcast_leave_message(self, username: str, client_socket: socket.socket) -> None:
-        leave_data = {
-            'type': 'system',
-            'message': f"{username} has left the chat!",
-            'username': 'SYSTEM'
-        }
-        self.rpc_server.broadcast_json_message(leave_data, client_socket)
+    def _leave_current_group(self, session: Session) -> Optional[str]:
+        """Remove client from its current group, deleting the group if it is left empty"""
+        current_group, session.group_name = session.group_name, None
+        if current_group in self.groups:
+            self._remove_member(current_group, session)
+            self._delete_group_if_empty(current_group)
+        return current_group
+
+    def _delete_group_if_empty(self, group_name: str, announce: bool = True) -> None:
+        """Delete a group nobody on any node is in (but never General)"""
+        group = self.groups[group_name]
+        if group['members'] or group['remote_members'] or group_name == self.GENERAL_GROUP:
+            return
+        self._delete_group(group_name)
+        if self.cluster and announce:
+            self.cluster.publish_group(group_name, group['creator'], False)
 
-    def _handle_send_message(self, params: Dict[str, Any], client_socket: socket.socket, client_address: Tuple[str, int]) -> Dict[str, Any]:
+    def _handle_send_message(self, params: Dict[str, Any], session: Session) -> Dict[str, Any]:
         message = params.get('message', '')
 
         if not self._validate_message(message):
@@ -192,8 +553,8 @@ class ChatServer:
                 'message': 'Message cannot be empty or too long'
             }
 
-        username = self._get_username(client_address)
-        self.logger.info(f"JSON RPC message from {client_address} ({username}): {message.strip()}")
+        username = self._get_username(session)
+        self.logger.info(f"JSON RPC message from {session.address} ({username}): {message.strip()}")
 
         chat_data = {
             'type': 'message',
@@ -202,7 +563,7 @@ class ChatServer:
         }
 
         # Check if user is in a group
-        current_group = self.user_current_group.get(client_address)
+        current_group = session.group_name
         if current_group:
             # Add message to group history
             message_record = {
@@ -210,46 +571,136 @@ class ChatServer:
                 'message': message.strip(),
                 'username': username,
                 'timestamp': time.time(),
-                'sender_address': client_address  # Store sender address for client identification
+                'sender_id': session.id  # Sender's session id, for client identification
             }
 
             if current_group in self.groups:
-                self.groups[current_group]['message_history'].append(message_record)
-                self.logger.info(f"Added message to {current_group} history. Total: {len(self.groups[current_group]['message_history'])}")
-                # Keep only last 100 messages to prevent memory issues
-                if len(self.groups[current_group]['message_history']) > 100:
-                    self.groups[current_group]['message_history'] = self.groups[current_group]['message_history'][-100:]
-                    self.logger.info(f"Trimmed {current_group} history to 100 messages")
+                self._append_history(current_group, message_record)
+                chat_data['seq'] = message_record['seq']
 
             # Broadcast to all group members (excluding sender)
             chat_data['group_name'] = current_group  # Use 'group_name' for filtering
-            self._broadcast_to_group(current_group, chat_data, client_socket)  # Exclude sender
+            self._broadcast_to_group(current_group, chat_data, session)  # Exclude sender
+
+            if self.cluster and current_group in self.groups:
+                remote_nodes = set(self.groups[current_group]['remote_members'].values())
+                if remote_nodes:
+                    self.cluster.forward_message(current_group, remote_nodes, username, message_record['message'],
+                                                 message_record['timestamp'])
         else:
             # Broadcast to all users not in groups
-            self.rpc_server.broadcast_json_message(chat_data, client_socket)
+            self.rpc_server.broadcast_json_message(chat_data, session)
 
         return {
             'status': 'success',
             'message': 'Message sent successfully'
         }
 
-    def _handle_get_users(self, params: Dict[str, Any], client_socket: socket.socket, client_address: Tuple[str, int]) -> Dict[str, Any]:
-        connected_clients = self.rpc_server.get_connected_clients()
-        users = self._build_user_list(connected_clients)
+    def _append_history(self, group_name: str, message_record: Dict[str, Any]) -> None:
+        """Store a message in group history and the search index, evicting the oldest records"""
+        group = self.groups[group_name]
+        message_record['seq'] = group['next_seq']
+        group['next_seq'] += 1
+
+        if group['history_epoch'] != self.snapshot_epoch:
+            # The snapshot writer may still be reading the current list
+            group['message_history'] = list(group['message_history'])
+            group['history_epoch'] = self.snapshot_epoch
+
+        self._ensure_restored(group_name)
+        history = group['message_history']
+        history.append(message_record)
+        group['message_rate'].add(message_record['timestamp'])
+        self.search_index.add(group_name, message_record['seq'], message_record['message'], message_record['timestamp'])
+        self._log_state(('message', group_name, message_record['seq'], message_record['username'],
+                         message_record['timestamp'], message_record['message']))
+        self.logger.info(f"Added message to {group_name} history. Total: {len(history)}")
+
+        # Keep only the last MAX_HISTORY_LENGTH messages to prevent memory issues
+        overflow = len(history) - ChatServerConfig.MAX_HISTORY_LENGTH
+        if overflow > 0:
+            for evicted in history[:overflow]:
+                self.search_index.remove(group_name, evicted['seq'])
+            del history[:overflow]
+            self.logger.info(f"Trimmed {group_name} history to {ChatServerConfig.MAX_HISTORY_LENGTH} messages")
+
+    def _register_group(self, group_name: str, group_data: Dict[str, Any]) -> None:
+        self.groups[group_name] = group_data
+        bisect.insort(self.group_directory, (group_name.casefold(), group_name))
+        self.directory_version += 1
+        self._log_state(('group', group_name, group_data['creator'], []))
+
+    def _delete_group(self, group_name: str) -> None:
+        del self.groups[group_name]
+        self.pending_presence.pop(group_name, None)
+        timer = self.presence_timers.pop(group_name, None)
+        if timer is not None:
+            timer.cancel()
+        self.pending_restore.pop(group_name, None)
+        self.fanout.cancel(group_name)
+        self._log_state(('delete', group_name))
+        entry = (group_name.casefold(), group_name)
+        index = bisect.bisect_left(self.group_directory, entry)
+        if index < len(self.group_directory) and self.group_directory[index] == entry:
+            del self.group_directory[index]
+        self.directory_version += 1
+        self.search_index.remove_group(group_name)
+        self.logger.info(f"Group {group_name} deleted (empty)")
+
+    def _handle_get_users(self, params: Dict[str, Any], session: Session) -> Union[Dict[str, Any], bytes]:
+        # Both counters only grow, so their sum changes whenever either does
+        version = self.users_version + self.rpc_server.clients_version
+        if params.get('if_version') == version:
+            return {
+                'status': 'success',
+                'not_modified': True,
+                'version': version
+            }
+
+        if self.users_response is None or self.users_response[0] != version:
+            connected_clients = self.rpc_server.get_connected_clients()
+            users = self._build_user_list(connected_clients)
+            users.extend({'username': username, 'address': f"node:{node}"} for username, node in self.remote_users.items())
+            self.users_response = (version, json.dumps({
+                'status': 'success',
+                'users': users,
+                'count': len(users),
+                'version': version
+            }).encode('utf-8'))
+        return self.users_response[1]
+
+    def _handle_subscribe_presence(self, params: Dict[str, Any], session: Session) -> Dict[str, Any]:
+        """Push online-user changes to this connection instead of it polling get_users.
+
+        The reply is a full snapshot to resync from; users_delta events follow.
+        Member changes of the current group already arrive as members_delta.
+        """
+        if params.get('users', True):
+            self.presence_subscribers.add(session.id)
+        else:
+            self.presence_subscribers.discard(session.id)
+
+        presence = {
+            'users': list(self.user_sessions) + list(self.remote_users),
+            'users_version': self.users_version
+        }
+        if session.group_name in self.groups:
+            presence['group_name'] = session.group_name
+            presence['members'] = self._get_member_names(session.group_name)
+            presence['member_version'] = self.groups[session.group_name]['member_version']
 
         return {
             'status': 'success',
-            'users': users,
-            'count': len(users)
+            'presence': presence
         }
 
-    def _build_user_list(self, connected_clients: List[Tuple[str, int]]) -> List[Dict[str, str]]:
+    def _build_user_list(self, connected_clients: List[Session]) -> List[Dict[str, str]]:
         users = []
-        for addr in connected_clients:
-            username = self._get_username(addr)
+        for client in connected_clients:
+            username = self._get_username(client)
             users.append({
                 'username': username,
-                'address': f"{addr[0]}:{addr[1]}"
+                'address': f"{client.address[0]}:{client.address[1]}"
             })
         return users
 
@@ -260,76 +711,337 @@ class ChatServer:
     def stop(self):
         print("Stopping Chat Server...")
         self.rpc_server.stop_server()
+        if self.handoff_listener is not None:
+            self.handoff_listener.close()
+            if not self.handed_off:
+                os.unlink(ChatServerConfig.HANDOFF_PATH)
+        if self.snapshots is not None and not self.handed_off and self.handoff_conn is None:
+            self.snapshots.write_snapshot(self._capture_state())
+            self.snapshots.close()
+
+    def enable_handoff(self) -> None:
+        """Accept a successor process on HANDOFF_PATH for a zero-downtime restart"""
+        if not handoff.is_supported():
+            self.logger.info("Socket handoff is not supported on this platform")
+            return
+        self._listen_for_handoff()
+
+    def _listen_for_handoff(self) -> None:
+        try:
+            self.handoff_listener = handoff.listen(ChatServerConfig.HANDOFF_PATH)
+        except OSError as e:
+            self.logger.error(f"Handoff disabled, cannot listen on {ChatServerConfig.HANDOFF_PATH}: {e}")
+            return
+        self.rpc_server.add_reader(self.handoff_listener, self._on_handoff_request)
+
+    def _on_handoff_request(self) -> None:
+        try:
+            conn, _ = self.handoff_listener.accept()
+        except BlockingIOError:
+            return
+        conn.setblocking(False)
+        self.rpc_server.add_reader(conn, lambda: self._on_handoff_hello(conn))
+
+    def _on_handoff_hello(self, conn: socket.socket) -> None:
+        try:
+            hello = conn.recv(len(handoff.HELLO))
+        except BlockingIOError:
+            return
+        except OSError:
+            hello = b''
+        self.rpc_server.remove_reader(conn)
+        if hello != handoff.HELLO or self.handoff_listener is None:
+            conn.close()  # e.g. handoff.listen() checking whether this process is alive
+            return
+        self._start_handoff(conn)
+
+    def _start_handoff(self, conn: socket.socket) -> None:
+        """Pass the listening socket, every chat connection and the chat state to the process that connected.
+
+        The state is sent at once; the successor's ACK is then awaited with the
+        loop paused, so no request is read or reply written meanwhile and bytes
+        clients send arrive in the kernel buffers the successor reads from. If
+        the successor does not acknowledge, this process carries on.
+        """
+        # Closed first, so the successor can listen on the path as soon as it has taken over
+        self.rpc_server.remove_reader(self.handoff_listener)
+        self.handoff_listener.close()
+        self.handoff_listener = None
+
+        self.handoff_started = time.perf_counter()
+        self.handoff_conn = conn
+        self.handoff_ack = b''
+        sockets, state = self._handoff_state()
+        self.handoff_count = len(sockets) - len(self.rpc_server.listeners)
+        try:
+            conn.settimeout(ChatServerConfig.HANDOFF_TIMEOUT)
+            handoff.send_state(conn, state, sockets)
+            conn.setblocking(False)
+        except OSError as e:
+            self.logger.error(f"Handoff failed: {e}")
+            self._finish_handoff(False)
+            return
+        self.rpc_server.pause(conn, self._on_handoff_ack, ChatServerConfig.HANDOFF_TIMEOUT,
+                              lambda: self._finish_handoff(False))
+
+    def _on_handoff_ack(self) -> None:
+        try:
+            data = self.handoff_conn.recv(len(handoff.ACK) - len(self.handoff_ack))
+        except BlockingIOError:
+            return
+        except OSError as e:
+            self.logger.error(f"Handoff failed: {e}")
+            data = b''
+        if not data:
+            self._finish_handoff(False)
+            return
+        self.handoff_ack += data
+        if len(self.handoff_ack) == len(handoff.ACK):
+            self._finish_handoff(self.handoff_ack == handoff.ACK)
+
+    def _finish_handoff(self, acknowledged: bool) -> None:
+        if self.handoff_conn is None:
+            return
+        self.handoff_conn.close()
+        self.handoff_conn = None
+
+        if not acknowledged:
+            self.logger.error("Successor did not take over, continuing to serve")
+            self.rpc_server.resume()
+            if self.snapshots is not None:
+                self.snapshots.open_log()
+            self._listen_for_handoff()
+            return
+
+        self.logger.info(f"Handed off {self.handoff_count} connections in {time.perf_counter() - self.handoff_started:.3f}s")
+        self.handed_off = True
+        self.rpc_server.release_handoff()
+
+    def _handoff_state(self) -> Tuple[List[socket.socket], Dict[str, Any]]:
+        """Settle queued work, then return the sockets to pass and what the successor cannot read from the snapshot"""
+        self.rpc_server.prepare_handoff()
+        for group_name in list(self.pending_presence):
+            self._flush_presence(group_name)
+        if self.pending_users:
+            self._flush_user_presence()
+        while self.fanout.queues:
+            self.fanout.run()
+
+        if self.snapshots is not None:
+            self.snapshots.write_snapshot(self._capture_state())
+            self.snapshots.close()
+            records = None  # The successor restores from the same directory
+        else:
+            records = list(self._capture_state())
+        sockets, rpc_state = self.rpc_server.export_handoff()
+
+        # Versions clients hold must keep increasing, or their deltas and if_version checks would go wrong
+        return sockets, {
+            'format': handoff.HANDOFF_FORMAT,
+            'rpc': rpc_state,
+            'records': records,
+            'member_versions': {group_name: (group['member_version'], group['flushed_version'])
+                                for group_name, group in self.groups.items()},
+            'users_version': self.users_version,
+            'users_flushed_version': self.users_flushed_version,
+            'directory_version': self.directory_version,
+            'presence_subscribers': list(self.presence_subscribers)
+        }
+
+    def adopt_handoff(self, state: Dict[str, Any], sockets: List[socket.socket]) -> None:
+        """Continue serving the connections a previous process passed over (see _on_handoff_request)"""
+        if state['records'] is not None:
+            for record in state['records']:
+                self._restore_record(record)
+
+        for group_name, (member_version, flushed_version) in state['member_versions'].items():
+            group = self.groups.get(group_name)
+            if group is not None:
+                group['member_version'], group['flushed_version'] = member_version, flushed_version
+                group['member_names'] = group['members_response'] = None
+        self.users_version = self.users_flushed_version = state['users_version']
+        self.directory_version = state['directory_version']
+
+        self.rpc_server.adopt_handoff(state['rpc'], sockets)
+        for session in self.rpc_server.clients.values():
+            if session.username is not None:
+                self.user_sessions[session.username] = session
+            saved = self.sessions.get(session.token)
+            if saved is not None:
+                # Restored as detached; its connection is live again
+                self._release_detached(session.token, saved)
+                saved['session'] = session
+            else:
+                session.token = None
+            if session.group_name in self.groups:
+                self.groups[session.group_name]['members'].add(session.id)
+        self.presence_subscribers = set(state['presence_subscribers']) & set(self.rpc_server.clients)
+
+    def cluster_state(self) -> Dict[str, Any]:
+        """Users, groups and memberships local to this node, sent to a peer when a cluster link comes up"""
+        clients = self.rpc_server.clients
+        return {
+            'users': list(self.user_sessions),
+            'groups': [[group_name, group['creator']] for group_name, group in self.groups.items()],
+            'members': [[group_name, self._get_username(clients[member_id])]
+                        for group_name, group in self.groups.items()
+                        for member_id in group['members'] if member_id in clients]
+        }
+
+    def drop_remote_node(self, node: str) -> None:
+        """Forget the users and memberships of a cluster node whose link went down"""
+        for username in [username for username, owner in self.remote_users.items() if owner == node]:
+            self.apply_remote_user(node, username, False, released=False)
+        for group_name, group in list(self.groups.items()):
+            for username in [username for username, owner in group['remote_members'].items() if owner == node]:
+                self.apply_remote_member(node, group_name, username, False)
+
+    def apply_remote_user(self, node: str, username: str, online: bool, released: bool = True) -> None:
+        """Track a user of another node; released is False when only the link to it went down"""
+        if online:
+            if self.remote_users.get(username) == node:
+                return
+            held_here = username in self.user_sessions or username in self.reserved_usernames
+            if held_here and node > self.cluster.node_id:
+                return  # Both nodes let the name in; the smaller node id keeps it, so the other one renames
+            self.remote_users[username] = node
+            if held_here:
+                self._yield_username(username)
+        elif self.remote_users.get(username) == node:
+            del self.remote_users[username]
+            if released:  # Left or renamed on its node; a lost link says nothing about the user
+                self._release_username(username)
+        else:
+            return
+        self._queue_user_presence(username, online)
+
+    def _yield_username(self, username: str) -> None:
+        """Rename the local holder of a username that a node with a smaller id holds too"""
+        # The name now stands for the other node's user, who must not see these
+        if self.direct_messages.forget(username):
+            self._log_state(('forget', username))
+
+        new_username = self._free_username(username, None, self.cluster.node_id)
+        self.logger.warning(f"{username} is also online on another node, renamed to {new_username} here")
+        session = self.user_sessions.get(username)
+        if session is None:
+            token = self.reserved_usernames.pop(username)  # Detached; the client learns the name on resume
+            self.sessions[token]['username'] = new_username
+            self.reserved_usernames[new_username] = token
+            return
+
+        self._set_username(session, new_username)
+        if session.token in self.sessions:
+            self.sessions[session.token]['username'] = new_username
+        self.rpc_server.send_json_to_client(session, {
+            'type': 'system',
+            'message': f"{username} is already in use on another server, you are now {new_username}",
+            'username': 'SYSTEM',
+            'new_username': new_username
+        })
+
+    def apply_remote_group(self, group_name: str, creator: str, exists: bool) -> None:
+        if exists and group_name not in self.groups:
+            self._register_group(group_name, self._new_group_data(group_name, creator))
+        elif not exists and group_name in self.groups:
+            self._delete_group_if_empty(group_name, announce=False)
+
+    def apply_remote_member(self, node: str, group_name: str, username: str, joined: bool) -> None:
+        if group_name not in self.groups:
+            if not joined:
+                return
+            self.apply_remote_group(group_name, username, True)
+        group = self.groups[group_name]
+        remote_members = group['remote_members']
+        if joined:
+            if remote_members.get(username) == node:
+                return
+            remote_members[username] = node
+        elif remote_members.get(username) == node:
+            del remote_members[username]
+        else:
+            return
+        self._bump_member_version(group)
+        self._queue_presence(group_name, username, joined)
+
+    def deliver_remote_message(self, group_name: str, username: str, text: str, timestamp: float) -> None:
+        """Store and broadcast a group message another node accepted from one of its users"""
+        if group_name not in self.groups:
+            return
+        message_record = {
+            'type': 'message',
+            'message': text,
+            'username': username,
+            'timestamp': timestamp,
+            'sender_id': None  # Not a session on this node
+        }
+        self._append_history(group_name, message_record)
+        self._broadcast_to_group(group_name, {
+            'type': 'message',
+            'message': text,
+            'username': username,
+            'seq': message_record['seq'],
+            'group_name': group_name
+        })
+
+    def deliver_remote_direct(self, sender: str, peer: str, text: str, timestamp: float) -> None:
+        channel = self.direct_messages.get(sender, peer)
+        record = channel.append(sender, text, timestamp)
+        self._log_state(('direct', sender, peer, record[2], record[3]))
+        peer_session = self.user_sessions.get(peer)
+        if peer_session is not None:
+            self.rpc_server.send_json_to_client(peer_session, self._format_direct_record(channel, record, peer), Lane.BULK)
 
     def get_online_users(self):
-        return list(self.user_names.values())
+        return list(self.user_sessions)
 
     def get_user_count(self):
-        return len(self.user_names)
+        return len(self.user_sessions)
 
-    def _handle_create_group(self, params: Dict[str, Any], client_socket: socket.socket, client_address: Tuple[str, int]) -> Dict[str, Any]:
+    def _handle_create_group(self, params: Dict[str, Any], session: Session) -> Dict[str, Any]:
         """Create a new group chat"""
-        username = self._get_username(client_address)
+        username = self._get_username(session)
 
         # Get group name from params or generate one
         group_name = params.get('group_name', '').strip()
 
         if not group_name:
             # Generate unique group name if not provided
-            import time
             group_name = f"Group_{int(time.time())}"
 
+        if group_name.startswith(ChatServerConfig.RESERVED_GROUP_PREFIX):
+            return {
+                'status': 'error',
+                'message': 'Private chats use direct messages, not groups'
+            }
+
         # Check if group name already exists
         if group_name in self.groups:
             group_error_data = {
                 'status': 'error',
                 'message': f'Group name "{group_name}" already exists'
             }
-            self.rpc_server.send_json_to_client(client_socket, group_error_data)
+            self.rpc_server.send_json_to_client(session, group_error_data)
             return {
                 'status': 'error',
                 'message': f'Group name "{group_name}" already exists'
             }
 
-        # Create group
-        group_data = {
-            'members': {client_address},
-            'creator': username,
-            'name': group_name,
-            'message_history': []  # Initialize empty message history
-        }
+        # A session is in one group at a time
+        self._leave_current_group(session)
 
-        # If this is a private chat, extract and store allowed users
-        if self._is_private_chat(group_name):
-            # Format: private_user1_user2
-            # Extract the two usernames from the group name
-            allowed_users = []
-            remaining = group_name.replace('private_', '', 1)
-
-            # The creator is one of them
-            allowed_users.append(username)
-
-            # The other user is the remaining part after removing creator
-            # Try both possibilities (creator could be first or second)
-            if remaining.startswith(username + '_'):
-                other_user = remaining[len(username) + 1:]
-                if other_user:  # Make sure we got a valid username
-                    allowed_users.append(other_user)
-            elif remaining.endswith('_' + username):
-                other_user = remaining[:-len(username) - 1]
-                if other_user:  # Make sure we got a valid username
-                    allowed_users.append(other_user)
-
-            if len(allowed_users) == 2:
-                group_data['allowed_users'] = allowed_users
-                self.logger.info(f"Created private chat {group_name} for users: {allowed_users}")
-            else:
-                self.logger.warning(f"Could not extract both users from private chat name: {group_name}")
+        # Create group
+        group_data = self._new_group_data(group_name, username)
+        group_data['members'].add(session.id)
+        group_data['member_version'] = group_data['flushed_version'] = 1
 
-        self.groups[group_name] = group_data
+        self._register_group(group_name, group_data)
+        if self.cluster:
+            self.cluster.publish_group(group_name, username, True)
+            self.cluster.publish_member(group_name, username, True)
 
         # Add user to group
-        self.user_current_group[client_address] = group_name
+        session.group_name = group_name
 
         self.logger.info(f"{username} created group {group_name}")
 
@@ -337,31 +1049,14 @@ class ChatServer:
             'status': 'success',
             'message': f'Group created: {group_name}',
             'group_name': group_name,
-            'members': [username]
+            'members': [username],
+            'member_version': 1
         }
 
-    def _is_private_chat(self, group_name: str) -> bool:
-        """Check if group is a private chat between two users"""
-        return group_name.startswith('private_')
-
-    def _get_private_chat_users(self, group_name: str) -> List[str]:
-        """Extract usernames from private chat group name"""
-        if not self._is_private_chat(group_name):
-            return []
-        # Format: private_user1_user2
-        parts = group_name.split('_', 1)  # Split only at first underscore after 'private'
-        if len(parts) < 2:
-            return []
-        # The rest is "user1_user2", need to split into two usernames
-        users_part = parts[1]
-        # Find the middle underscore by trying to match with existing usernames
-        # For now, we'll store allowed users in group metadata
-        return []
-
-    def _handle_join_group(self, params: Dict[str, Any], client_socket: socket.socket, client_address: Tuple[str, int]) -> Dict[str, Any]:
+    def _handle_join_group(self, params: Dict[str, Any], session: Session) -> Dict[str, Any]:
         """Join an existing group"""
         group_name = params.get('group_name', '')
-        username = self._get_username(client_address)
+        username = self._get_username(session)
 
         if not group_name or group_name not in self.groups:
             return {
@@ -369,50 +1064,21 @@ class ChatServer:
                 'message': 'Group not found'
             }
 
-        # Check if this is a private chat and user is allowed to join
-        if self._is_private_chat(group_name):
-            # Get allowed users from group metadata
-            allowed_users = self.groups[group_name].get('allowed_users', [])
-            if allowed_users and username not in allowed_users:
-                self.logger.warning(f"{username} attempted to join private chat {group_name} but is not authorized")
-                return {
-                    'status': 'error',
-                    'message': 'This is a private chat. You are not authorized to join.'
-                }
-
-        # Add user to group
-        self.groups[group_name]['members'].add(client_address)
-        self.user_current_group[client_address] = group_name
-
-        # Notify group members
-        join_data = {
-            'type': 'system',
-            'message': f"{username} joined the group",
-            'username': 'SYSTEM',
-            'group': group_name
-        }
-        self._broadcast_to_group(group_name, join_data, None)
+        # Add user to group; a session is in one group at a time
+        if session.group_name != group_name:
+            self._leave_current_group(session)
+        self._add_member(group_name, session)
+        session.group_name = group_name
 
         # Get member list
-        members = [self._get_username(addr) for addr in self.groups[group_name]['members']]
+        members = self._get_member_names(group_name)
 
         # Prepare message history for the new client
-        message_history = []
-        if 'message_history' in self.groups[group_name]:
-            self.logger.info(f"Group {group_name} has {len(self.groups[group_name]['message_history'])} messages in history")
-            for msg_record in self.groups[group_name]['message_history']:
-                # Convert message record to format client can understand
-                history_msg = {
-                    'type': msg_record['type'],
-                    'message': msg_record['message'],
-                    'username': msg_record['username'],
-                    'timestamp': msg_record['timestamp'],
-                    'is_own_message': msg_record['sender_address'] == client_address,  # Flag to identify own messages
-                    'group_name': group_name
-                }
-                message_history.append(history_msg)
-        else:
-            self.logger.warning(f"Group {group_name} has no message_history key!")
+        self._ensure_restored(group_name)
+        message_history = [
+            self._format_history_record(msg_record, group_name, session)
+            for msg_record in self.groups[group_name]['message_history']
+        ]
 
         self.logger.info(f"Sending {len(message_history)} messages to {username} joining {group_name}")
 
@@ -421,13 +1087,14 @@ class ChatServer:
             'message': f'Joined group: {group_name}',
             'group_name': group_name,
             'members': members,
+            'member_version': self.groups[group_name]['member_version'],
             'message_history': message_history  # Include message history
         }
 
-    def _handle_leave_group(self, params: Dict[str, Any], client_socket: socket.socket, client_address: Tuple[str, int]) -> Dict[str, Any]:
+    def _handle_leave_group(self, params: Dict[str, Any], session: Session) -> Dict[str, Any]:
         """Leave current group"""
-        username = self._get_username(client_address)
-        current_group = self.user_current_group.get(client_address)
+        username = self._get_username(session)
+        current_group = session.group_name
 
         if not current_group:
             return {
@@ -437,57 +1104,30 @@ class ChatServer:
 
         # Remove user from group
         if current_group in self.groups:
-            self.groups[current_group]['members'].discard(client_address)
-
-            # Notify remaining members
-            leave_data = {
-                'type': 'system',
-                'message': f"{username} left the group",
-                'username': 'SYSTEM',
-                'group': current_group
-            }
-            self._broadcast_to_group(current_group, leave_data, None)
-
-            # Broadcast updated members list to remaining members
-            self._broadcast_members_update(current_group)
-
-            # Delete group if empty (but not General group)
-            if len(self.groups[current_group]['members']) == 0 and current_group != self.GENERAL_GROUP:
-                del self.groups[current_group]
-                self.logger.info(f"Group {current_group} deleted (empty)")
+            self._remove_member(current_group, session)
+            self._delete_group_if_empty(current_group)
 
         # If leaving a non-General group, rejoin General group
         if current_group != self.GENERAL_GROUP:
             # Add user back to General group
-            self.groups[self.GENERAL_GROUP]['members'].add(client_address)
-            self.user_current_group[client_address] = self.GENERAL_GROUP
-
-            # Notify General group members
-            join_data = {
-                'type': 'system',
-                'message': f"{username} joined the group",
-                'username': 'SYSTEM',
-                'group_name': self.GENERAL_GROUP
-            }
-            self._broadcast_to_group(self.GENERAL_GROUP, join_data, None)
-
-            # Broadcast updated members list to General group
-            self._broadcast_members_update(self.GENERAL_GROUP)
+            self._add_member(self.GENERAL_GROUP, session)
+            session.group_name = self.GENERAL_GROUP
 
             self.logger.info(f"{username} left group {current_group} and rejoined {self.GENERAL_GROUP}")
 
             # Get General group members
-            members = [self._get_username(addr) for addr in self.groups[self.GENERAL_GROUP]['members']]
+            members = self._get_member_names(self.GENERAL_GROUP)
 
             return {
                 'status': 'success',
                 'message': 'Left group and rejoined General',
                 'group_name': self.GENERAL_GROUP,
-                'members': members
+                'members': members,
+                'member_version': self.groups[self.GENERAL_GROUP]['member_version']
             }
         else:
             # Leaving General group (shouldn't happen normally)
-            del self.user_current_group[client_address]
+            session.group_name = None
             self.logger.info(f"{username} left group {current_group}")
 
             return {
@@ -495,9 +1135,9 @@ class ChatServer:
                 'message': 'Left group successfully'
             }
 
-    def _handle_get_group_members(self, params: Dict[str, Any], client_socket: socket.socket, client_address: Tuple[str, int]) -> Dict[str, Any]:
-        """Get members of current group"""
-        current_group = self.user_current_group.get(client_address)
+    def _handle_get_group_members(self, params: Dict[str, Any], session: Session) -> Union[Dict[str, Any], bytes]:
+        """Get members of current group, or not_modified when if_version is still current"""
+        current_group = session.group_name
 
         if not current_group or current_group not in self.groups:
             return {
@@ -505,58 +1145,429 @@ class ChatServer:
                 'message': 'Not in any group'
             }
 
-        members = [self._get_username(addr) for addr in self.groups[current_group]['members']]
+        group = self.groups[current_group]
+        if params.get('if_version') == group['member_version']:
+            return {
+                'status': 'success',
+                'group_name': current_group,
+                'not_modified': True,
+                'member_version': group['member_version']
+            }
 
-        return {
-            'status': 'success',
-            'group_name': current_group,
-            'members': members,
-            'count': len(members)
-        }
+        if group['members_response'] is None:
+            members = self._get_member_names(current_group)
+            group['members_response'] = json.dumps({
+                'status': 'success',
+                'group_name': current_group,
+                'members': members,
+                'member_version': group['member_version'],
+                'count': len(members)
+            }).encode('utf-8')
+        return group['members_response']
+
+    def _handle_get_groups(self, params: Dict[str, Any], session: Session) -> Dict[str, Any]:
+        """Get a page of the public group directory, optionally filtered by name prefix"""
+        if params.get('if_version') == self.directory_version:
+            return {
+                'status': 'success',
+                'not_modified': True,
+                'version': self.directory_version
+            }
+
+        try:
+            offset = max(0, int(params.get('offset', 0)))
+            limit = int(params.get('limit', ChatServerConfig.DIRECTORY_DEFAULT_LIMIT))
+        except (TypeError, ValueError):
+            return {
+                'status': 'error',
+                'message': 'offset and limit must be integers'
+            }
+        limit = max(1, min(limit, ChatServerConfig.DIRECTORY_MAX_LIMIT))
+
+        prefix = params.get('prefix', '')
+        prefix = prefix.casefold() if isinstance(prefix, str) else ''
+
+        # Groups matching the prefix form one contiguous slice of the sorted directory
+        start = bisect.bisect_left(self.group_directory, (prefix,))
+        stem = prefix.rstrip(chr(sys.maxunicode))  # The last code point has no successor
+        if stem:
+            end = bisect.bisect_left(self.group_directory, (stem[:-1] + chr(ord(stem[-1]) + 1),), start)
+        else:
+            end = len(self.group_directory)
 
-    def _handle_get_groups(self, params: Dict[str, Any], client_socket: socket.socket, client_address: Tuple[str, int]) -> Dict[str, Any]:
-        """Get list of all groups"""
         groups_list = []
-        for group_name, group_data in self.groups.items():
+        for _, group_name in self.group_directory[start + offset:min(end, start + offset + limit)]:
+            group_data = self.groups[group_name]
             groups_list.append({
                 'name': group_name,
                 'creator': group_data['creator'],
-                'member_count': len(group_data['members'])
+                'member_count': len(group_data['members']) + len(group_data['remote_members'])
             })
 
         return {
             'status': 'success',
             'groups': groups_list,
-            'count': len(groups_list)
+            'count': len(groups_list),
+            'total': end - start,
+            'offset': offset,
+            'limit': limit,
+            'version': self.directory_version
+        }
+
+    def _handle_search_messages(self, params: Dict[str, Any], session: Session) -> Dict[str, Any]:
+        """Full-text search over retained group history, newest matches first"""
+        query = params.get('query', '')
+        if not isinstance(query, str) or not query.strip():
+            return {
+                'status': 'error',
+                'message': 'Search query cannot be empty'
+            }
+
+        try:
+            limit = int(params.get('limit', ChatServerConfig.SEARCH_DEFAULT_LIMIT))
+        except (TypeError, ValueError):
+            limit = ChatServerConfig.SEARCH_DEFAULT_LIMIT
+        limit = max(1, min(limit, ChatServerConfig.SEARCH_MAX_LIMIT))
+
+        group_name = params.get('group_name')
+        if group_name is not None and not isinstance(group_name, str):
+            return {
+                'status': 'error',
+                'message': 'group_name must be a string',
+                'code': ErrorCodes.INVALID_PARAMS
+            }
+        if group_name and group_name not in self.groups:
+            return {
+                'status': 'error',
+                'message': 'Group not found'
+            }
+        if group_name:
+            self._ensure_restored(group_name)
+        # Without a group only indexed history is searched; _load_restored_groups indexes the rest a slice at a time
+        group_names = [group_name] if group_name else None
+
+        results = []
+        for match_group, seq in self.search_index.search(query, group_names, limit):
+            history = self.groups[match_group]['message_history']
+            # History holds consecutive sequence numbers, so the record is found by offset
+            msg_record = history[seq - history[0]['seq']]
+            results.append({
+                'group_name': match_group,
+                'seq': seq,
+                'message': msg_record['message'],
+                'username': msg_record['username'],
+                'timestamp': msg_record['timestamp'],
+                'is_own_message': msg_record['sender_id'] == session.id
+            })
+
+        return {
+            'status': 'success',
+            'query': query,
+            'results': results,
+            'count': len(results),
+            'partial': not group_name and bool(self.pending_restore)
+        }
+
+    def _handle_send_direct_message(self, params: Dict[str, Any], session: Session) -> Dict[str, Any]:
+        """Send a private message straight to the peer's connection"""
+        message = params.get('message', '')
+        peer = params.get('to', '')
+
+        if not self._validate_message(message):
+            return {
+                'status': 'error',
+                'message': 'Message cannot be empty or too long'
+            }
+
+        username = session.username
+        if username is None:
+            return {
+                'status': 'error',
+                'message': 'Join the chat before sending direct messages'
+            }
+
+        if peer == username or not self._is_known_user(peer):
+            return {
+                'status': 'error',
+                'message': f'User "{peer}" not found'
+            }
+
+        channel = self.direct_messages.get(username, peer)
+        record = channel.append(username, message.strip(), time.time())
+        self._log_state(('direct', username, peer, record[2], record[3]))
+
+        # A detached peer picks the message up from get_direct_history after resuming
+        peer_session = self.user_sessions.get(peer)
+        if peer_session is not None:
+            self.rpc_server.send_json_to_client(peer_session, self._format_direct_record(channel, record, peer), Lane.BULK)
+        elif peer in self.remote_users:
+            self.cluster.forward_direct(self.remote_users[peer], username, peer, record[3], record[2])
+
+        return {
+            'status': 'success',
+            'message': 'Message sent successfully',
+            'to': peer,
+            'seq': record[0]
         }
 
-    def _broadcast_to_group(self, group_name: str, data: Dict[str, Any], exclude_socket: socket.socket = None):
-        """Broadcast message to all members of a group"""
+    def _handle_get_direct_history(self, params: Dict[str, Any], session: Session) -> Dict[str, Any]:
+        """Open a direct-message conversation and return its history"""
+        peer = params.get('with', '')
+        username = session.username
+
+        if username is None or peer == username or not self._is_known_user(peer):
+            return {
+                'status': 'error',
+                'message': f'User "{peer}" not found'
+            }
+
+        channel = self.direct_messages.find(username, peer)
+        return {
+            'status': 'success',
+            'direct_peer': peer,
+            'message_history': [self._format_direct_record(channel, record, username)
+                                for record in channel.history] if channel else []
+        }
+
+    def _handle_begin_upload(self, params: Dict[str, Any], session: Session) -> Dict[str, Any]:
+        """Declare a file to share with the current group; its bytes follow on a transfer connection"""
+        sha256 = params.get('sha256')
+        size = params.get('size')
+        file_name = os.path.basename(str(params.get('file_name', '')))[:ChatServerConfig.MAX_FILE_NAME_LENGTH]
+
+        if session.username is None or session.group_name not in self.groups:
+            return {
+                'status': 'error',
+                'message': 'Join a group before sharing files'
+            }
+
+        if (not isinstance(sha256, str) or not SHA256_HEX.match(sha256) or not isinstance(size, int)
+                or not 0 < size <= ChatServerConfig.ATTACHMENT_MAX_SIZE or not file_name):
+            return {
+                'status': 'error',
+                'message': 'Invalid attachment'
+            }
+
+        if self.attachments.has(sha256):
+            # Same content already stored, nothing to transfer
+            self._announce_attachment(sha256, file_name, size, session.username, session.group_name)
+            return {
+                'status': 'success',
+                'attachment_id': sha256,
+                'complete': True
+            }
+
+        upload = self.attachments.begin_upload(sha256, file_name, size, session.username, session.group_name)
+        return {
+            'status': 'success',
+            'attachment_id': sha256,
+            'upload_id': upload.upload_id,
+            'offset': upload.received
+        }
+
+    def _on_upload_complete(self, upload: PendingUpload) -> None:
+        self._announce_attachment(upload.sha256, upload.file_name, upload.size, upload.username, upload.group_name)
+
+    def _announce_attachment(self, sha256: str, file_name: str, size: int, username: str, group_name: str) -> None:
         if group_name not in self.groups:
             return
+        self.logger.info(f"{username} shared {file_name} ({size} bytes) in {group_name}")
+        self._broadcast_to_group(group_name, {
+            'type': 'attachment',
+            'attachment_id': sha256,
+            'file_name': file_name,
+            'size': size,
+            'username': username,
+            'group_name': group_name
+        })
+
+    def _is_known_user(self, username: Any) -> bool:
+        return isinstance(username, str) and (username in self.user_sessions or username in self.reserved_usernames
+                                              or username in self.remote_users)
+
+    def _format_direct_record(self, channel: DirectChannel, record: DirectRecord, viewer: str) -> Dict[str, Any]:
+        """Convert a direct-message record to client format as seen by viewer"""
+        seq, _, timestamp, text = record
+        sender = channel.sender_of(record)
+        return {
+            'type': 'direct_message',
+            'message': text,
+            'username': sender,
+            'timestamp': timestamp,
+            'seq': seq,
+            'is_own_message': sender == viewer,
+            'direct_peer': channel.users[1] if channel.users[0] == viewer else channel.users[0]
+        }
 
-        for member_address in self.groups[group_name]['members']:
-            # Find the socket for this address
-            for client_socket, addr in self.rpc_server.clients.items():
-                if addr == member_address and client_socket != exclude_socket:
-                    try:
-                        self.rpc_server.send_json_to_client(client_socket, data)
-                    except Exception as e:
-                        self.logger.error(f"Error broadcasting to {member_address}: {e}")
-
-    def _broadcast_members_update(self, group_name: str):
-        """Broadcast updated members list to all members of a group"""
+    def _broadcast_to_group(self, group_name: str, data: Dict[str, Any], exclude: Optional[Session] = None,
+                            lane: Lane = Lane.BULK):
+        """Broadcast message to all members of a group.
+
+        Groups larger than FANOUT_CHUNK_SIZE are handed to the fan-out scheduler
+        and delivered over several loop iterations; so is anything sent to a
+        group that still has a fan-out queued, to keep its messages in order.
+        """
         if group_name not in self.groups:
             return
+        self._broadcast_to_sessions(group_name, self.groups[group_name]['members'], data, exclude, lane)
+
+    def _broadcast_to_sessions(self, key: str, session_ids: Set[int], data: Dict[str, Any],
+                               exclude: Optional[Session] = None, lane: Lane = Lane.BULK):
+        """Encode data once and send it to session_ids, through the fan-out queue for key when large"""
+        payload = json.dumps(data).encode('utf-8')
+        self.rpc_server.recorder.record('broadcast', exclude.id if exclude else None, key, len(session_ids))
+        if len(session_ids) > ChatServerConfig.FANOUT_CHUNK_SIZE or self.fanout.is_busy(key):
+            self.fanout.submit(key, list(session_ids), payload, exclude.id if exclude else None, lane)
+            return
 
-        # Get current members list
-        members = [self._get_username(addr) for addr in self.groups[group_name]['members']]
+        clients = self.rpc_server.clients
+        for session_id in session_ids:
+            client = clients.get(session_id)
+            if client is not None and client is not exclude:
+                self.rpc_server.send_encoded(client, payload, lane)
+
+    def _add_member(self, group_name: str, session: Session) -> None:
+        group = self.groups[group_name]
+        if session.id in group['members']:
+            return
+        group['members'].add(session.id)
+        self._bump_member_version(group)
+        self._queue_presence(group_name, self._get_username(session), True)
+        if self.cluster:
+            self.cluster.publish_member(group_name, self._get_username(session), True)
+
+    def _remove_member(self, group_name: str, session: Session) -> None:
+        group = self.groups[group_name]
+        if session.id not in group['members']:
+            return
+        group['members'].discard(session.id)
+        self._bump_member_version(group)
+        self._queue_presence(group_name, self._get_username(session), False)
+        if self.cluster:
+            self.cluster.publish_member(group_name, self._get_username(session), False)
+
+    def _bump_member_version(self, group: Dict[str, Any]) -> None:
+        group['member_version'] += 1
+        group['member_names'] = group['members_response'] = None
+
+    def _get_member_names(self, group_name: str) -> List[str]:
+        """Member names of a group, cached until the next membership change"""
+        group = self.groups[group_name]
+        if group['member_names'] is None:
+            clients = self.rpc_server.clients
+            group['member_names'] = [self._get_username(clients[member_id]) for member_id in group['members']
+                                     if member_id in clients] + list(group['remote_members'])
+        return group['member_names']
+
+    def _queue_presence(self, group_name: str, username: str, joined: bool) -> None:
+        """Buffer a join/leave for the group's next presence flush.
+
+        A join and leave of the same user inside one interval cancel out. The
+        first change after a quiet interval is flushed at once so single joins
+        stay prompt; bursts are aggregated until PRESENCE_FLUSH_INTERVAL passes.
+        """
+        pending = self.pending_presence.setdefault(group_name, {})
+        if pending.get(username, joined) != joined:
+            del pending[username]
+        else:
+            pending[username] = joined
+
+        group = self.groups[group_name]
+        remaining = group['presence_flushed_at'] + ChatServerConfig.PRESENCE_FLUSH_INTERVAL - time.time()
+        if remaining <= 0:
+            self._flush_presence(group_name)
+        elif group_name not in self.presence_timers:
+            self.presence_timers[group_name] = self.rpc_server.call_later(remaining, self._flush_presence, group_name)
+
+    def _queue_user_presence(self, username: str, online: bool) -> None:
+        """Buffer a username going online/offline for the next users_delta.
+
+        Unlike group presence, opposite changes are not cancelled out: each
+        delta carries every touched user's latest state, so a subscriber whose
+        snapshot was taken between two flushes can apply it as well.
+        """
+        self.users_version += 1
+        if not self.presence_subscribers:
+            # Nobody to tell; a later subscriber starts from a fresh snapshot
+            self.pending_users.clear()
+            self.users_flushed_version = self.users_version
+            return
 
-        # Broadcast to all members
+        self.pending_users[username] = online
+        remaining = self.users_flushed_at + ChatServerConfig.PRESENCE_FLUSH_INTERVAL - time.time()
+        if remaining <= 0:
+            self._flush_user_presence()
+        elif self.users_timer is None:
+            self.users_timer = self.rpc_server.call_later(remaining, self._flush_user_presence)
+
+    def _flush_user_presence(self) -> None:
+        if self.users_timer is not None:
+            self.users_timer.cancel()
+            self.users_timer = None
+        pending, self.pending_users = self.pending_users, {}
+        self.users_flushed_at = time.time()
+        if not pending:
+            return
+
+        users_data = {
+            'type': 'users_delta',
+            'added': [username for username, online in pending.items() if online],
+            'removed': [username for username, online in pending.items() if not online],
+            'base_version': self.users_flushed_version,
+            'users_version': self.users_version,
+            'count': len(self.user_sessions) + len(self.remote_users)
+        }
+        self.users_flushed_version = self.users_version
+        self._broadcast_to_sessions(self.PRESENCE_FANOUT_KEY, self.presence_subscribers, users_data, None, Lane.CONTROL)
+
+    def _flush_presence(self, group_name: str) -> None:
+        timer = self.presence_timers.pop(group_name, None)
+        if timer is not None:
+            timer.cancel()
+        pending = self.pending_presence.pop(group_name, {})
+        group = self.groups[group_name]
+        group['presence_flushed_at'] = time.time()
+
+        added = [username for username, joined in pending.items() if joined]
+        removed = [username for username, joined in pending.items() if not joined]
+        if not added and not removed:
+            return
+
+        self._broadcast_members_delta(group_name, added, removed)
+        group['flushed_version'] = group['member_version']
+
+    def _format_presence_message(self, added: List[str], removed: List[str]) -> str:
+        parts = []
+        for names, single, plural in ((added, Messages.Chat.USER_JOINED, Messages.Chat.USERS_JOINED),
+                                      (removed, Messages.Chat.USER_LEFT, Messages.Chat.USERS_LEFT)):
+            if len(names) == 1:
+                parts.append(single.format(username=names[0]))
+            elif names:
+                parts.append(plural.format(usernames=self._format_name_list(names)))
+        return ' '.join(parts)
+
+    def _format_name_list(self, names: List[str]) -> str:
+        shown = names[:ChatServerConfig.PRESENCE_NAMES_SHOWN]
+        hidden = len(names) - len(shown)
+        if hidden:
+            return f"{', '.join(shown)} and {hidden} others"
+        return f"{', '.join(shown[:-1])} and {shown[-1]}"
+
+    def _broadcast_members_delta(self, group_name: str, added: List[str], removed: List[str]):
+        """Send one aggregated presence event to group members.
+
+        Clients apply the delta when their version equals base_version, and call
+        get_group_members for the full list when they detect a gap.
+        """
+        group = self.groups[group_name]
         members_data = {
-            'type': 'members_update',
+            'type': 'members_delta',
             'group_name': group_name,
-            'members': members,
-            'count': len(members)
+            'added': added,
+            'removed': removed,
+            'base_version': group['flushed_version'],
+            'member_version': group['member_version'],
+            'count': len(group['members']) + len(group['remote_members']),
+            'message': self._format_presence_message(added, removed)
         }
-        self._broadcast_to_group(group_name, members_data, None)
+        self._broadcast_to_group(group_name, members_data, None, Lane.CONTROL)
@@ -0,0 +1,240 @@
+import hmac
+import json
+import time
+import errno
+import socket
+import hashlib
+import logging
+import secrets
+from typing import Any, Dict, List, Optional, Tuple
+
+from constants import ChatServerConfig
+from session import Session
+
+# Link frames are compact JSON objects, one per line, keyed by 't':
+#   hello   {node, users, groups: [[name, creator]], members: [[group, username]]}  - full state on link up
+#   user    {name, online}                  - a username came online / went offline on the sender
+#   group   {name, creator, exists}         - group created / deleted
+#   member  {group, name, joined}           - a user on the sender joined / left a group
+#   msg     {group, name, text, ts}         - group message, sent only to nodes with members in the group
+#   dm      {from, to, text, ts}            - direct message, sent only to the recipient's node
+
+
+class PeerLink:
+    """Stream object for one connection to another cluster node"""
+
+    def __init__(self, node: 'ClusterNode', session: Session, peer_id: str, connecting: bool = False):
+        self.node = node
+        self.session = session
+        self.peer_id = peer_id
+        self.connecting = connecting  # Dialed without blocking; writable once connected
+        self.inbound = b''
+        self.outbound = bytearray()
+
+    def send(self, frame: Dict[str, Any]) -> None:
+        self.outbound += json.dumps(frame, separators=(',', ':')).encode('utf-8') + b'\n'
+        if len(self.outbound) > ChatServerConfig.CLUSTER_MAX_OUTBOUND_BYTES:
+            self.node.logger.warning(f"Dropping link to {self.peer_id}: {len(self.outbound)} bytes waiting")
+            self.node.rpc_server.close_later(self.session)
+            return
+        if not self.connecting:
+            self.on_writable()
+
+    def on_writable(self) -> None:
+        sock = self.session.socket
+        if self.connecting:
+            error = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+            if error:
+                self.node.logger.info(f"Could not reach node {self.peer_id}: {errno.errorcode.get(error, error)}")
+                self.node.rpc_server.close_later(self.session)
+                return
+            self.connecting = False
+            self.node.logger.info(f"Linked to node {self.peer_id}")
+
+        if self.outbound:
+            try:
+                sent = sock.send(self.outbound)
+            except BlockingIOError:
+                sent = 0
+            except OSError:
+                self.node.rpc_server.close_later(self.session)
+                return
+            del self.outbound[:sent]
+        self.node.rpc_server.set_write_interest(self.session, bool(self.outbound))
+
+    def on_readable(self) -> None:
+        try:
+            data = self.session.socket.recv(ChatServerConfig.CLUSTER_RECV_SIZE)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b''
+        if not data:
+            self.node.rpc_server.close_later(self.session)
+            return
+
+        *frames, self.inbound = (self.inbound + data).split(b'\n')
+        for frame in frames:
+            try:
+                self.node.handle_frame(self, json.loads(frame))
+            except Exception as e:
+                self.node.logger.error(f"Bad frame from node {self.peer_id}: {e}")
+
+    def close(self) -> None:
+        self.node.link_lost(self)
+
+
+class ClusterNode:
+    """Joins this ChatServer to a full mesh of peer nodes.
+
+    Peers connect to each other's client port and open the link with a
+    ``PEER <node_id> <timestamp> <nonce> <mac>`` header line (see link_mac), so
+    the link shares the event loop and selector with the clients. The secret
+    itself never crosses the network, but link frames are not encrypted. Of
+    each pair, the node with the larger id dials. Users, group existence and
+    group membership are replicated to every peer; group messages go only to
+    the nodes that have members in the group.
+    """
+
+    def __init__(self, chat_server, rpc_server, node_id: str, peers: Dict[str, Tuple[str, int]], secret: str):
+        self.chat_server = chat_server
+        self.rpc_server = rpc_server
+        self.node_id = node_id
+        self.peers = peers  # node id -> (host, port) of its client listener
+        self.secret = secret
+        self.links: Dict[str, PeerLink] = {}
+        self.seen_nonces: Dict[str, float] = {}  # PEER header nonce -> when it was accepted, against replays
+        self.frames_forwarded = 0
+        self.logger = logging.getLogger(f"{self.__class__.__name__}")
+        rpc_server.register_stream_handler('PEER', self._accept_link)
+        rpc_server.call_soon(self.dial_peers)
+        rpc_server.call_every(ChatServerConfig.CLUSTER_RECONNECT_INTERVAL, self.dial_peers)
+        chat_server.cluster = self
+
+    def dial_peers(self) -> None:
+        """Connect to the unlinked peers this node is responsible for (those with a smaller id)"""
+        for peer_id, address in self.peers.items():
+            if peer_id < self.node_id and peer_id not in self.links:
+                self._dial(peer_id, address)
+
+    def _dial(self, peer_id: str, address: Tuple[str, int]) -> None:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setblocking(False)
+        error = sock.connect_ex(address)
+        if error not in (0, errno.EINPROGRESS):
+            sock.close()
+            return
+
+        session = self.rpc_server.add_connection(sock, address)
+        link = PeerLink(self, session, peer_id, connecting=True)
+        session.stream = link
+        timestamp, nonce = f"{time.time():.3f}", secrets.token_hex(16)
+        mac = self.link_mac(self.node_id, peer_id, timestamp, nonce)
+        link.outbound += f"PEER {self.node_id} {timestamp} {nonce} {mac}\n".encode('utf-8')
+        self._link_up(link)
+        self.rpc_server.set_write_interest(session, True)
+
+    def link_mac(self, dialer: str, acceptor: str, timestamp: str, nonce: str) -> str:
+        """Proof of the shared secret for one link attempt from dialer to acceptor"""
+        message = f"{dialer} {acceptor} {timestamp} {nonce}".encode('utf-8')
+        return hmac.new(self.secret.encode('utf-8'), message, hashlib.sha256).hexdigest()
+
+    def _accept_link(self, session: Session, args: List[str]) -> Optional[PeerLink]:
+        """Stream handler for ``PEER <node_id> <timestamp> <nonce> <mac>``"""
+        if not self._authenticate(args):
+            self.logger.warning(f"Refused cluster link from {session.address}")
+            return None
+        link = PeerLink(self, session, args[0])
+        self.logger.info(f"Node {args[0]} linked from {session.address}")
+        self._link_up(link)
+        return link
+
+    def _authenticate(self, args: List[str]) -> bool:
+        """Check a PEER header: a configured node, a fresh timestamp, an unused nonce and the right MAC"""
+        if len(args) != 4 or args[0] not in self.peers:
+            return False
+        peer_id, timestamp, nonce, mac = args
+        now = time.time()
+        try:
+            if abs(now - float(timestamp)) > ChatServerConfig.CLUSTER_AUTH_WINDOW:
+                return False
+        except ValueError:
+            return False
+        expected = self.link_mac(peer_id, self.node_id, timestamp, nonce)
+        if not hmac.compare_digest(mac.encode('utf-8'), expected.encode('ascii')):
+            return False
+
+        for seen, accepted_at in list(self.seen_nonces.items()):
+            if now - accepted_at > ChatServerConfig.CLUSTER_AUTH_WINDOW * 2:  # Its timestamp is stale by now
+                del self.seen_nonces[seen]
+        if nonce in self.seen_nonces:
+            return False  # A recorded header sent again
+        self.seen_nonces[nonce] = now
+        return True
+
+    def _link_up(self, link: PeerLink) -> None:
+        old = self.links.get(link.peer_id)
+        if old is not None:
+            self.rpc_server.close_later(old.session)
+        self.links[link.peer_id] = link
+        hello = self.chat_server.cluster_state()
+        hello.update(t='hello', node=self.node_id)
+        link.send(hello)
+
+    def link_lost(self, link: PeerLink) -> None:
+        if self.links.get(link.peer_id) is not link:
+            return
+        del self.links[link.peer_id]
+        self.logger.info(f"Lost link to node {link.peer_id}")
+        self.chat_server.drop_remote_node(link.peer_id)
+
+    def handle_frame(self, link: PeerLink, frame: Dict[str, Any]) -> None:
+        kind = frame['t']
+        node = link.peer_id
+        chat = self.chat_server
+        if kind == 'msg':
+            chat.deliver_remote_message(frame['group'], frame['name'], frame['text'], frame['ts'])
+        elif kind == 'member':
+            chat.apply_remote_member(node, frame['group'], frame['name'], frame['joined'])
+        elif kind == 'user':
+            chat.apply_remote_user(node, frame['name'], frame['online'])
+        elif kind == 'group':
+            chat.apply_remote_group(frame['name'], frame['creator'], frame['exists'])
+        elif kind == 'dm':
+            chat.deliver_remote_direct(frame['from'], frame['to'], frame['text'], frame['ts'])
+        elif kind == 'hello':
+            chat.drop_remote_node(node)  # Replaced wholesale by the new state
+            for name, creator in frame['groups']:
+                chat.apply_remote_group(name, creator, True)
+            for name in frame['users']:
+                chat.apply_remote_user(node, name, True)
+            for group_name, name in frame['members']:
+                chat.apply_remote_member(node, group_name, name, True)
+
+    def _send_all(self, frame: Dict[str, Any]) -> None:
+        for link in self.links.values():
+            link.send(frame)
+
+    def publish_user(self, username: str, online: bool) -> None:
+        self._send_all({'t': 'user', 'name': username, 'online': online})
+
+    def publish_group(self, group_name: str, creator: str, exists: bool) -> None:
+        self._send_all({'t': 'group', 'name': group_name, 'creator': creator, 'exists': exists})
+
+    def publish_member(self, group_name: str, username: str, joined: bool) -> None:
+        self._send_all({'t': 'member', 'group': group_name, 'name': username, 'joined': joined})
+
+    def forward_message(self, group_name: str, nodes: set, username: str, text: str, timestamp: float) -> None:
+        """Send a group message to the nodes with members in the group, nowhere else"""
+        frame = None
+        for node in nodes:
+            link = self.links.get(node)
+            if link is not None:
+                frame = frame or {'t': 'msg', 'group': group_name, 'name': username, 'text': text, 'ts': timestamp}
+                link.send(frame)
+                self.frames_forwarded += 1
+
+    def forward_direct(self, node: str, sender: str, peer: str, text: str, timestamp: float) -> None:
+        link = self.links.get(node)
+        if link is not None:
+            link.send({'t': 'dm', 'from': sender, 'to': peer, 'text': text, 'ts': timestamp})
@@ -1,4 +1,4 @@
-from enum import Enum
+from enum import Enum, IntEnum
 
 
 class MessageType(Enum):
@@ -6,11 +6,28 @@ class MessageType(Enum):
     PLAIN_TEXT = "plain_text"
 
 
+class Lane(IntEnum):
+    """Outbound priority lane; control frames are flushed before bulk ones"""
+    CONTROL = 0  # RPC responses, errors and system events
+    BULK = 1  # Chat fan-out and direct messages
+
+
 class RpcServerConfig:
     DEFAULT_HOST = '127.0.0.1'
     DEFAULT_PORT = 65432
     MAX_CONNECTIONS = 10
     BUFFER_SIZE = 1024
+    MAX_REQUEST_SIZE = 64 * 1024  # Largest request a connection may send; a longer one closes it
+    MAX_OUTBOUND_BYTES = 8 * 1024 * 1024  # Unsent bytes after which a slow client is disconnected
+    CONTROL_BURST = 16  # Control frames sent in a row before one waiting bulk frame gets a turn
+    WRITE_BATCH = 64  # Frames gathered into one sendmsg call (well under IOV_MAX)
+    RATE_WINDOW = 10.0  # Seconds over which per-connection and per-group message rates are averaged
+    TRACE_FILE = "chat_trace.json"  # Chrome trace output of --trace-sample
+    TRACE_FLUSH_INTERVAL = 1.0  # Seconds between appends to the trace file
+    TRACE_MAX_BUFFERED_EVENTS = 100000  # Events kept between appends; more are dropped and counted
+    FLIGHT_RECORDER_SIZE = 4096  # Recent events kept for post-mortem dumps
+    FLIGHT_RECORDER_DIR = "flight_records"  # Where flight recorder dumps are written
+    STALL_THRESHOLD = 0.25  # Seconds; a slower loop iteration is recorded as a stall
     SOCKET_TIMEOUT = 30.0
 
 
@@ -18,6 +35,36 @@ class ChatServerConfig:
     DEFAULT_USERNAME_PREFIX = "User_"
     MAX_USERNAME_LENGTH = 50
     MAX_MESSAGE_LENGTH = 1000
+    MAX_HISTORY_LENGTH = 100
+    SEARCH_DEFAULT_LIMIT = 20
+    SEARCH_MAX_LIMIT = 100
+    SESSION_RESUME_TIMEOUT = 120.0  # Seconds a disconnected session stays resumable
+    PRESENCE_FLUSH_INTERVAL = 0.5  # Seconds between aggregated join/leave events per group
+    PRESENCE_NAMES_SHOWN = 3  # Names listed in an aggregated presence message
+    DIRECTORY_DEFAULT_LIMIT = 50
+    DIRECTORY_MAX_LIMIT = 200
+    MAX_DIRECT_HISTORY_LENGTH = 100
+    RESERVED_GROUP_PREFIX = "private_"  # Old-style private chat names, now served by direct messages
+    SNAPSHOT_DIR = "chat_state"  # None disables snapshots and restore
+    SNAPSHOT_INTERVAL = 60.0  # Seconds between state snapshots
+    RESTORE_SLICE_BUDGET = 0.005  # Seconds per loop iteration spent loading restored history
+    FANOUT_CHUNK_SIZE = 256  # Recipients per fan-out slice; larger groups are delivered over several loop iterations
+    FANOUT_TICK_BUDGET = 0.005  # Seconds per loop iteration spent on queued fan-out
+    ATTACHMENT_DIR = "attachments"  # Content-addressed store, files named by SHA-256
+    ATTACHMENT_MAX_SIZE = 1024 * 1024 * 1024
+    ATTACHMENT_CHUNK_SIZE = 256 * 1024  # Bytes moved per transfer connection per loop iteration
+    MAX_FILE_NAME_LENGTH = 255
+    HANDOFF_PATH = "chat_server.handoff"  # Unix socket a new server process connects to for a zero-downtime restart
+    HANDOFF_TIMEOUT = 30.0  # Seconds to wait on the other process during a handoff
+    CLUSTER_SECRET_ENV = "CHAT_CLUSTER_SECRET"  # Environment variable holding the shared cluster secret
+    ADMIN_TOKEN_ENV = "CHAT_ADMIN_TOKEN"  # Environment variable enabling the admin_* methods with this token
+    ADMIN_DEFAULT_LIMIT = 100  # Connections per admin_connections page
+    ADMIN_MAX_LIMIT = 1000
+    ADMIN_DEFAULT_TOP = 10  # Groups per admin_groups ranking
+    CLUSTER_RECONNECT_INTERVAL = 2.0  # Seconds between attempts to reach a peer node
+    CLUSTER_RECV_SIZE = 256 * 1024
+    CLUSTER_MAX_OUTBOUND_BYTES = 64 * 1024 * 1024  # A peer this far behind is dropped and resynced on reconnect
+    CLUSTER_AUTH_WINDOW = 30.0  # Seconds a PEER header's timestamp may differ from this node's clock
 
 
 class ClientConfig:
@@ -52,6 +99,8 @@ class Messages:
     class Chat:
         USER_JOINED = "{username} has joined the chat!"
         USER_LEFT = "{username} has left the chat!"
+        USERS_JOINED = "{usernames} have joined the chat!"
+        USERS_LEFT = "{usernames} have left the chat!"
         WELCOME_MESSAGE = "Welcome to the chat, {username}!"
 
     class Client:
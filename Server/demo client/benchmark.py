@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""Compare chat message throughput over loopback TCP and a Unix domain socket.
+
+By default a server is started in a temporary directory listening on both:
+
+    python benchmark.py --messages 20000
+
+Use --no-spawn to measure a server that is already running with --unix PATH.
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import tempfile
+import threading
+import subprocess
+
+SERVER_MAIN = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'main.py')
+
+
+class Counter:
+    """Reads a connection on a thread and counts replies of one kind"""
+
+    def __init__(self, sock, predicate):
+        self.sock = sock
+        self.predicate = predicate
+        self.count = 0
+        self.changed = threading.Condition()
+        self.thread = threading.Thread(target=self._read, daemon=True)
+        self.thread.start()
+
+    def _read(self):
+        decoder = json.JSONDecoder()
+        buffer = ""
+        while True:
+            try:
+                data = self.sock.recv(65536)
+            except OSError:
+                break
+            if not data:
+                break
+            buffer += data.decode('utf-8')
+            pos = 0
+            matched = 0
+            while True:
+                while pos < len(buffer) and buffer[pos].isspace():
+                    pos += 1
+                try:
+                    message, pos = decoder.raw_decode(buffer, pos)
+                except json.JSONDecodeError:
+                    break
+                matched += self.predicate(message)
+            buffer = buffer[pos:]
+            if matched:
+                with self.changed:
+                    self.count += matched
+                    self.changed.notify_all()
+
+    def wait_for(self, count, timeout=60.0):
+        with self.changed:
+            return self.changed.wait_for(lambda: self.count >= count, timeout)
+
+
+def connect(address):
+    if isinstance(address, str):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    else:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.connect(address)
+    return sock
+
+
+def request(method, params):
+    return json.dumps({'method': method, 'params': params}).encode('utf-8')
+
+
+def run(address, messages, window, group=None, receiver_address=None):
+    """Send messages from one client to another; return messages per second end to end.
+
+    With group, both clients move to a group of that name first instead of chatting in General.
+    """
+    sender, receiver = connect(address), connect(receiver_address or address)
+    tag = f"bench{os.getpid()}{time.monotonic_ns()}"
+    acks = Counter(sender, lambda m: m.get('message') == 'Message sent successfully')
+    delivered = Counter(receiver, lambda m: m.get('type') == 'message' and m.get('message', '').startswith(tag))
+    sender.sendall(request('join_chat', {'username': f'{tag}_s'}))
+    receiver.sendall(request('join_chat', {'username': f'{tag}_r'}))
+    if group:
+        time.sleep(0.5)
+        sender.sendall(request('create_group', {'group_name': group}))
+        time.sleep(0.5)
+        receiver.sendall(request('join_group', {'group_name': group}))
+    time.sleep(0.5)
+
+    payload = request('send_message', {'message': f'{tag} hello'})
+    started = time.perf_counter()
+    for sent in range(messages):
+        if sent >= window:
+            acks.wait_for(sent - window + 1)  # Keep at most window requests in flight
+        sender.sendall(payload)
+    if not delivered.wait_for(messages):
+        raise RuntimeError(f"Only {delivered.count} of {messages} messages arrived")
+    elapsed = time.perf_counter() - started
+
+    sender.close()
+    receiver.close()
+    return messages / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--messages', type=int, default=10000)
+    parser.add_argument('--window', type=int, default=64, help="requests in flight per sender")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=65433)
+    parser.add_argument('--unix', default=None, help="Unix socket path (default: inside the temporary directory)")
+    parser.add_argument('--no-spawn', action='store_true', help="use a server that is already running")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='chat-bench-')
+    unix_path = args.unix or os.path.join(workdir, 'chat.sock')
+    server = None
+    if not args.no_spawn:
+        server = subprocess.Popen([sys.executable, os.path.abspath(SERVER_MAIN), '--port', str(args.port),
+                                   '--unix', unix_path], cwd=workdir,
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        time.sleep(1.0)
+
+    try:
+        results = {}
+        for name, address in (('TCP', (args.host, args.port)), ('UDS', unix_path)):
+            results[name] = run(address, args.messages, args.window)
+            print(f"{name}: {results[name]:,.0f} messages/s")
+        print(f"UDS / TCP: {results['UDS'] / results['TCP']:.2f}x")
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""Measure how group-local message throughput scales with cluster size.
+
+Starts --nodes server processes on localhost as one cluster and runs a
+sender/receiver pair on every node at once, each pair in its own group, so
+no message has to cross nodes. It does the same with a single node first:
+
+    python cluster_benchmark.py --nodes 3 --messages 10000
+
+Pass --cross to put each pair's receiver on the next node instead, which
+measures forwarding between nodes.
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmark import SERVER_MAIN, run
+
+
+def start_cluster(count, base_port):
+    ports = {f'n{i}': base_port + i for i in range(count)}
+    env = dict(os.environ, CHAT_CLUSTER_SECRET=f'bench{os.getpid()}')
+    servers = []
+    for node_id, port in ports.items():
+        command = [sys.executable, os.path.abspath(SERVER_MAIN), '--port', str(port), '--node-id', node_id]
+        for peer_id, peer_port in ports.items():
+            if peer_id != node_id:
+                command += ['--peer', f'{peer_id}=127.0.0.1:{peer_port}']
+        servers.append(subprocess.Popen(command, cwd=tempfile.mkdtemp(prefix=f'chat-{node_id}-'), env=env,
+                                        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))
+    time.sleep(3.0)  # Long enough for nodes that missed a peer at startup to dial it again
+    return list(ports.values()), servers
+
+
+def measure(count, args):
+    """Aggregate messages/s of one pair per node running concurrently"""
+    ports, servers = start_cluster(count, args.port)
+    try:
+        with ThreadPoolExecutor(count) as pool:
+            jobs = []
+            for index, port in enumerate(ports):
+                receiver_port = ports[(index + 1) % count] if args.cross else port
+                jobs.append(pool.submit(run, (args.host, port), args.messages, args.window,
+                                        f'bench_{count}_{index}', (args.host, receiver_port)))
+            return sum(job.result() for job in jobs)
+    finally:
+        for server in servers:
+            server.terminate()
+            server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--nodes', type=int, default=3)
+    parser.add_argument('--messages', type=int, default=10000, help="messages per pair")
+    parser.add_argument('--window', type=int, default=64, help="requests in flight per sender")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=65440, help="first node's port; the others follow")
+    parser.add_argument('--cross', action='store_true', help="receive on the next node instead of the same one")
+    args = parser.parse_args()
+
+    single = measure(1, args)
+    print(f"1 node: {single:,.0f} messages/s")
+    total = measure(args.nodes, args)
+    print(f"{args.nodes} nodes: {total:,.0f} messages/s ({total / single:.2f}x)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+from collections import deque
+from typing import Deque, Dict, Optional, Set, Tuple
+
+from constants import ChatServerConfig
+
+
+# (seq, sender_index, timestamp, text) - sender_index is 0 or 1 into DirectChannel.users
+DirectRecord = Tuple[int, int, float, str]
+
+
+class DirectChannel:
+    """Conversation between exactly two users, history kept as compact tuples"""
+    __slots__ = ('users', 'history', 'next_seq')
+
+    def __init__(self, users: Tuple[str, str]):
+        self.users = users
+        self.history: Deque[DirectRecord] = deque(maxlen=ChatServerConfig.MAX_DIRECT_HISTORY_LENGTH)
+        self.next_seq = 1
+
+    def append(self, sender: str, text: str, timestamp: float) -> DirectRecord:
+        record = (self.next_seq, self.users.index(sender), timestamp, text)
+        self.next_seq += 1
+        self.history.append(record)
+        return record
+
+    def sender_of(self, record: DirectRecord) -> str:
+        return self.users[record[1]]
+
+
+class DirectMessageStore:
+    """Direct-message channels keyed by the canonical (sorted) username pair"""
+
+    def __init__(self):
+        self.channels: Dict[Tuple[str, str], DirectChannel] = {}
+        self.by_user: Dict[str, Set[Tuple[str, str]]] = {}  # username -> keys of the channels it is in
+
+    @staticmethod
+    def channel_key(user_a: str, user_b: str) -> Tuple[str, str]:
+        return (user_a, user_b) if user_a <= user_b else (user_b, user_a)
+
+    def get(self, user_a: str, user_b: str) -> DirectChannel:
+        key = self.channel_key(user_a, user_b)
+        channel = self.channels.get(key)
+        if channel is None:
+            channel = self.channels[key] = DirectChannel(key)
+            for username in key:
+                self.by_user.setdefault(username, set()).add(key)
+        return channel
+
+    def find(self, user_a: str, user_b: str) -> Optional[DirectChannel]:
+        """The channel between two users if they ever exchanged a message; never creates one"""
+        return self.channels.get(self.channel_key(user_a, user_b))
+
+    def forget(self, username: str) -> bool:
+        """Drop every channel username is in; return whether there were any"""
+        keys = self.by_user.pop(username, None)
+        if not keys:
+            return False
+        for key in keys:
+            del self.channels[key]
+            for other in key:
+                if other != username:
+                    self.by_user[other].discard(key)
+                    if not self.by_user[other]:
+                        del self.by_user[other]
+        return True
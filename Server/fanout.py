@@ -0,0 +1,133 @@
+import time
+import logging
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+from constants import ChatServerConfig, Lane
+from tracing import Trace
+
+
+class FanoutJob:
+    """One encoded payload still to be delivered to part of a member list"""
+    __slots__ = ('member_ids', 'payload', 'exclude_id', 'lane', 'position', 'enqueued_at', 'started_at', 'trace')
+
+    def __init__(self, member_ids: List[int], payload: bytes, exclude_id: Optional[int], lane: Lane,
+                 trace: Optional[Trace] = None):
+        self.member_ids = member_ids
+        self.payload = payload
+        self.exclude_id = exclude_id
+        self.lane = lane
+        self.position = 0
+        self.enqueued_at = time.perf_counter()
+        self.started_at: Optional[float] = None
+        self.trace = trace  # Sampled request this broadcast belongs to
+
+
+class FanoutScheduler:
+    """Deliver large broadcasts in chunks spread over event-loop iterations.
+
+    Jobs are queued per key (the group name), so a group's messages keep their
+    order, and keys take turns one chunk at a time, so one busy group cannot
+    hold up the others. ``run`` stops after ``FANOUT_TICK_BUDGET`` seconds and
+    schedules itself with call_soon, so the loop reads sockets before the next slice.
+    """
+
+    def __init__(self, rpc_server):
+        self.rpc_server = rpc_server
+        self.queues: Dict[str, Deque[FanoutJob]] = {}
+        self.ready: Deque[str] = deque()  # Keys with queued jobs, in turn order
+        self.scheduled = False  # run() is queued with call_soon
+        self.jobs_submitted = 0
+        self.jobs_completed = 0
+        self.deliveries = 0
+        self.last_queue_delay = 0.0  # Seconds the last completed job waited before its first chunk
+        self.max_queue_delay = 0.0
+        self.last_duration = 0.0  # Seconds from submit to last delivery of the last completed job
+        self.logger = logging.getLogger(f"{self.__class__.__name__}")
+
+    def is_busy(self, key: str) -> bool:
+        return key in self.queues
+
+    def submit(self, key: str, member_ids: List[int], payload: bytes, exclude_id: Optional[int] = None,
+               lane: Lane = Lane.BULK) -> None:
+        queue = self.queues.get(key)
+        if queue is None:
+            queue = self.queues[key] = deque()
+            self.ready.append(key)
+        tracer = self.rpc_server.tracer
+        trace = tracer.current if tracer is not None else None
+        if trace is not None:
+            tracer.fanout_enqueued(trace, key, len(member_ids))
+        queue.append(FanoutJob(member_ids, payload, exclude_id, lane, trace))
+        self.jobs_submitted += 1
+        if not self.scheduled:
+            self.scheduled = True
+            self.rpc_server.call_soon(self.run)
+
+    def cancel(self, key: str) -> None:
+        """Drop undelivered jobs for key (e.g. the group was deleted)"""
+        if self.queues.pop(key, None) is not None:
+            self.ready.remove(key)
+
+    def run(self) -> None:
+        """Deliver chunks until the tick budget is spent, then wait for the next loop iteration if work remains"""
+        self.scheduled = False
+        deadline = time.perf_counter() + ChatServerConfig.FANOUT_TICK_BUDGET
+        while self.ready and time.perf_counter() < deadline:
+            key = self.ready.popleft()
+            queue = self.queues[key]
+            job = queue[0]
+            if self._deliver_chunk(job):
+                queue.popleft()
+                self._record_completion(key, job)
+            if queue:
+                self.ready.append(key)
+            else:
+                del self.queues[key]
+        if self.ready and not self.scheduled:
+            self.scheduled = True
+            self.rpc_server.call_soon(self.run)
+
+    def _deliver_chunk(self, job: FanoutJob) -> bool:
+        if job.started_at is None:
+            job.started_at = time.perf_counter()
+        tracer = self.rpc_server.tracer
+        if job.trace is not None:
+            tracer.current = job.trace  # Frames queued below are followed until written
+            chunk_started = tracer.timestamp()
+
+        clients = self.rpc_server.clients
+        end = job.position + ChatServerConfig.FANOUT_CHUNK_SIZE
+        delivered = self.deliveries
+        for member_id in job.member_ids[job.position:end]:
+            member = clients.get(member_id)
+            if member is not None and member_id != job.exclude_id:
+                self.rpc_server.send_encoded(member, job.payload, job.lane)
+                self.deliveries += 1
+        job.position = end
+
+        if job.trace is not None:
+            tracer.fanout_chunk(job.trace, chunk_started, self.deliveries - delivered)
+            tracer.current = None
+        return job.position >= len(job.member_ids)
+
+    def _record_completion(self, key: str, job: FanoutJob) -> None:
+        self.jobs_completed += 1
+        self.last_queue_delay = job.started_at - job.enqueued_at
+        self.max_queue_delay = max(self.max_queue_delay, self.last_queue_delay)
+        self.last_duration = time.perf_counter() - job.enqueued_at
+        self.logger.debug(f"Fan-out to {len(job.member_ids)} members of {key} done in {self.last_duration * 1000:.1f} ms "
+                          f"(queued {self.last_queue_delay * 1000:.1f} ms)")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'queued_jobs': sum(len(queue) for queue in self.queues.values()),
+            'pending_deliveries': sum(len(job.member_ids) - job.position
+                                      for queue in self.queues.values() for job in queue),
+            'jobs_submitted': self.jobs_submitted,
+            'jobs_completed': self.jobs_completed,
+            'deliveries': self.deliveries,
+            'last_queue_delay': self.last_queue_delay,
+            'max_queue_delay': self.max_queue_delay,
+            'last_duration': self.last_duration
+        }
@@ -0,0 +1,63 @@
+import os
+import json
+import time
+import logging
+from typing import Any, List, Optional, Tuple
+
+from constants import RpcServerConfig
+
+# (time, kind, session id, detail, value), e.g.
+#   accept     session  'ip:port'        None
+#   close      session  username         bytes received
+#   call       session  method           handler milliseconds
+#   broadcast  sender   group / key      recipients
+#   stall      None     'loop'           iteration milliseconds
+#   error      session  message          None
+FlightEvent = Tuple[float, str, Optional[int], Any, Any]
+
+
+class FlightRecorder:
+    """Fixed-size ring of the most recent server events, always on.
+
+    Recording is one tuple store, cheap enough for every request. The ring is
+    written to FLIGHT_RECORDER_DIR when the event loop crashes, on SIGUSR1
+    and on demand (admin_flight_recorder).
+    """
+
+    def __init__(self, size: int = RpcServerConfig.FLIGHT_RECORDER_SIZE):
+        self.size = size
+        self.events: List[Optional[FlightEvent]] = [None] * size
+        self.index = 0  # Slot the next event goes to
+        self.recorded = 0
+        self.logger = logging.getLogger(f"{self.__class__.__name__}")
+
+    def record(self, kind: str, session_id: Optional[int] = None, detail: Any = None, value: Any = None) -> None:
+        index = self.index
+        self.events[index] = (time.time(), kind, session_id, detail, value)
+        self.index = index + 1 if index + 1 < self.size else 0
+        self.recorded += 1
+
+    def recent(self, limit: Optional[int] = None) -> List[FlightEvent]:
+        """Events oldest first; the newest limit of them when given"""
+        events = self.events[self.index:] + self.events[:self.index]
+        events = [event for event in events if event is not None]
+        return events[-limit:] if limit else events
+
+    def dump(self, reason: str, details: Optional[str] = None) -> Optional[str]:
+        """Write the ring to a new JSON lines file: a header line, then one event per line"""
+        path = os.path.join(RpcServerConfig.FLIGHT_RECORDER_DIR,
+                            f"flight-{os.getpid()}-{time.strftime('%Y%m%d-%H%M%S')}-{reason}.jsonl")
+        events = self.recent()
+        try:
+            os.makedirs(RpcServerConfig.FLIGHT_RECORDER_DIR, exist_ok=True)
+            with open(path, 'w', encoding='utf-8') as dump_file:
+                dump_file.write(json.dumps({'reason': reason, 'pid': os.getpid(), 'time': time.time(),
+                                            'recorded': self.recorded, 'events': len(events),
+                                            'details': details}) + '\n')
+                for event in events:
+                    dump_file.write(json.dumps(event, default=repr) + '\n')
+        except OSError as e:
+            self.logger.error(f"Could not write flight recorder dump {path}: {e}")
+            return None
+        self.logger.warning(f"Flight recorder dumped {len(events)} events to {path} ({reason})")
+        return path
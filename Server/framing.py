@@ -0,0 +1,86 @@
+import re
+from typing import List
+
+WHITESPACE = re.compile(rb'\s*')
+SCAN_OUTSIDE = re.compile(rb'[{}\[\]"]')  # Bytes that matter outside a string
+SCAN_STRING = re.compile(rb'["\\]')  # Bytes that matter inside a string
+
+
+class RequestFramer:
+    """Cuts a connection's byte stream of concatenated JSON objects into one frame per request.
+
+    The bytes are scanned once, from a cursor kept between reads, for the
+    bracket that closes the top-level object (skipping string contents), so a
+    request spread over many reads costs linear time. Frames are only decoded
+    once complete, so a UTF-8 character split between two reads is never cut,
+    and a malformed request is told apart from an unfinished one: the first is
+    a complete frame that fails to parse, the second is not a frame yet.
+    """
+    __slots__ = ('buffer', 'start', 'cursor', 'depth', 'in_string')
+
+    def __init__(self, pending: bytes = b''):
+        self.buffer = bytearray(pending)  # Received bytes not yet returned as frames
+        self.start = 0  # Where the frame being scanned begins
+        self.cursor = 0  # Next byte to scan
+        self.depth = 0
+        self.in_string = False
+
+    def feed(self, data: bytes) -> List[bytes]:
+        """Add received bytes; return the frames they complete, in order.
+
+        A frame is a whole top-level ``{...}`` object, or the rest of the
+        received text when it does not start with ``{`` (not JSON RPC at all).
+        """
+        buffer = self.buffer
+        buffer += data
+        frames = []
+        pos = self.cursor
+        end = len(buffer)
+
+        while pos < end:
+            if self.depth == 0:
+                pos = WHITESPACE.match(buffer, pos).end()
+                self.start = pos
+                if pos == end:
+                    break
+                if buffer[pos] != 0x7b:  # '{'
+                    frames.append(bytes(buffer[pos:]))
+                    pos = self.start = end
+                    break
+            if self.in_string:
+                match = SCAN_STRING.search(buffer, pos)
+                if match is None:
+                    pos = end
+                    break
+                if buffer[match.start()] == 0x5c:  # '\\' escapes the next byte, which may not have arrived yet
+                    pos = match.start() + 2
+                    continue
+                self.in_string = False
+                pos = match.end()
+                continue
+            match = SCAN_OUTSIDE.search(buffer, pos)
+            if match is None:
+                pos = end
+                break
+            char = buffer[match.start()]
+            pos = match.end()
+            if char == 0x22:  # '"'
+                self.in_string = True
+            elif char in (0x7b, 0x5b):  # '{', '['
+                self.depth += 1
+            else:
+                self.depth -= 1
+                if self.depth == 0:
+                    frames.append(bytes(buffer[self.start:pos]))
+                    self.start = pos
+
+        self.cursor = pos
+        if self.start:
+            del buffer[:self.start]
+            self.cursor -= self.start
+            self.start = 0
+        return frames
+
+    def pending(self) -> int:
+        """Bytes of the unfinished frame held back"""
+        return len(self.buffer)
@@ -0,0 +1,97 @@
+import os
+import errno
+import pickle
+import socket
+import struct
+from typing import Any, Dict, List, Tuple
+
+from snapshot import loads_plain
+
+HANDOFF_FORMAT = 2
+HELLO = b'HANDOFF'  # Sent first by the successor, so a bare connect (see listen) starts nothing
+ACK = b'OK'
+FD_BATCH = 250  # Linux accepts at most 253 descriptors in one SCM_RIGHTS message
+HEADER = struct.Struct('!QI')  # Pickled state size, descriptor count
+PROBE_TIMEOUT = 1.0  # Seconds listen() waits to find out whether a server still owns the path
+
+# A handoff over the Unix control socket is HELLO from the new process, then from the old one:
+#   HEADER, then one b'F' byte per FD_BATCH descriptors carrying them as SCM_RIGHTS,
+#   then the pickled state; the new process answers ACK once it owns the sockets.
+
+
+def is_supported() -> bool:
+    """Descriptor passing needs AF_UNIX and socket.send_fds (Python 3.9+, not Windows)"""
+    return hasattr(socket, 'AF_UNIX') and hasattr(socket, 'send_fds')
+
+
+def listen(path: str) -> socket.socket:
+    """Listen on path for a successor process, replacing a stale socket file.
+
+    Raises OSError (EADDRINUSE) when a server is still listening on path.
+    """
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    probe.settimeout(PROBE_TIMEOUT)
+    try:
+        probe.connect(path)
+    except (FileNotFoundError, ConnectionRefusedError):
+        pass  # No file, or one left behind by a process that is gone
+    else:
+        raise OSError(errno.EADDRINUSE, f"A server is already listening on {path}")
+    finally:
+        probe.close()
+
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(path)
+    listener.listen(1)
+    listener.setblocking(False)
+    return listener
+
+
+def send_state(conn: socket.socket, state: Dict[str, Any], sockets: List[socket.socket]) -> None:
+    payload = pickle.dumps(state, pickle.HIGHEST_PROTOCOL)
+    fds = [sock.fileno() for sock in sockets]
+    conn.sendall(HEADER.pack(len(payload), len(fds)))
+    for start in range(0, len(fds), FD_BATCH):
+        socket.send_fds(conn, [b'F'], fds[start:start + FD_BATCH])
+    conn.sendall(payload)
+
+
+def receive_state(path: str, timeout: float) -> Tuple[socket.socket, Dict[str, Any], List[socket.socket]]:
+    """Connect to the running server at path and receive its state and sockets.
+
+    Returns the still-open control connection; send ACK on it once the sockets are in use.
+    """
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    conn.settimeout(timeout)
+    conn.connect(path)
+    conn.sendall(HELLO)
+
+    size, count = HEADER.unpack(_recv_exactly(conn, HEADER.size))
+    fds: List[int] = []
+    while len(fds) < count:
+        data, batch, flags, _ = socket.recv_fds(conn, 1, FD_BATCH)
+        if not data or flags & socket.MSG_CTRUNC:
+            for fd in fds + batch:
+                os.close(fd)
+            raise ConnectionError("Handoff interrupted while receiving sockets")
+        fds.extend(batch)
+
+    state = loads_plain(_recv_exactly(conn, size))
+    if state.get('format') != HANDOFF_FORMAT:
+        raise ValueError(f"Unsupported handoff format {state.get('format')}")
+    return conn, state, [socket.socket(fileno=fd) for fd in fds]
+
+
+def _recv_exactly(conn: socket.socket, size: int) -> bytes:
+    chunks = []
+    while size:
+        chunk = conn.recv(min(size, 1024 * 1024))
+        if not chunk:
+            raise ConnectionError("Handoff connection closed early")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
@@ -1,12 +1,74 @@
 #!/usr/bin/env python3
 
+import os
+import signal
+import argparse
+import traceback
+
+import handoff
+from admin import AdminApi
+from cluster import ClusterNode
 from rpc_server import RpcServer
 from chat_server import ChatServer
+from constants import ChatServerConfig, RpcServerConfig
 
 
 def main():
-    rpc_server = RpcServer(host='127.0.0.1', port=65432)
+    parser = argparse.ArgumentParser(description="Chat server")
+    parser.add_argument('--port', type=int, default=RpcServerConfig.DEFAULT_PORT, help="TCP port")
+    parser.add_argument('--no-tcp', action='store_true', help="serve only the Unix domain sockets")
+    parser.add_argument('--unix', action='append', default=[], metavar='PATH',
+                        help="also listen on a Unix domain socket at PATH (repeatable)")
+    parser.add_argument('--takeover', action='store_true',
+                        help="take the listening socket and live connections over from the running server")
+    parser.add_argument('--trace-sample', type=float, default=0.0, metavar='RATE',
+                        help="trace this fraction of requests (0-1) into a Chrome trace file")
+    parser.add_argument('--trace-file', default=RpcServerConfig.TRACE_FILE,
+                        help="where --trace-sample writes, loadable in chrome://tracing or Perfetto")
+    parser.add_argument('--node-id', default=None, help="run as this node of a cluster (see --peer)")
+    parser.add_argument('--peer', action='append', default=[], metavar='ID=HOST:PORT',
+                        help="another cluster node and its client port (repeatable); "
+                             f"all nodes share the secret in ${ChatServerConfig.CLUSTER_SECRET_ENV}")
+    args = parser.parse_args()
+    if args.no_tcp and not args.unix:
+        parser.error("--no-tcp needs at least one --unix PATH")
+
+    peers = {}
+    for peer in args.peer:
+        peer_id, _, address = peer.partition('=')
+        host, _, port = address.rpartition(':')
+        if not peer_id or not host or not port.isdigit():
+            parser.error(f"--peer expects ID=HOST:PORT, got {peer!r}")
+        peers[peer_id] = (host, int(port))
+    cluster_secret = os.environ.get(ChatServerConfig.CLUSTER_SECRET_ENV, '')
+    if peers and not args.node_id:
+        parser.error("--peer needs --node-id")
+    if args.node_id and (not cluster_secret or ' ' in args.node_id):
+        parser.error(f"cluster mode needs ${ChatServerConfig.CLUSTER_SECRET_ENV} and a node id without spaces")
+
+    # Received before ChatServer restores state, so it sees the snapshot the old process just wrote.
+    # The listeners come from the old process, so --port and --unix do not apply.
+    takeover = handoff.receive_state(ChatServerConfig.HANDOFF_PATH, ChatServerConfig.HANDOFF_TIMEOUT) \
+        if args.takeover else None
+
+    rpc_server = RpcServer(host=RpcServerConfig.DEFAULT_HOST, port=None if args.no_tcp else args.port,
+                           unix_paths=args.unix)
+    if args.trace_sample > 0:
+        rpc_server.enable_tracing(min(args.trace_sample, 1.0), args.trace_file)
     chat_server = ChatServer(rpc_server)
+    if args.node_id:
+        ClusterNode(chat_server, rpc_server, args.node_id, peers, cluster_secret)
+    admin_token = os.environ.get(ChatServerConfig.ADMIN_TOKEN_ENV)
+    if admin_token:
+        AdminApi(chat_server, rpc_server, admin_token)
+    if takeover is not None:
+        conn, state, sockets = takeover
+        chat_server.adopt_handoff(state, sockets)
+        conn.sendall(handoff.ACK)
+        conn.close()
+    chat_server.enable_handoff()
+    if hasattr(signal, 'SIGUSR1'):  # Not on Windows
+        signal.signal(signal.SIGUSR1, lambda signum, frame: rpc_server.recorder.dump('signal'))
 
     try:
         print("Starting Chat Application...")
@@ -17,6 +79,8 @@ def main():
         print("\nServer interrupted by user")
     except Exception as e:
         print(f"Unexpected error: {e}")
+        rpc_server.recorder.record('crash', None, repr(e))
+        rpc_server.recorder.dump('crash', traceback.format_exc())
     finally:
         print("Cleaning up...")
         chat_server.stop()
@@ -0,0 +1,22 @@
+import math
+
+from constants import RpcServerConfig
+
+
+class RateMeter:
+    """Events per second, exponentially averaged over RATE_WINDOW seconds.
+
+    Recording an event and reading the rate are both O(1) and need no history.
+    """
+    __slots__ = ('rate', 'updated_at')
+
+    def __init__(self):
+        self.rate = 0.0
+        self.updated_at = 0.0
+
+    def add(self, now: float, count: int = 1) -> None:
+        self.rate = self.value(now) + count / RpcServerConfig.RATE_WINDOW
+        self.updated_at = now
+
+    def value(self, now: float) -> float:
+        return self.rate * math.exp((self.updated_at - now) / RpcServerConfig.RATE_WINDOW)
@@ -1,25 +1,59 @@
+import os
+import sys
 import socket
 import selectors
 import json
+import time
+import itertools
 import logging
-from typing import Optional, Tuple, List, Callable, Dict, Any
+import traceback
+from typing import Optional, Tuple, List, Callable, Dict, Any, Sequence
+
+from collections import deque
 
 from constants import (
-    MessageType, RpcServerConfig, ErrorCodes, Messages, LoggingConfig
+    RpcServerConfig, ErrorCodes, Messages, LoggingConfig, Lane
 )
+from session import Session
+from framing import RequestFramer
+from flight_recorder import FlightRecorder
+from timers import Timer, TimerQueue
+from tracing import Tracer, TracedFrame
+
+AF_UNIX = getattr(socket, 'AF_UNIX', None)  # Missing on some Windows builds
+HAS_SENDMSG = hasattr(socket.socket, 'sendmsg')  # Not on Windows, which gets one joined send instead
 
 
 class RpcServer:
-    def __init__(self, host: str = RpcServerConfig.DEFAULT_HOST, port: int = RpcServerConfig.DEFAULT_PORT):
+    def __init__(self, host: str = RpcServerConfig.DEFAULT_HOST, port: Optional[int] = RpcServerConfig.DEFAULT_PORT,
+                 unix_paths: Sequence[str] = ()):
         self.host = host
-        self.port = port
-        self.socket: Optional[socket.socket] = None
+        self.port = port  # None serves only the Unix domain sockets
+        self.unix_paths = list(unix_paths)  # AF_UNIX stream sockets served alongside (or instead of) TCP
+        self.socket: Optional[socket.socket] = None  # TCP listener
+        self.listeners: List[socket.socket] = []  # Every listening socket, TCP and AF_UNIX
         self.is_running = False
         self.selector = selectors.DefaultSelector()
-        self.clients: Dict[socket.socket, Tuple[str, int]] = {}
-        self.client_buffers: Dict[socket.socket, str] = {}
-        self.message_handlers: Dict[str, Callable] = {}
-        self.disconnect_callback: Optional[Callable] = None  # Callback when client disconnects
+        self.clients: Dict[int, Session] = {}  # Session id -> session
+        self.clients_version = 0  # Bumped whenever get_connected_clients() would return something else
+        self.session_ids = itertools.count(1)
+        self.json_decoder = json.JSONDecoder()
+        self.closing: List[Session] = []  # Sessions whose socket failed, removed at the end of the loop iteration
+        self.pending_flush: Dict[int, Session] = {}  # Sessions with frames queued this loop iteration
+        self.message_handlers: Dict[str, Callable] = {}  # Called as handler(params, session)
+        self.stream_handlers: Dict[str, Callable] = {}  # Header keyword -> handler(session, args) returning a stream
+        self.disconnect_callback: Optional[Callable[[Session], None]] = None  # Callback when client disconnects
+        self.timers = TimerQueue()
+        self.tracer: Optional[Tracer] = None  # Set by enable_tracing()
+        self.recorder = FlightRecorder()  # Recent events, dumped on crash, SIGUSR1 or admin request
+        self.pause_selector: Optional[selectors.BaseSelector] = None  # Set while paused, see pause()
+        self.pause_deadline = 0.0
+        self.pause_timeout_callback: Optional[Callable[[], None]] = None
+        # Written to by stop_server() so a select() with no deadline returns at once
+        self.wakeup_reader, self.wakeup_writer = socket.socketpair()
+        self.wakeup_reader.setblocking(False)
+        self.wakeup_writer.setblocking(False)
+        self.selector.register(self.wakeup_reader, selectors.EVENT_READ, data=self._drain_wakeup)
         self._setup_logging()
 
     def _setup_logging(self) -> None:
@@ -36,11 +70,21 @@ class RpcServer:
         self.message_handlers[method_name] = handler
         self.logger.info(f"Registered handler for method: {method_name}")
 
+    def register_stream_handler(self, keyword: str, handler: Callable) -> None:
+        """Hand connections whose first line is ``<keyword> <args...>`` to a raw byte stream.
+
+        The handler returns an object with on_readable(), on_writable() and close(),
+        or None to refuse the connection.
+        """
+        self.stream_handlers[keyword] = handler
+        self.logger.info(f"Registered stream handler for: {keyword}")
+
     def start_server(self) -> None:
         try:
-            self._create_and_bind_socket()
+            if not self.listeners:  # Otherwise adopted from the previous process
+                self._create_and_bind_socket()
             self._start_listening()
-            self.logger.info(f"RPC Server started on {self.host}:{self.port}")
+            self.logger.info(f"RPC Server started on {', '.join(self._listener_names())}")
             self._register_server_socket()
             self._event_loop()
         except Exception as e:
@@ -50,33 +94,141 @@ class RpcServer:
             self._cleanup()
 
     def _create_and_bind_socket(self) -> None:
-        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        self.socket.setblocking(False)
-        self.socket.bind((self.host, self.port))
+        if self.port is not None:
+            self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self.socket.setblocking(False)
+            self.socket.bind((self.host, self.port))
+            self.listeners.append(self.socket)
+        for path in self.unix_paths:
+            self.listeners.append(self._create_unix_socket(path))
+
+    def _create_unix_socket(self, path: str) -> socket.socket:
+        """Bind an AF_UNIX stream socket at path, replacing a stale socket file left by a crash"""
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        unix_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        unix_socket.setblocking(False)
+        unix_socket.bind(path)
+        return unix_socket
+
+    def _listener_names(self) -> List[str]:
+        return [f"unix:{listener.getsockname()}" if listener.family == AF_UNIX
+                else f"{self.host}:{self.port}" for listener in self.listeners]
 
     def _start_listening(self) -> None:
-        self.socket.listen(RpcServerConfig.MAX_CONNECTIONS)
+        for listener in self.listeners:
+            listener.listen(RpcServerConfig.MAX_CONNECTIONS)
         self.is_running = True
-        print(f"RPC Server started and listening on {self.host}:{self.port}")
+        print(f"RPC Server started and listening on {', '.join(self._listener_names())}")
         print("Waiting for client connections...")
 
     def _register_server_socket(self) -> None:
-        self.selector.register(self.socket, selectors.EVENT_READ, data=None)
+        for listener in self.listeners:
+            self.selector.register(listener, selectors.EVENT_READ, data=None)
 
     def _event_loop(self) -> None:
         while self.is_running:
             try:
-                events = self.selector.select(timeout=1)
+                if self.pause_selector is not None:
+                    self._run_paused()
+                    continue
+                events = self.selector.select(timeout=self.timers.timeout())
+                started = time.perf_counter()
                 for key, mask in events:
+                    if not self.is_running:
+                        break  # Stopped by a handler, e.g. after handing every socket to a successor
                     if key.data is None:
                         self._accept_connection(key.fileobj)
-                    else:
+                    elif isinstance(key.data, Session):
                         self._handle_client_event(key, mask)
+                    else:
+                        key.data()  # Reader registered with add_reader
+                if not self.is_running:
+                    break
+                self._remove_closing()
+                self.timers.run()
+                self._flush_pending()
+                while self.closing:
+                    # Removing a client can queue frames for others (e.g. its leave), which must not wait for the next event
+                    self._remove_closing()
+                    self._flush_pending()
+                elapsed = time.perf_counter() - started
+                if elapsed > RpcServerConfig.STALL_THRESHOLD:
+                    self.recorder.record('stall', None, 'loop', round(elapsed * 1000, 3))
             except Exception as e:
                 self.logger.error(f"Error in event loop: {e}")
+                self.recorder.record('crash', None, repr(e))
+                self.recorder.dump('crash', traceback.format_exc())
                 break
 
+    def _run_paused(self) -> None:
+        for key, _ in self.pause_selector.select(timeout=max(0.0, self.pause_deadline - time.monotonic())):
+            if self.pause_selector is None or not self.is_running:
+                return
+            key.data()
+        if self.pause_selector is not None and time.monotonic() >= self.pause_deadline:
+            on_timeout = self.pause_timeout_callback
+            self.resume()
+            on_timeout()
+
+    def pause(self, fileobj, callback: Callable[[], None], timeout: float, on_timeout: Callable[[], None]) -> None:
+        """Stop serving until resume(), calling only callback whenever fileobj is readable.
+
+        No connection is read or written, no timer runs and no listener accepts
+        meanwhile, e.g. while a successor process takes the sockets over. If
+        resume() is not called within timeout seconds, the loop resumes and calls on_timeout.
+        """
+        self.pause_selector = selectors.DefaultSelector()
+        self.pause_selector.register(self.wakeup_reader, selectors.EVENT_READ, data=self._drain_wakeup)
+        self.pause_selector.register(fileobj, selectors.EVENT_READ, data=callback)
+        self.pause_deadline = time.monotonic() + timeout
+        self.pause_timeout_callback = on_timeout
+
+    def resume(self) -> None:
+        """Serve again after pause(); does nothing when not paused"""
+        if self.pause_selector is None:
+            return
+        self.pause_selector.close()
+        self.pause_selector = None
+        self.pause_timeout_callback = None
+
+    def add_reader(self, fileobj, callback: Callable[[], None]) -> None:
+        """Call callback from the event loop whenever fileobj is readable"""
+        self.selector.register(fileobj, selectors.EVENT_READ, data=callback)
+
+    def remove_reader(self, fileobj) -> None:
+        try:
+            self.selector.unregister(fileobj)
+        except (KeyError, ValueError):
+            pass
+
+    def enable_tracing(self, sample_rate: float, path: str) -> None:
+        """Trace a sample_rate fraction of requests into a Chrome trace file at path"""
+        self.tracer = Tracer(self, sample_rate, path)
+        self.logger.info(f"Tracing {sample_rate:.2%} of requests to {path}")
+
+    def call_soon(self, callback: Callable, *args: Any) -> Timer:
+        """Run callback(*args) at the end of the current loop iteration"""
+        return self.timers.call_soon(callback, *args)
+
+    def call_later(self, delay: float, callback: Callable, *args: Any) -> Timer:
+        """Run callback(*args) once, delay seconds from now"""
+        return self.timers.call_later(delay, callback, *args)
+
+    def call_every(self, interval: float, callback: Callable, *args: Any) -> Timer:
+        """Run callback(*args) every interval seconds until the returned timer is cancelled"""
+        return self.timers.call_every(interval, callback, *args)
+
+    def _drain_wakeup(self) -> None:
+        try:
+            while self.wakeup_reader.recv(4096):
+                pass
+        except (BlockingIOError, OSError):
+            pass
+
     def _accept_connection(self, server_socket: socket.socket) -> None:
         try:
             client_socket, client_address = server_socket.accept()
@@ -85,173 +237,451 @@ class RpcServer:
             self._add_client(client_socket, client_address)
         except Exception as e:
             self.logger.error(f"Error accepting connection: {e}")
-
-    def _add_client(self, client_socket: socket.socket, client_address: Tuple[str, int]) -> None:
-        self.clients[client_socket] = client_address
-        self.client_buffers[client_socket] = ""
-        self.selector.register(client_socket, selectors.EVENT_READ, data=client_address)
-        self.logger.info(f"RPC session started with {client_address}")
+            self.recorder.record('error', None, f"accept: {e!r}")
+
+    def add_connection(self, sock: socket.socket, address: Tuple[str, int]) -> Session:
+        """Serve a non-blocking socket this process opened (e.g. a cluster link) like an accepted one"""
+        return self._add_client(sock, address)
+
+    def _add_client(self, client_socket: socket.socket, client_address: Tuple[str, int]) -> Session:
+        session_id = next(self.session_ids)
+        if not client_address:
+            # Unix domain peers are unnamed; the session id stands in for the port
+            client_address = ('unix', session_id)
+        if client_socket.family in (socket.AF_INET, socket.AF_INET6):
+            # Frames are already coalesced per loop iteration; Nagle would only delay them further
+            client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        session = Session(session_id, client_socket, client_address)
+        self.clients[session.id] = session
+        self.clients_version += 1
+        self.selector.register(client_socket, selectors.EVENT_READ, data=session)
+        self.logger.info(f"RPC session {session.id} started with {client_address}")
+        self.recorder.record('accept', session.id, f"{client_address[0]}:{client_address[1]}")
+        return session
 
     def _handle_client_event(self, key: selectors.SelectorKey, mask: int) -> None:
-        client_socket = key.fileobj
-        client_address = key.data
+        session: Session = key.data
+
+        if session.stream is not None:
+            try:
+                if mask & selectors.EVENT_WRITE:
+                    session.stream.on_writable()
+                if mask & selectors.EVENT_READ:
+                    session.stream.on_readable()
+            except Exception as e:
+                # A failed transfer (full disk, file removed underneath it) only ends its own connection
+                self.logger.error(f"Error in stream for {session.address}: {e}")
+                self.recorder.record('error', session.id, f"stream: {e!r}")
+                self.close_later(session)
+            return
+
+        if mask & selectors.EVENT_WRITE:
+            self._flush_outbox(session)
+        if not mask & selectors.EVENT_READ:
+            return
 
         try:
-            data = client_socket.recv(RpcServerConfig.BUFFER_SIZE)
+            if session.bytes_in == 0 and self.stream_handlers and self._open_stream(session):
+                return
+            if self.tracer is not None:
+                self.tracer.recv_at = time.perf_counter()
+            data = session.socket.recv(RpcServerConfig.BUFFER_SIZE)
+            session.bytes_in += len(data)
+            session.last_active = time.time()
             if data:
-                message = data.decode('utf-8')
-                self.logger.debug(f"Received from {client_address}: {message}")
-                self._process_message(message, client_socket, client_address)
+                self.logger.debug(f"Received from {session.address}: {data!r}")
+                self._process_frames(session, session.framer.feed(data))
             else:
-                self.logger.info(f"Client {client_address} disconnected")
-                self._remove_client(client_socket, client_address)
-        except UnicodeDecodeError as e:
-            self.logger.error(f"Unicode decode error from {client_address}: {e}")
-            self._remove_client(client_socket, client_address)
+                self.logger.info(f"Client {session.address} disconnected")
+                self._remove_client(session)
         except ConnectionResetError:
-            self.logger.info(f"Client {client_address} disconnected unexpectedly")
-            self._remove_client(client_socket, client_address)
+            self.logger.info(f"Client {session.address} disconnected unexpectedly")
+            self._remove_client(session)
         except Exception as e:
-            self.logger.error(f"Error handling client {client_address}: {e}")
-            self._remove_client(client_socket, client_address)
-
-    def _process_message(self, message: str, client_socket: socket.socket, client_address: Tuple[str, int]) -> None:
-        message_type = self._detect_message_type(message)
-
-        if message_type == MessageType.JSON_RPC:
-            self._handle_json_rpc(message, client_socket, client_address)
-        else:
-            self._send_error_response(
-                client_socket,
-                'Only JSON RPC messages are supported',
-                ErrorCodes.INVALID_REQUEST
-            )
-
-    def _detect_message_type(self, message: str) -> MessageType:
+            self.logger.error(f"Error handling client {session.address}: {e}")
+            self.recorder.record('error', session.id, f"client: {e!r}")
+            self._remove_client(session)
+
+    def _open_stream(self, session: Session) -> bool:
+        """Peek at a new connection's first line; return True if it belongs to a stream handler"""
+        head = session.socket.recv(RpcServerConfig.BUFFER_SIZE, socket.MSG_PEEK)
+        handler = self.stream_handlers.get(head.split(b' ', 1)[0].decode('ascii', 'replace'))
+        if handler is None:
+            return False
+
+        end = head.find(b'\n')
+        if end < 0:
+            if len(head) >= RpcServerConfig.BUFFER_SIZE:
+                self.close_later(session)
+            return True  # Wait for the rest of the header line
+
+        # Consume only the header; the raw bytes after it stay in the socket for the stream
+        session.socket.recv(end + 1)
+        session.bytes_in += end + 1
+        args = head[:end].decode('ascii', 'replace').split()[1:]
         try:
-            json.loads(message)
-            return MessageType.JSON_RPC
-        except json.JSONDecodeError:
-            return MessageType.PLAIN_TEXT
-
-    def _handle_json_rpc(self, message: str, client_socket: socket.socket, client_address: Tuple[str, int]) -> None:
+            session.stream = handler(session, args)
+        except Exception as e:
+            self.logger.error(f"Error opening stream for {session.address}: {e}")
+        if session.stream is None:
+            self.close_later(session)
+        self.clients_version += 1  # No longer a chat client
+        return True
+
+    def _process_frames(self, session: Session, frames: List[bytes]) -> None:
+        """Dispatch the complete requests just received; a malformed one is answered and skipped"""
+        for frame in frames:
+            if frame[:1] != b'{':
+                self._send_error_response(session, 'Only JSON RPC messages are supported', ErrorCodes.INVALID_REQUEST)
+                continue
+            try:
+                rpc_data = self.json_decoder.decode(frame.decode('utf-8'))
+            except ValueError as e:  # Bad JSON or bad UTF-8
+                self.logger.error(f"JSON decode error from {session.address}: {e}")
+                self._send_error_response(session, 'Invalid JSON', ErrorCodes.PARSE_ERROR)
+                continue
+            self._handle_json_rpc(rpc_data, session)
+
+        if session.framer.pending() > RpcServerConfig.MAX_REQUEST_SIZE:
+            # Nothing after an oversized request can be trusted to start a new one
+            self.logger.error(f"Request from {session.address} exceeds {RpcServerConfig.MAX_REQUEST_SIZE} bytes")
+            self._send_error_response(session, 'Request too large', ErrorCodes.PARSE_ERROR)
+            self._flush_outbox(session)
+            self.close_later(session)
+
+    def _handle_json_rpc(self, rpc_data: Dict[str, Any], session: Session) -> None:
+        trace = method = None
         try:
-            rpc_data = json.loads(message)
             method = rpc_data.get('method')
             params = rpc_data.get('params', {})
+            session.requests += 1
+            session.request_rate.add(session.last_active)
+            trace = self.tracer.begin(method, session.id) if self.tracer is not None else None
+            started = Tracer.timestamp() if trace else 0.0
 
             if method in self.message_handlers:
-                response = self.message_handlers[method](params, client_socket, client_address)
-                if response:
-                    self._send_json_response(client_socket, response)
+                called = time.perf_counter()
+                response = self.message_handlers[method](params, session)
+                self.recorder.record('call', session.id, method, round((time.perf_counter() - called) * 1000, 3))
+                if isinstance(response, bytes):
+                    # Encoded by the handler, e.g. a cached response shared by many callers
+                    self._queue_frame(session, response, Lane.CONTROL)
+                elif response:
+                    self._send_json_response(session, response)
             else:
-                self._send_error_response(client_socket, f'Method {method} not found', ErrorCodes.METHOD_NOT_FOUND)
+                self._send_error_response(session, f'Method {method} not found', ErrorCodes.METHOD_NOT_FOUND)
 
-        except json.JSONDecodeError as e:
-            self.logger.error(f"JSON decode error: {e}")
-            self._send_error_response(client_socket, 'Invalid JSON', ErrorCodes.PARSE_ERROR)
         except Exception as e:
             self.logger.error(f"Error processing JSON RPC: {e}")
-            self._send_error_response(client_socket, 'Internal error', ErrorCodes.INTERNAL_ERROR)
+            self.recorder.record('error', session.id, f"{method}: {e!r}")
+            self._send_error_response(session, 'Internal error', ErrorCodes.INTERNAL_ERROR)
+        finally:
+            if trace:
+                self.tracer.end(trace, started)
 
-    def _send_json_response(self, client_socket: socket.socket, response: Dict[str, Any]) -> None:
+    def _send_json_response(self, session: Session, response: Dict[str, Any]) -> None:
         try:
-            json_str = json.dumps(response)
-            client_socket.sendall(json_str.encode('utf-8'))
+            self._queue_frame(session, json.dumps(response).encode('utf-8'), Lane.CONTROL)
         except Exception as e:
             self.logger.error(f"Error sending JSON response: {e}")
 
-    def _send_error_response(self, client_socket: socket.socket, error_message: str, error_code: int) -> None:
+    def _send_error_response(self, session: Session, error_message: str, error_code: int) -> None:
         error_response = {
             'error': error_message,
             'code': error_code
         }
-        self._send_json_response(client_socket, error_response)
+        self._send_json_response(session, error_response)
 
-    def broadcast_message(self, message: str, sender_socket: Optional[socket.socket] = None):
-        for client_socket, client_address in list(self.clients.items()):
-            if client_socket != sender_socket:
-                try:
-                    client_socket.sendall(message.encode('utf-8'))
-                except Exception as e:
-                    self.logger.error(f"Error broadcasting to {client_address}: {e}")
-                    self._remove_client(client_socket, client_address)
+    def broadcast_message(self, message: str, sender: Optional[Session] = None):
+        payload = message.encode('utf-8')
+        for session in list(self.clients.values()):
+            if session is not sender:
+                self._queue_frame(session, payload, Lane.BULK)
 
-    def send_to_client(self, client_socket: socket.socket, message: str) -> None:
-        try:
-            client_socket.sendall(message.encode('utf-8'))
-        except Exception as e:
-            self.logger.error(f"Error sending message to client: {e}")
+    def send_to_client(self, session: Session, message: str, lane: Lane = Lane.CONTROL) -> None:
+        self._queue_frame(session, message.encode('utf-8'), lane)
+
+    def send_encoded(self, session: Session, payload: bytes, lane: Lane = Lane.BULK) -> None:
+        """Send a message already encoded once for many recipients"""
+        self._queue_frame(session, payload, lane)
 
-    def send_json_to_client(self, client_socket: socket.socket, data: Dict[str, Any]) -> None:
+    def send_json_to_client(self, session: Session, data: Dict[str, Any], lane: Lane = Lane.CONTROL) -> None:
         try:
-            json_str = json.dumps(data)
-            client_socket.sendall(json_str.encode('utf-8'))
+            self._queue_frame(session, json.dumps(data).encode('utf-8'), lane)
         except Exception as e:
             self.logger.error(f"Error sending JSON message to client: {e}")
 
-    def broadcast_json_message(self, data: Dict[str, Any], sender_socket: Optional[socket.socket] = None) -> None:
+    def broadcast_json_message(self, data: Dict[str, Any], sender: Optional[Session] = None) -> None:
         try:
-            json_str = json.dumps(data)
-            for client_socket, client_address in list(self.clients.items()):
-                if client_socket != sender_socket:
-                    try:
-                        client_socket.sendall(json_str.encode('utf-8'))
-                    except Exception as e:
-                        self.logger.error(f"Error broadcasting to {client_address}: {e}")
-                        self._remove_client(client_socket, client_address)
-        except json.JSONEncodeError as e:
+            payload = json.dumps(data).encode('utf-8')
+        except (TypeError, ValueError) as e:
             self.logger.error(f"Error encoding JSON for broadcast: {e}")
+            return
+        for session in list(self.clients.values()):
+            if session is not sender:
+                self._queue_frame(session, payload, Lane.BULK)
+
+    def _queue_frame(self, session: Session, payload: bytes, lane: Lane) -> None:
+        """Queue payload on its lane; the end of the loop iteration writes everything queued in one go"""
+        if self.clients.get(session.id) is not session or session.stream is not None:
+            return
+
+        if self.tracer is not None and self.tracer.current is not None:
+            payload = self.tracer.frame_queued(payload, session.id)
+        if session.outbox is None:
+            session.outbox = (deque(), deque())
+        session.outbox[lane].append(payload)
+        session.out_bytes += len(payload)
+
+        if session.out_bytes > RpcServerConfig.MAX_OUTBOUND_BYTES:
+            self.logger.warning(f"Disconnecting {session.address}: {session.out_bytes} bytes waiting to be sent")
+            self.close_later(session)
+            return
+        if session.sending is None:
+            # Otherwise the socket is full and the write event flushes it
+            self.pending_flush[session.id] = session
+
+    def _flush_pending(self) -> None:
+        """Write the frames queued during this loop iteration, one sendmsg per connection"""
+        pending, self.pending_flush = self.pending_flush, {}
+        for session in pending.values():
+            if self.clients.get(session.id) is session and session.sending is None:
+                self._flush_outbox(session)
+
+    def _next_frame(self, session: Session) -> Optional[bytes]:
+        """Control frames go first, but every CONTROL_BURST of them lets one bulk frame through"""
+        control, bulk = session.outbox
+        if control and (not bulk or session.control_streak < RpcServerConfig.CONTROL_BURST):
+            if bulk:
+                session.control_streak += 1
+            return control.popleft()
+        session.control_streak = 0
+        return bulk.popleft() if bulk else None
+
+    def _flush_outbox(self, session: Session) -> None:
+        while True:
+            # Frames keep their order once taken off the lanes, so a partial write resumes with the same batch
+            batch = session.sending or []
+            while len(batch) < RpcServerConfig.WRITE_BATCH and session.outbox is not None:
+                payload = self._next_frame(session)
+                if payload is None:
+                    break
+                batch.append(payload)
+            if not batch:
+                break
 
-    def _remove_client(self, client_socket: socket.socket, client_address: Tuple[str, int]):
-        # Call disconnect callback before cleanup
-        if self.disconnect_callback:
             try:
-                self.disconnect_callback(client_socket, client_address)
+                if HAS_SENDMSG:
+                    sent = session.socket.sendmsg(batch)
+                else:
+                    sent = session.socket.send(b''.join(batch))
+            except BlockingIOError:
+                sent = 0
+            except OSError as e:
+                self.logger.info(f"Send to {session.address} failed: {e}")
+                self.close_later(session)
+                return
+            session.out_bytes -= sent
+            session.bytes_out += sent
+
+            done = 0
+            while done < len(batch) and sent >= len(batch[done]):
+                sent -= len(batch[done])
+                done += 1
+            if self.tracer is not None:
+                for frame in batch[:done]:
+                    frame = getattr(frame, 'obj', frame)  # A memoryview is the rest of a partly sent frame
+                    if isinstance(frame, TracedFrame):
+                        self.tracer.frame_sent(frame, session.id)
+            if done < len(batch):
+                session.sending = batch[done:]
+                session.sending[0] = memoryview(session.sending[0])[sent:]
+                self.set_write_interest(session, True)
+                return
+            session.sending = None
+
+        session.outbox = None
+        session.out_bytes = 0
+        session.control_streak = 0
+        self.set_write_interest(session, False)
+
+    def set_write_interest(self, session: Session, enabled: bool) -> None:
+        events = selectors.EVENT_READ | selectors.EVENT_WRITE if enabled else selectors.EVENT_READ
+        try:
+            if self.selector.get_key(session.socket).events != events:
+                self.selector.modify(session.socket, events, data=session)
+        except (KeyError, ValueError):
+            pass  # Not registered (yet) or already closed
+
+    def close_later(self, session: Session) -> None:
+        """Remove a failed client after the current loop iteration, not in the middle of a send"""
+        self.closing.append(session)
+
+    def _remove_closing(self) -> None:
+        while self.closing:
+            self._remove_client(self.closing.pop())
+
+    def _remove_client(self, session: Session):
+        if self.clients.get(session.id) is not session:
+            return  # Already removed (e.g. a failed send during the disconnect callback)
+        self.recorder.record('close', session.id, session.username, session.bytes_in)
+
+        if session.stream is not None:
+            # Transfer connections never joined the chat
+            try:
+                session.stream.close()
+            except Exception as e:
+                self.logger.error(f"Error closing stream: {e}")
+        elif self.disconnect_callback:
+            try:
+                self.disconnect_callback(session)
             except Exception as e:
                 self.logger.error(f"Error in disconnect callback: {e}")
 
         try:
-            self.selector.unregister(client_socket)
+            self.selector.unregister(session.socket)
         except Exception:
             pass
 
         try:
-            client_socket.close()
+            session.socket.close()
         except Exception:
             pass
 
-        if client_socket in self.clients:
-            del self.clients[client_socket]
+        del self.clients[session.id]
+        self.clients_version += 1
+        session.framer = None
+        session.outbox = session.sending = None
+
+        print(f"Removed client {session.address}")
+
+    def get_session(self, session_id: int) -> Optional[Session]:
+        return self.clients.get(session_id)
+
+    def disconnect_session(self, session_id: int) -> None:
+        session = self.clients.get(session_id)
+        if session is not None:
+            self._remove_client(session)
+
+    def prepare_handoff(self) -> None:
+        """Drop connections that cannot be handed off: attachment transfers (their clients retry) and failed ones"""
+        for session in list(self.clients.values()):
+            if session.stream is not None:
+                self._remove_client(session)
+        self._remove_closing()
+
+    def export_handoff(self) -> Tuple[List[socket.socket], Dict[str, Any]]:
+        """Describe the listening socket and every chat connection for a successor process.
+
+        Returns the sockets to pass (listener first) and a picklable state whose
+        sessions are in the same order.
+        """
+        sockets = list(self.listeners)
+        sessions = []
+        for session in self.clients.values():
+            # Plain bytes: traced frames are not picklable for the restricted unpickler
+            control, bulk = ([bytes(frame) for frame in lane] for lane in session.outbox) if session.outbox else ([], [])
+            if session.sending is not None:
+                control[:0] = map(bytes, session.sending)  # Batch already partly on the wire
+            sockets.append(session.socket)
+            sessions.append((session.id, session.address, bytes(session.framer.buffer), session.bytes_in,
+                             session.username, session.group_name, session.token, control, bulk))
+        return sockets, {
+            'listeners': len(self.listeners),
+            'next_session_id': next(self.session_ids),
+            'clients_version': self.clients_version,
+            'sessions': sessions
+        }
 
-        if client_socket in self.client_buffers:
-            del self.client_buffers[client_socket]
+    def adopt_handoff(self, state: Dict[str, Any], sockets: List[socket.socket]) -> None:
+        """Take over the sockets and sessions exported by export_handoff in the previous process"""
+        self.listeners = sockets[:state['listeners']]
+        self.socket = None
+        self.port = None
+        self.unix_paths = []
+        for listener in self.listeners:
+            listener.setblocking(False)
+            if listener.family == AF_UNIX:
+                self.unix_paths.append(listener.getsockname())
+            else:
+                self.socket = listener
+                self.host, self.port = listener.getsockname()[:2]
+        self.session_ids = itertools.count(state['next_session_id'])
+        self.clients_version = state['clients_version']
 
-        print(f"Removed client {client_address}")
+        for client_socket, session_state in zip(sockets[state['listeners']:], state['sessions']):
+            session_id, address, buffer, bytes_in, username, group_name, token, control, bulk = session_state
+            client_socket.setblocking(False)
+            session = Session(session_id, client_socket, address)
+            session.framer = RequestFramer(buffer)
+            session.bytes_in = bytes_in
+            session.username = sys.intern(username) if username is not None else None
+            session.group_name = group_name
+            session.token = token
+            self.clients[session_id] = session
+            self.selector.register(client_socket, selectors.EVENT_READ, data=session)
+            if control or bulk:
+                session.outbox = (deque(control), deque(bulk))
+                session.out_bytes = sum(map(len, control)) + sum(map(len, bulk))
+                self.set_write_interest(session, True)
+        self.logger.info(f"Adopted {len(self.clients)} connections from the previous process")
+
+    def release_handoff(self) -> None:
+        """Let go of every socket after a successor took them over, and stop the loop.
+
+        Only this process's descriptors are closed; the connections stay open in the successor.
+        """
+        self.resume()
+        for session in self.clients.values():
+            self.remove_reader(session.socket)
+            session.socket.close()
+        self.clients.clear()
+        for listener in self.listeners:
+            self.remove_reader(listener)
+            listener.close()
+        self.listeners = []  # The successor owns the Unix socket paths now, so _cleanup leaves them
+        self.socket = None
+        self.is_running = False
 
-    def get_connected_clients(self) -> List[Tuple[str, int]]:
-        return list(self.clients.values())
+    def get_connected_clients(self) -> List[Session]:
+        """Chat connections; attachment transfer connections are left out"""
+        return [session for session in self.clients.values() if session.stream is None]
 
     def stop_server(self) -> None:
         print("\nShutting down RPC server...")
         self.is_running = False
+        try:
+            self.wakeup_writer.send(b'\0')  # May be called from another thread or a signal handler
+        except OSError:
+            pass
 
     def _cleanup(self) -> None:
-        for client_socket in list(self.clients.keys()):
+        if self.pause_selector is None:  # A successor may be writing to the sockets otherwise
+            self._flush_pending()  # Best effort for the last replies, e.g. after a stop requested by a handler
+        self.resume()
+        for session in list(self.clients.values()):
             try:
-                client_socket.close()
+                session.socket.close()
             except Exception as e:
                 self.logger.error(f"Error closing client socket: {e}")
 
         self.clients.clear()
-        self.client_buffers.clear()
 
         try:
             self.selector.close()
         except Exception as e:
             self.logger.error(f"Error closing selector: {e}")
+        self.wakeup_reader.close()
+        self.wakeup_writer.close()
+        if self.tracer is not None:
+            self.tracer.close()
 
-        if self.socket:
-            self.socket.close()
+        for listener in self.listeners:
+            if listener.family == AF_UNIX:
+                try:
+                    os.unlink(listener.getsockname())
+                except OSError:
+                    pass
+            listener.close()
 
         self.logger.info("RPC Server cleanup completed")
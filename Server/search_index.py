@@ -0,0 +1,117 @@
+import re
+import heapq
+import itertools
+import unicodedata
+from typing import Dict, List, Tuple, Iterable, Optional
+
+
+class MessageSearchIndex:
+    """Inverted index over retained group history.
+
+    Postings are kept per token and per group as insertion-ordered dicts of
+    message sequence numbers, so adding, evicting and walking newest-first are
+    all cheap without ever scanning the history itself.
+    """
+
+    TOKEN_PATTERN = re.compile(r'\w+')
+
+    def __init__(self):
+        # token -> group_name -> {seq: timestamp} (oldest first)
+        self.postings: Dict[str, Dict[str, Dict[int, float]]] = {}
+        # group_name -> seq -> tokens of that message (needed for pruning)
+        self.documents: Dict[str, Dict[int, Tuple[str, ...]]] = {}
+
+    @staticmethod
+    def fold(text: str) -> str:
+        """Lowercase and strip diacritics ("Đường" -> "duong")"""
+        text = text.replace('đ', 'd').replace('Đ', 'D')
+        decomposed = unicodedata.normalize('NFKD', text)
+        stripped = ''.join(c for c in decomposed if not unicodedata.combining(c))
+        return stripped.casefold()
+
+    @classmethod
+    def tokenize(cls, text: str) -> List[str]:
+        return cls.TOKEN_PATTERN.findall(cls.fold(text))
+
+    def add(self, group_name: str, seq: int, text: str, timestamp: float) -> None:
+        tokens = tuple(set(self.tokenize(text)))
+        if not tokens:
+            return
+
+        self.documents.setdefault(group_name, {})[seq] = tokens
+        for token in tokens:
+            self.postings.setdefault(token, {}).setdefault(group_name, {})[seq] = timestamp
+
+    def remove(self, group_name: str, seq: int) -> None:
+        group_documents = self.documents.get(group_name)
+        if not group_documents:
+            return
+
+        tokens = group_documents.pop(seq, None)
+        if tokens is None:
+            return
+
+        for token in tokens:
+            by_group = self.postings.get(token)
+            if by_group is None:
+                continue
+            seqs = by_group.get(group_name)
+            if seqs is not None:
+                seqs.pop(seq, None)
+                if not seqs:
+                    del by_group[group_name]
+            if not by_group:
+                del self.postings[token]
+
+        if not group_documents:
+            del self.documents[group_name]
+
+    def remove_group(self, group_name: str) -> None:
+        for seq in list(self.documents.get(group_name, {})):
+            self.remove(group_name, seq)
+
+    def search(self, query: str, group_names: Optional[Iterable[str]], limit: int) -> List[Tuple[str, int]]:
+        """Return up to ``limit`` (group_name, seq) pairs matching every query token, newest first.
+
+        ``group_names=None`` searches every group that contains the rarest token.
+        """
+        tokens = set(self.tokenize(query))
+        if not tokens or limit <= 0:
+            return []
+
+        by_token = [self.postings.get(token) for token in tokens]
+        if not all(by_token):
+            return []
+
+        if group_names is None:
+            group_names = list(min(by_token, key=len))
+
+        candidates = []
+        for group_name in group_names:
+            matches = self._search_group(group_name, by_token, limit)
+            if matches:
+                candidates.append(matches)
+
+        if len(candidates) == 1:
+            return [(group_name, seq) for _, group_name, seq in candidates[0]]
+
+        merged = heapq.merge(*candidates, key=lambda match: -match[0])
+        return [(group_name, seq) for _, group_name, seq in itertools.islice(merged, limit)]
+
+    def _search_group(self, group_name: str, by_token: List[Dict[str, Dict[int, float]]],
+                      limit: int) -> Optional[List[Tuple[float, str, int]]]:
+        group_postings = [postings.get(group_name) for postings in by_token]
+        if not all(group_postings):
+            return None
+
+        # Walk the rarest token newest-first and probe the others in O(1)
+        group_postings.sort(key=len)
+        shortest, others = group_postings[0], group_postings[1:]
+
+        matches = []
+        for seq in reversed(shortest):
+            if all(seq in postings for postings in others):
+                matches.append((shortest[seq], group_name, seq))
+                if len(matches) >= limit:
+                    break
+        return matches
@@ -0,0 +1,43 @@
+import socket
+import time
+from typing import Deque, List, Optional, Tuple, Union
+
+from rate_meter import RateMeter
+from framing import RequestFramer
+
+
+class Session:
+    """Everything the server keeps about one client connection.
+
+    Group membership and message history refer to a session by its small
+    integer ``id`` rather than by socket or (ip, port) tuple.
+    """
+    __slots__ = ('id', 'socket', 'address', 'framer', 'username', 'group_name', 'token',
+                 'outbox', 'sending', 'out_bytes', 'control_streak', 'bytes_in', 'stream',
+                 'bytes_out', 'requests', 'request_rate', 'connected_at', 'last_active')
+
+    def __init__(self, session_id: int, client_socket: socket.socket, client_address: Tuple[str, int]):
+        self.id = session_id
+        self.socket = client_socket
+        self.address = client_address
+        self.framer: Optional[RequestFramer] = RequestFramer()  # Received bytes not yet a complete request
+        self.username: Optional[str] = None  # Interned; None until join_chat/resume
+        self.group_name: Optional[str] = None  # Group the user is currently chatting in
+        self.token: Optional[str] = None  # Resume token issued for this connection
+        # Outbound frames waiting for the socket to become writable, one deque per Lane; None when empty
+        self.outbox: Optional[Tuple[Deque[bytes], Deque[bytes]]] = None
+        # Frames taken off the outbox for the write in progress, in send order; the first may be partly sent
+        self.sending: Optional[List[Union[bytes, memoryview]]] = None
+        self.out_bytes = 0  # Bytes in sending and outbox
+        self.control_streak = 0  # Control frames sent in a row while bulk frames waited
+        self.bytes_in = 0
+        self.stream = None  # Raw byte stream (e.g. an attachment transfer) replacing JSON RPC on this connection
+        # Counters for admin introspection
+        self.bytes_out = 0
+        self.requests = 0
+        self.request_rate = RateMeter()
+        self.connected_at = time.time()
+        self.last_active = self.connected_at  # Last time data arrived
+
+    def __repr__(self) -> str:
+        return f"Session({self.id}, {self.address}, {self.username!r})"
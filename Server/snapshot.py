@@ -0,0 +1,189 @@
+import io
+import os
+import re
+import time
+import pickle
+import logging
+import threading
+from typing import Any, Callable, Iterable, List, Optional, Tuple
+
+SNAPSHOT_FORMAT = 1
+
+# Snapshot and log records are plain tuples:
+#   ('group', name, creator, [(seq, username, timestamp, text), ...])
+#   ('channel', (user_a, user_b), next_seq, [(seq, sender_index, timestamp, text), ...])
+#   ('session', token, username, group_name)
+#   ('message', group_name, seq, username, timestamp, text)      - log only
+#   ('direct', sender, peer, timestamp, text)                    - log only
+#   ('delete', group_name)                                       - log only
+#   ('forget', username)                                         - log only
+Record = Tuple[Any, ...]
+
+
+class PlainUnpickler(pickle.Unpickler):
+    """Loads plain data only: tuples, lists, dicts, sets, strings, bytes and numbers.
+
+    Records never name a class or function, so a file that does was not
+    written by this server and is refused rather than allowed to run code.
+    """
+
+    def find_class(self, module: str, name: str) -> Any:
+        raise pickle.UnpicklingError(f"Refusing to load {module}.{name}")
+
+
+def load_plain(f) -> Any:
+    return PlainUnpickler(f).load()
+
+
+def loads_plain(data: bytes) -> Any:
+    return PlainUnpickler(io.BytesIO(data)).load()
+
+
+class SnapshotStore:
+    """Point-in-time snapshots of chat state plus an append-only log of later changes.
+
+    A snapshot is a stream of pickled records written to a temporary file by a
+    background thread and then renamed into place. Each record is pickled
+    separately so the event loop gets the GIL back between them. Capturing a
+    snapshot rotates the log, so restoring means loading the latest snapshot and
+    replaying every log generation from the one it was captured with.
+    """
+
+    SNAPSHOT_FILE = 'snapshot.pickle'
+    LOG_FILE = re.compile(r'log\.(\d+)\.pickle$')
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.log_file = None
+        self.log_generation = 0
+        self.log_records = 0  # Records appended to the current generation
+        self.writer: Optional[threading.Thread] = None
+        self.logger = logging.getLogger(f"{self.__class__.__name__}")
+
+    def _log_path(self, generation: int) -> str:
+        return os.path.join(self.directory, f'log.{generation:08d}.pickle')
+
+    def _log_generations(self) -> List[int]:
+        generations = []
+        for name in os.listdir(self.directory):
+            match = self.LOG_FILE.match(name)
+            if match:
+                generations.append(int(match.group(1)))
+        return sorted(generations)
+
+    def restore(self, apply: Callable[[Record], None]) -> int:
+        """Feed the latest snapshot and the log tail after it to ``apply``; return the record count"""
+        count = 0
+        first_generation = 0
+        snapshot_path = os.path.join(self.directory, self.SNAPSHOT_FILE)
+
+        if os.path.exists(snapshot_path):
+            with open(snapshot_path, 'rb') as f:
+                header = load_plain(f)
+                if header.get('format') != SNAPSHOT_FORMAT:
+                    raise ValueError(f"Unsupported snapshot format {header.get('format')}")
+                first_generation = header['log_generation']
+                count += self._read_records(f, apply)
+
+        generations = self._log_generations()
+        for generation in generations:
+            if generation >= first_generation:
+                with open(self._log_path(generation), 'rb') as f:
+                    count += self._read_records(f, apply)
+
+        self.log_generation = max(generations + [first_generation])
+        return count
+
+    def _read_records(self, f, apply: Callable[[Record], None]) -> int:
+        count = 0
+        while True:
+            try:
+                record = load_plain(f)
+            except EOFError:
+                break
+            except (pickle.UnpicklingError, ValueError) as e:
+                # A record cut short by a crash ends the log
+                self.logger.warning(f"Stopped reading {f.name} at a damaged record: {e}")
+                break
+            apply(record)
+            count += 1
+        return count
+
+    def open_log(self) -> None:
+        """Start the next log generation; records appended from now on land in it"""
+        if self.log_file:
+            self.log_file.close()
+        self.log_generation += 1
+        self.log_records = 0
+        self.log_file = open(self._log_path(self.log_generation), 'ab')
+
+    def append(self, record: Record) -> None:
+        """Buffer a record for the log; flush() writes it out"""
+        if self.log_file:
+            pickle.dump(record, self.log_file, pickle.HIGHEST_PROTOCOL)
+            self.log_records += 1
+
+    def flush(self) -> None:
+        if self.log_file:
+            self.log_file.flush()
+
+    def is_writing(self) -> bool:
+        return self.writer is not None and self.writer.is_alive()
+
+    def start_snapshot(self, records: Iterable[Record]) -> bool:
+        """Rotate the log and write ``records`` on a background thread.
+
+        ``records`` must only read state captured by the caller, since it is
+        consumed off the event loop. Returns False if a snapshot is still being written.
+        """
+        if self.is_writing():
+            return False
+        self.open_log()
+        self.writer = threading.Thread(target=self._write_snapshot, args=(records, self.log_generation),
+                                       name='snapshot-writer', daemon=True)
+        self.writer.start()
+        return True
+
+    def write_snapshot(self, records: Iterable[Record]) -> None:
+        """Write a snapshot on the calling thread, e.g. at shutdown"""
+        if self.writer is not None:
+            self.writer.join()
+        self.open_log()
+        self._write_snapshot(records, self.log_generation)
+
+    def _write_snapshot(self, records: Iterable[Record], log_generation: int) -> None:
+        started = time.perf_counter()
+        final_path = os.path.join(self.directory, self.SNAPSHOT_FILE)
+        temp_path = final_path + '.tmp'
+        try:
+            count = 0
+            with open(temp_path, 'wb') as f:
+                pickle.dump({'format': SNAPSHOT_FORMAT, 'log_generation': log_generation,
+                             'created_at': time.time()}, f, pickle.HIGHEST_PROTOCOL)
+                for record in records:
+                    pickle.dump(record, f, pickle.HIGHEST_PROTOCOL)
+                    count += 1
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, final_path)
+        except Exception as e:
+            self.logger.error(f"Error writing snapshot: {e}")
+            return
+
+        # Older log generations are covered by the snapshot now
+        for generation in self._log_generations():
+            if generation < log_generation:
+                try:
+                    os.remove(self._log_path(generation))
+                except OSError:
+                    pass
+
+        self.logger.info(f"Snapshot of {count} records written in {time.perf_counter() - started:.3f}s")
+
+    def close(self) -> None:
+        if self.writer is not None:
+            self.writer.join()
+        if self.log_file:
+            self.log_file.close()
+            self.log_file = None
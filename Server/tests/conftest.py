@@ -0,0 +1,150 @@
+import os
+import sys
+import json
+import socket
+import itertools
+from typing import Any, Dict, List, Optional, Sequence
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rpc_server import RpcServer  # noqa: E402
+from chat_server import ChatServer  # noqa: E402
+
+
+class ChatClient:
+    """A raw connection to the server under test, speaking concatenated JSON"""
+
+    def __init__(self, harness: 'ChatHarness', sock: socket.socket, session):
+        self.harness = harness
+        self.socket = sock
+        self.session = session
+        self.pending = ''
+        self.decoder = json.JSONDecoder()
+        self.events: List[Dict[str, Any]] = []  # Everything received that was not a reply to call()
+
+    def send_raw(self, data: bytes) -> None:
+        """Send everything, running the server loop whenever the socket buffer is full"""
+        view = memoryview(data)
+        while view:
+            try:
+                view = view[self.socket.send(view, socket.MSG_DONTWAIT):]
+            except BlockingIOError:
+                self.harness.run_once()
+
+    def send(self, method: str, **params: Any) -> None:
+        self.send_raw(json.dumps({'method': method, 'params': params}).encode('utf-8'))
+
+    def receive(self) -> List[Dict[str, Any]]:
+        """Run the server loop, then return every message that arrived"""
+        self.harness.pump()
+        data = b''
+        while True:
+            try:
+                chunk = self.socket.recv(1024 * 1024, socket.MSG_DONTWAIT)
+            except BlockingIOError:
+                break
+            if not chunk:
+                break
+            data += chunk
+        self.pending += data.decode('utf-8')
+        messages = []
+        while self.pending:
+            message, end = self.decoder.raw_decode(self.pending)
+            messages.append(message)
+            self.pending = self.pending[end:]
+        return messages
+
+    def call(self, method: str, **params: Any) -> Dict[str, Any]:
+        """Send a request and return the first reply; pushed events are kept in ``events``"""
+        self.send(method, **params)
+        reply = None
+        for message in self.receive():
+            if reply is None and ('status' in message or 'error' in message):
+                reply = message
+            else:
+                self.events.append(message)
+        assert reply is not None, f"no reply to {method}"
+        return reply
+
+    def take_events(self, event_type: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Return (and forget) the queued events of one type, or all of them"""
+        self.events.extend(self.receive())
+        taken = [event for event in self.events if event_type is None or event.get('type') == event_type]
+        self.events = [event for event in self.events if event not in taken]
+        return taken
+
+    def join(self, username: str) -> Dict[str, Any]:
+        reply = self.call('join_chat', username=username)
+        assert reply['status'] == 'success', reply
+        return reply
+
+    def close(self) -> None:
+        self.socket.close()
+
+
+class ChatHarness:
+    """A ChatServer driven one loop iteration at a time over socketpairs, no threads or ports"""
+
+    def __init__(self, snapshot_dir: Optional[str] = None):
+        self.rpc_server = RpcServer(port=None)
+        self.chat_server = ChatServer(self.rpc_server, snapshot_dir=snapshot_dir)
+        self.ports = itertools.count(50000)
+        self.clients: List[ChatClient] = []
+
+    def connect(self) -> ChatClient:
+        server_socket, client_socket = socket.socketpair()
+        server_socket.setblocking(False)
+        client_socket.setblocking(True)  # recv uses MSG_DONTWAIT, so reading never waits
+        session = self.rpc_server.add_connection(server_socket, ('127.0.0.1', next(self.ports)))
+        client = ChatClient(self, client_socket, session)
+        self.clients.append(client)
+        return client
+
+    def listen(self, port: Optional[int] = None, unix_paths: Sequence[str] = ()) -> None:
+        """Open real listeners on 127.0.0.1:port (0 picks a free one) and unix_paths, as start_server would"""
+        rpc_server = self.rpc_server
+        rpc_server.host, rpc_server.port, rpc_server.unix_paths = '127.0.0.1', port, list(unix_paths)
+        rpc_server._create_and_bind_socket()
+        rpc_server._start_listening()
+        rpc_server._register_server_socket()
+
+    def join(self, username: str) -> ChatClient:
+        client = self.connect()
+        client.join(username)
+        client.take_events()
+        return client
+
+    def run_once(self) -> None:
+        """One iteration of the real event loop"""
+        rpc_server = self.rpc_server
+        rpc_server.is_running = True
+        rpc_server.call_soon(self._stop_loop)
+        rpc_server._event_loop()
+
+    def _stop_loop(self) -> None:
+        self.rpc_server.is_running = False
+
+    def pump(self, limit: int = 1000) -> None:
+        """Run the loop until no socket is ready and nothing is due"""
+        for _ in range(limit):
+            self.run_once()
+            if not self.rpc_server.selector.select(0) and self.rpc_server.timers.timeout() != 0.0:
+                return
+        raise AssertionError("server loop did not settle")
+
+    def close(self) -> None:
+        for client in self.clients:
+            client.close()
+        self.chat_server.stop()
+        self.rpc_server._cleanup()
+
+
+@pytest.fixture
+def harness(tmp_path, monkeypatch):
+    # Attachments and flight recorder dumps land in the working directory
+    monkeypatch.chdir(tmp_path)
+    chat = ChatHarness()
+    yield chat
+    chat.close()
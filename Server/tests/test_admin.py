@@ -0,0 +1,57 @@
+import pytest
+
+from admin import AdminApi
+
+TOKEN = 'admin-token'
+
+
+@pytest.fixture
+def admin(harness):
+    AdminApi(harness.chat_server, harness.rpc_server, TOKEN)
+    return harness.connect()
+
+
+def test_every_method_needs_the_token(admin):
+    for method in ('admin_summary', 'admin_connections', 'admin_groups', 'admin_flight_recorder'):
+        assert admin.call(method) == {'status': 'error', 'message': 'Not authorized'}
+        assert admin.call(method, token='wrong')['status'] == 'error'
+        assert admin.call(method, token=None)['status'] == 'error'
+
+
+def test_summary_counts_connections_users_and_groups(harness, admin):
+    alice = harness.join('alice')
+    alice.call('create_group', group_name='Team')
+    harness.join('bob')
+
+    summary = admin.call('admin_summary', token=TOKEN)['summary']
+    assert summary['connections'] == 3 and summary['users'] == 2
+    assert summary['groups'] == 2 and 'cluster' not in summary
+
+
+def test_connections_are_paged_and_sorted(harness, admin):
+    alice = harness.join('alice')
+    harness.join('bob')
+    for _ in range(5):
+        alice.call('get_groups')
+
+    page = admin.call('admin_connections', token=TOKEN, limit=2)
+    assert (page['count'], page['total'], page['sort']) == (2, 3, 'id')
+    assert [connection['id'] for connection in page['connections']] == [admin.session.id, alice.session.id]
+
+    busiest = admin.call('admin_connections', token=TOKEN, sort='bytes_in', limit=1)['connections']
+    assert busiest[0]['username'] == 'alice' and busiest[0]['kind'] == 'chat'
+    assert admin.call('admin_connections', token=TOKEN, sort='name')['status'] == 'error'
+    assert admin.call('admin_connections', token=TOKEN, offset='x')['status'] == 'error'
+
+
+def test_groups_are_ranked_by_rate_and_history(harness, admin):
+    alice = harness.join('alice')
+    alice.call('create_group', group_name='Team')
+    for index in range(3):
+        alice.call('send_message', message=f"hello {index}")
+
+    reply = admin.call('admin_groups', token=TOKEN, top=1)
+    assert reply['total'] == 2
+    assert [group['name'] for group in reply['busiest']] == ['Team']
+    assert reply['largest_histories'] == [{'name': 'Team', 'messages': 3}]
+    assert admin.call('admin_groups', token=TOKEN, top='many')['status'] == 'error'
@@ -0,0 +1,163 @@
+import os
+import socket
+import hashlib
+
+import pytest
+
+import attachments
+
+
+def begin(client, data, file_name='notes.txt'):
+    return client.call('begin_upload', sha256=hashlib.sha256(data).hexdigest(), size=len(data), file_name=file_name)
+
+
+def transfer(harness, header, body=b''):
+    """Open a transfer connection, send header and body, and return the connection"""
+    conn = harness.connect()
+    conn.send_raw(header + body)
+    harness.pump()
+    return conn
+
+
+def read_all(harness, conn):
+    data = b''
+    while True:
+        harness.pump()
+        try:
+            chunk = conn.socket.recv(1024 * 1024, socket.MSG_DONTWAIT)
+        except BlockingIOError:
+            continue
+        if not chunk:
+            return data
+        data += chunk
+
+
+def test_upload_is_stored_and_announced(harness):
+    alice = harness.join('alice')
+    bob = harness.join('bob')
+    data = os.urandom(100000)
+
+    reply = begin(alice, data)
+    assert reply['status'] == 'success' and reply['offset'] == 0
+    transfer(harness, f"UPLOAD {reply['upload_id']} 0\n".encode(), data)
+
+    announced, = bob.take_events('attachment')
+    assert (announced['attachment_id'], announced['size'], announced['username']) == (reply['attachment_id'], 100000, 'alice')
+    with open(os.path.join('attachments', reply['attachment_id']), 'rb') as f:
+        assert f.read() == data
+    assert begin(alice, data)['complete'] is True  # Same content again: nothing to send
+
+
+def test_interrupted_upload_resumes_at_the_server_offset(harness):
+    alice = harness.join('alice')
+    data = os.urandom(5000)
+    upload_id = begin(alice, data)['upload_id']
+
+    first = transfer(harness, f"UPLOAD {upload_id} 0\n".encode(), data[:2000])
+    first.close()
+    harness.pump()
+    reply = begin(alice, data)
+    assert reply['upload_id'] == upload_id and reply['offset'] == 2000
+
+    refused = transfer(harness, f"UPLOAD {upload_id} 0\n".encode())
+    assert refused.session.id not in harness.rpc_server.clients
+    transfer(harness, f"UPLOAD {upload_id} 2000\n".encode(), data[2000:])
+    assert harness.chat_server.attachments.has(reply['attachment_id'])
+
+
+def test_upload_with_the_wrong_hash_is_discarded(harness):
+    alice = harness.join('alice')
+    reply = alice.call('begin_upload', sha256='0' * 64, size=4, file_name='x')
+
+    transfer(harness, f"UPLOAD {reply['upload_id']} 0\n".encode(), b'abcd')
+    assert not harness.chat_server.attachments.has('0' * 64)
+    assert os.listdir('attachments') == []
+
+
+def test_invalid_declarations_are_rejected(harness):
+    alice = harness.join('alice')
+
+    assert alice.call('begin_upload', sha256='xyz', size=1, file_name='a')['status'] == 'error'
+    assert alice.call('begin_upload', sha256='0' * 64, size=0, file_name='a')['status'] == 'error'
+    assert harness.connect().call('begin_upload', sha256='0' * 64, size=1, file_name='a')['status'] == 'error'
+
+
+@pytest.mark.parametrize('sendfile', [True, False])
+def test_download_from_an_offset(harness, monkeypatch, sendfile):
+    monkeypatch.setattr(attachments, 'HAS_SENDFILE', sendfile)
+    alice = harness.join('alice')
+    data = os.urandom(300000)
+    reply = begin(alice, data)
+    transfer(harness, f"UPLOAD {reply['upload_id']} 0\n".encode(), data)
+
+    conn = transfer(harness, f"DOWNLOAD {reply['attachment_id']} 1000\n".encode())
+    assert read_all(harness, conn) == b'OK 300000\n' + data[1000:]
+    assert transfer(harness, b"DOWNLOAD " + b'f' * 64 + b" 0\n").session.id not in harness.rpc_server.clients
+
+
+def test_failing_transfer_closes_only_its_connection(harness, monkeypatch):
+    alice = harness.join('alice')
+    data = b'payload'
+    reply = begin(alice, data)
+
+    def fail(upload, session):
+        raise FileNotFoundError('part file vanished')
+    monkeypatch.setattr(harness.chat_server.attachments, 'finish_upload', fail)
+    conn = transfer(harness, f"UPLOAD {reply['upload_id']} 0\n".encode(), data)
+
+    assert conn.session.id not in harness.rpc_server.clients
+    assert alice.call('get_groups')['status'] == 'success'
+
+
+def test_concurrent_uploads_of_the_same_content(harness):
+    alice = harness.join('alice')
+    bob = harness.join('bob')
+    data = os.urandom(50000)
+    alice_upload = begin(alice, data)['upload_id']
+    bob_upload = begin(bob, data)['upload_id']
+
+    alice_conn = transfer(harness, f"UPLOAD {alice_upload} 0\n".encode(), data[:20000])
+    bob_conn = transfer(harness, f"UPLOAD {bob_upload} 0\n".encode(), data[:30000])
+    alice_conn.send_raw(data[20000:])
+    bob_conn.send_raw(data[30000:])
+    harness.pump()
+
+    assert alice_conn.session.id not in harness.rpc_server.clients
+    assert bob_conn.session.id not in harness.rpc_server.clients
+    assert [event['username'] for event in alice.take_events('attachment')] == ['alice', 'bob']
+    with open(os.path.join('attachments', hashlib.sha256(data).hexdigest()), 'rb') as f:
+        assert f.read() == data
+    assert [name for name in os.listdir('attachments') if name.endswith('.part')] == []
+    assert alice.call('get_groups')['status'] == 'success'
+
+
+def test_leaving_cancels_only_your_own_upload(harness):
+    alice = harness.join('alice')
+    bob = harness.join('bob')
+    data = os.urandom(1000)
+    alice_upload = begin(alice, data)['upload_id']
+    bob_upload = begin(bob, data)['upload_id']
+    transfer(harness, f"UPLOAD {alice_upload} 0\n".encode(), data[:100]).close()
+    transfer(harness, f"UPLOAD {bob_upload} 0\n".encode(), data[:500]).close()
+    harness.pump()
+
+    alice.call('leave_chat')
+    transfer(harness, f"UPLOAD {bob_upload} 500\n".encode(), data[500:])
+    with open(os.path.join('attachments', hashlib.sha256(data).hexdigest()), 'rb') as f:
+        assert f.read() == data
+
+
+def test_expired_session_cancels_its_uploads(harness):
+    alice = harness.connect()
+    token = alice.join('alice')['session_token']
+    data = os.urandom(1000)
+    upload_id = begin(alice, data)['upload_id']
+    transfer(harness, f"UPLOAD {upload_id} 0\n".encode(), data[:100]).close()
+    alice.close()
+    harness.pump()
+    assert len(os.listdir('attachments')) == 1  # Still resumable
+
+    harness.chat_server.detached_sessions[token] = 0.0  # Detached long ago
+    newcomer = harness.join('alice')  # Joining expires old sessions, then takes the free name
+    assert os.listdir('attachments') == [] and harness.chat_server.attachments.uploads == {}
+    assert begin(newcomer, data)['offset'] == 0
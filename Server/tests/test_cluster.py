@@ -0,0 +1,144 @@
+import hmac
+import time
+import hashlib
+
+import pytest
+
+from conftest import ChatHarness
+from cluster import ClusterNode
+
+SECRET = 'test-secret'
+
+
+@pytest.fixture
+def nodes(tmp_path, monkeypatch):
+    """Nodes a and b, each with a real TCP listener, not linked until link() is called"""
+    monkeypatch.chdir(tmp_path)
+    chats = {}
+    for node_id in ('a', 'b'):
+        chats[node_id] = ChatHarness()
+        chats[node_id].listen(0)
+    yield chats
+    for chat in chats.values():
+        chat.close()
+
+
+def link(chats):
+    addresses = {node_id: chat.rpc_server.socket.getsockname() for node_id, chat in chats.items()}
+    for node_id, chat in chats.items():
+        ClusterNode(chat.chat_server, chat.rpc_server, node_id,
+                    {peer: address for peer, address in addresses.items() if peer != node_id}, SECRET)
+    run_until(chats, lambda: all(chat.chat_server.cluster.links for chat in chats.values()))
+
+
+def run_until(chats, condition):
+    deadline = time.monotonic() + 5.0
+    while not condition():
+        assert time.monotonic() < deadline, "condition not reached"
+        for chat in chats.values():
+            chat.run_once()
+    for _ in range(20):  # Let the frames already sent arrive
+        for chat in chats.values():
+            chat.run_once()
+
+
+def test_linked_nodes_share_users(nodes):
+    link(nodes)
+    alice = nodes['a'].join('alice')
+    run_until(nodes, lambda: 'alice' in nodes['b'].chat_server.remote_users)
+
+    users = nodes['b'].join('bob').call('get_users')['users']
+    assert {'username': 'alice', 'address': 'node:a'} in users
+    assert nodes['b'].connect().join('alice')['message'].startswith('Joined chat as alice_')
+    assert alice.call('get_groups')['status'] == 'success'
+
+
+def test_name_taken_on_both_sides_is_kept_by_the_smaller_node_id(nodes):
+    alice_a = nodes['a'].join('alice')
+    alice_b = nodes['b'].connect()
+    token = alice_b.join('alice')['session_token']
+    alice_b.take_events()
+
+    link(nodes)
+    run_until(nodes, lambda: 'alice_b' in nodes['a'].chat_server.remote_users)
+    chat_a, chat_b = nodes['a'].chat_server, nodes['b'].chat_server
+    assert chat_a.user_sessions['alice'] is alice_a.session and 'alice' not in chat_a.remote_users
+    assert chat_b.user_sessions['alice_b'] is alice_b.session and chat_b.remote_users['alice'] == 'a'
+    assert chat_b.sessions[token]['username'] == 'alice_b'
+    notice, = [event for event in alice_b.take_events('system') if 'new_username' in event]
+    assert notice['new_username'] == 'alice_b'
+
+
+def test_reserved_name_is_renamed_too(nodes):
+    nodes['a'].join('alice')
+    alice_b = nodes['b'].connect()
+    token = alice_b.join('alice')['session_token']
+    alice_b.close()
+    nodes['b'].pump()
+    assert nodes['b'].chat_server.reserved_usernames == {'alice': token}
+
+    link(nodes)
+    assert nodes['b'].chat_server.reserved_usernames == {'alice_b': token}
+    assert nodes['b'].connect().call('resume', session_token=token)['username'] == 'alice_b'
+
+
+def test_peer_header_proves_the_secret_without_sending_it(harness):
+    node = ClusterNode(harness.chat_server, harness.rpc_server, 'a', {'b': ('127.0.0.1', 9)}, SECRET)
+    stamp = f"{time.time():.3f}"
+    header = ['b', stamp, 'nonce1', node.link_mac('b', 'a', stamp, 'nonce1')]
+
+    assert SECRET not in ' '.join(header)
+    assert node._authenticate(header)
+    assert not node._authenticate(header)  # Replayed
+    assert not node._authenticate(['b', stamp, 'nonce2', node.link_mac('a', 'b', stamp, 'nonce2')])  # For another link
+    assert not node._authenticate(['c', stamp, 'nonce3', node.link_mac('c', 'a', stamp, 'nonce3')])  # Not a peer
+    old = f"{time.time() - 3600:.3f}"
+    assert not node._authenticate(['b', old, 'nonce4', node.link_mac('b', 'a', old, 'nonce4')])
+
+    forged = hmac.new(b'other-secret', f"b a {stamp} nonce5".encode(), hashlib.sha256).hexdigest()
+    assert not node._authenticate(['b', stamp, 'nonce5', forged])
+
+
+def test_direct_history_survives_a_lost_link(nodes):
+    link(nodes)
+    alice = nodes['a'].join('alice')
+    bob = nodes['b'].join('bob')
+    run_until(nodes, lambda: 'bob' in nodes['a'].chat_server.remote_users)
+    assert alice.call('send_direct_message', to='bob', message='hello')['status'] == 'success'
+    run_until(nodes, lambda: bob.take_events('direct_message'))
+
+    for peer_link in list(nodes['b'].chat_server.cluster.links.values()):
+        nodes['b'].rpc_server.disconnect_session(peer_link.session.id)
+    run_until(nodes, lambda: not nodes['a'].chat_server.remote_users)
+    nodes['b'].chat_server.cluster.dial_peers()
+    run_until(nodes, lambda: 'bob' in nodes['a'].chat_server.remote_users)
+
+    for client, peer in ((alice, 'bob'), (bob, 'alice')):
+        history = client.call('get_direct_history', **{'with': peer})['message_history']
+        assert [record['message'] for record in history] == ['hello']
+
+
+def test_direct_history_goes_when_the_peer_leaves_its_node(nodes):
+    link(nodes)
+    alice = nodes['a'].join('alice')
+    bob = nodes['b'].join('bob')
+    run_until(nodes, lambda: 'bob' in nodes['a'].chat_server.remote_users)
+    alice.call('send_direct_message', to='bob', message='hello')
+
+    bob.call('leave_chat')
+    run_until(nodes, lambda: not nodes['a'].chat_server.remote_users)
+    assert nodes['a'].chat_server.direct_messages.channels == {}
+
+
+def test_direct_history_with_a_remote_user_survives_a_restart(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    first = ChatHarness(snapshot_dir='state')
+    ClusterNode(first.chat_server, first.rpc_server, 'a', {'b': ('127.0.0.1', 9)}, SECRET)
+    first.chat_server.apply_remote_user('b', 'bob', True)
+    alice = first.join('alice')
+    assert alice.call('send_direct_message', to='bob', message='hello')['status'] == 'success'
+    first.close()
+
+    second = ChatHarness(snapshot_dir='state')  # Not linked to b yet, so bob is unknown here
+    assert [record[3] for record in second.chat_server.direct_messages.find('alice', 'bob').history] == ['hello']
+    second.close()
@@ -0,0 +1,42 @@
+def test_get_users_is_not_modified_until_the_roster_changes(harness):
+    alice = harness.join('alice')
+    reply = alice.call('get_users')
+    assert [user['username'] for user in reply['users']] == ['alice']
+    version = reply['version']
+
+    assert alice.call('get_users', if_version=version) == {'status': 'success', 'not_modified': True, 'version': version}
+
+    harness.join('bob')
+    reply = alice.call('get_users', if_version=version)
+    assert 'not_modified' not in reply and reply['version'] != version
+    assert sorted(user['username'] for user in reply['users']) == ['alice', 'bob']
+
+
+def test_get_users_reuses_the_encoded_response(harness):
+    alice = harness.join('alice')
+    alice.call('get_users')
+    cached = harness.chat_server.users_response
+    assert alice.call('get_users')['version'] == cached[0]
+    assert harness.chat_server.users_response is cached
+
+    harness.join('bob')
+    alice.call('get_users')
+    assert harness.chat_server.users_response is not cached
+
+
+def test_get_group_members_is_not_modified_until_membership_changes(harness):
+    alice = harness.join('alice')
+    reply = alice.call('get_group_members')
+    assert reply['members'] == ['alice']
+    version = reply['member_version']
+
+    assert alice.call('get_group_members', if_version=version) == {
+        'status': 'success', 'group_name': 'General', 'not_modified': True, 'member_version': version}
+
+    harness.join('bob')
+    reply = alice.call('get_group_members', if_version=version)
+    assert sorted(reply['members']) == ['alice', 'bob'] and reply['member_version'] > version
+
+
+def test_get_group_members_outside_a_group_is_an_error(harness):
+    assert harness.connect().call('get_group_members', if_version=1)['status'] == 'error'
@@ -0,0 +1,110 @@
+from direct_messages import DirectMessageStore
+from conftest import ChatHarness
+
+
+def test_store_keys_channels_by_user_pair():
+    store = DirectMessageStore()
+    store.get('bob', 'alice').append('bob', 'hi', 1.0)
+
+    channel = store.find('alice', 'bob')
+    assert channel.users == ('alice', 'bob')
+    assert channel.sender_of(channel.history[0]) == 'bob'
+    assert store.find('alice', 'carol') is None and len(store.channels) == 1
+
+
+def test_store_forgets_a_users_channels():
+    store = DirectMessageStore()
+    store.get('alice', 'bob')
+    store.get('alice', 'carol')
+    store.get('bob', 'carol')
+
+    assert store.forget('alice')
+    assert list(store.channels) == [('bob', 'carol')]
+    assert store.by_user == {'bob': {('bob', 'carol')}, 'carol': {('bob', 'carol')}}
+    assert not store.forget('alice')
+
+
+def test_direct_message_reaches_only_the_peer(harness):
+    alice = harness.join('alice')
+    bob = harness.join('bob')
+    carol = harness.join('carol')
+
+    reply = alice.call('send_direct_message', to='bob', message=' hello ')
+    assert reply == {'status': 'success', 'message': 'Message sent successfully', 'to': 'bob', 'seq': 1}
+    message, = bob.take_events('direct_message')
+    assert (message['message'], message['username'], message['direct_peer']) == ('hello', 'alice', 'alice')
+    assert carol.take_events('direct_message') == []
+
+    history = bob.call('get_direct_history', **{'with': 'alice'})['message_history']
+    assert [(record['message'], record['is_own_message']) for record in history] == [('hello', False)]
+
+
+def test_direct_message_errors(harness):
+    alice = harness.join('alice')
+
+    assert alice.call('send_direct_message', to='nobody', message='hi')['status'] == 'error'
+    assert alice.call('send_direct_message', to='alice', message='hi')['status'] == 'error'
+    assert harness.connect().call('send_direct_message', to='alice', message='hi')['status'] == 'error'
+
+
+def test_history_lookup_creates_no_channel(harness):
+    alice = harness.join('alice')
+    harness.join('bob')
+
+    reply = alice.call('get_direct_history', **{'with': 'bob'})
+    assert reply['status'] == 'success' and reply['message_history'] == []
+    assert harness.chat_server.direct_messages.channels == {}
+
+
+def test_next_holder_of_a_name_cannot_read_its_history(harness):
+    alice = harness.join('alice')
+    bob = harness.join('bob')
+    alice.call('send_direct_message', to='bob', message='secret')
+    alice.call('leave_chat')
+
+    impostor = harness.join('alice')
+    assert impostor.session.username == 'alice'
+    assert impostor.call('get_direct_history', **{'with': 'bob'})['message_history'] == []
+    assert bob.call('get_direct_history', **{'with': 'alice'})['message_history'] == []
+
+
+def test_history_survives_a_resumable_disconnect_but_not_expiry(harness, monkeypatch):
+    alice = harness.connect()
+    token = alice.join('alice')['session_token']
+    bob = harness.join('bob')
+    bob.call('send_direct_message', to='alice', message='are you there?')
+    alice.close()
+    harness.pump()
+
+    again = harness.connect()
+    again.call('resume', session_token=token)
+    assert len(again.call('get_direct_history', **{'with': 'bob'})['message_history']) == 1
+
+    again.close()
+    harness.pump()
+    harness.chat_server.detached_sessions[token] = 0.0  # Detached long ago
+    harness.chat_server._expire_detached_sessions()
+    assert harness.chat_server.direct_messages.channels == {}
+
+
+def test_forgotten_history_stays_gone_after_a_restart(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    first = ChatHarness(snapshot_dir='state')
+    alice = first.join('alice')
+    bob = first.join('bob')
+    first.join('carol')
+    alice.call('send_direct_message', to='bob', message='gone with alice')
+    chat = first.chat_server
+    chat.snapshots.write_snapshot(chat._capture_state())
+
+    alice.call('leave_chat')
+    bob.call('send_direct_message', to='carol', message='kept')
+    first.pump()
+    chat.snapshots.close()  # Crash: the snapshot plus the log is all there is
+    first.rpc_server._cleanup()
+
+    second = ChatHarness(snapshot_dir='state')
+    try:
+        assert list(second.chat_server.direct_messages.channels) == [('bob', 'carol')]
+    finally:
+        second.close()
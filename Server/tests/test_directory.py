@@ -0,0 +1,58 @@
+def test_groups_are_paged_in_name_order(harness):
+    alice = harness.join('alice')
+    for name in ('beta', 'Alpha', 'gamma', 'alpine'):
+        harness.join(f"owner_{name}").call('create_group', group_name=name)
+
+    reply = alice.call('get_groups', limit=2)
+    assert [group['name'] for group in reply['groups']] == ['Alpha', 'alpine']
+    assert reply['total'] == 5 and reply['limit'] == 2
+
+    reply = alice.call('get_groups', offset=2, limit=2)
+    assert [group['name'] for group in reply['groups']] == ['beta', 'gamma']
+
+
+def test_prefix_filter_is_case_insensitive(harness):
+    alice = harness.join('alice')
+    for name in ('Alpha', 'alpine', 'beta'):
+        harness.join(f"owner_{name}").call('create_group', group_name=name)
+
+    reply = alice.call('get_groups', prefix='ALP')
+    assert [group['name'] for group in reply['groups']] == ['Alpha', 'alpine']
+    assert reply['groups'][0]['member_count'] == 1 and reply['groups'][0]['creator'] == 'owner_Alpha'
+
+
+def test_unchanged_directory_is_not_modified(harness):
+    alice = harness.join('alice')
+    version = alice.call('get_groups')['version']
+
+    assert alice.call('get_groups', if_version=version) == {
+        'status': 'success', 'not_modified': True, 'version': version}
+    harness.join('bob').call('create_group', group_name='Team')
+    assert 'groups' in alice.call('get_groups', if_version=version)
+
+
+def test_joins_and_leaves_keep_the_directory_version(harness):
+    alice = harness.join('alice')
+    version = alice.call('get_groups')['version']
+
+    bob = harness.join('bob')
+    bob.call('leave_chat')
+    assert alice.call('get_groups', if_version=version)['not_modified']
+    assert alice.call('get_groups')['groups'] == [{'name': 'General', 'creator': 'SYSTEM', 'member_count': 1}]
+
+
+def test_prefix_ending_in_the_last_code_point(harness):
+    alice = harness.join('alice')
+    for name in ('a\U0010ffff', 'a\U0010ffffb', 'b'):
+        harness.join(f"owner_{name}").call('create_group', group_name=name)
+
+    reply = alice.call('get_groups', prefix='a\U0010ffff')
+    assert [group['name'] for group in reply['groups']] == ['a\U0010ffff', 'a\U0010ffffb']
+    assert alice.call('get_groups', prefix='\U0010ffff')['total'] == 0
+
+
+def test_bad_paging_parameters(harness):
+    alice = harness.join('alice')
+
+    assert alice.call('get_groups', offset='x')['status'] == 'error'
+    assert alice.call('get_groups', limit=10 ** 6)['limit'] == 200
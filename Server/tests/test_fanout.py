@@ -0,0 +1,60 @@
+import itertools
+import types
+
+import pytest
+
+import fanout
+from constants import ChatServerConfig
+
+
+@pytest.fixture(autouse=True)
+def small_chunks(monkeypatch):
+    monkeypatch.setattr(ChatServerConfig, 'FANOUT_CHUNK_SIZE', 2)
+    monkeypatch.setattr(ChatServerConfig, 'PRESENCE_FLUSH_INTERVAL', 0.0)
+
+
+def test_large_broadcast_is_spread_over_loop_iterations(harness, monkeypatch):
+    # Every clock reading takes 1 ms, so each run fits about two chunks in its budget
+    clock = itertools.count(step=0.001)
+    monkeypatch.setattr(fanout, 'time', types.SimpleNamespace(perf_counter=lambda: next(clock)))
+    monkeypatch.setattr(ChatServerConfig, 'FANOUT_TICK_BUDGET', 0.0025)
+    members = [harness.join(f"user{index}") for index in range(6)]
+    for member in members:
+        member.take_events()
+
+    scheduler = harness.chat_server.fanout
+    delivered = scheduler.deliveries
+    members[0].send('send_message', message='hello')
+    harness.run_once()
+    assert scheduler.is_busy('General') and 0 < scheduler.deliveries - delivered < 5
+    harness.pump()
+    assert not scheduler.is_busy('General') and scheduler.deliveries - delivered == 5
+
+    for member in members[1:]:
+        assert [event['message'] for event in member.take_events('message')] == ['hello']
+    assert members[0].take_events('message') == []
+    stats = scheduler.stats()
+    assert stats['jobs_completed'] == stats['jobs_submitted'] and stats['pending_deliveries'] == 0
+
+
+def test_messages_to_a_busy_group_keep_their_order(harness):
+    members = [harness.join(f"user{index}") for index in range(4)]
+    for member in members:
+        member.take_events()
+
+    for text in ('one', 'two', 'three'):
+        members[0].call('send_message', message=text)
+    members[1].call('send_message', message='four')
+
+    assert [event['message'] for event in members[2].take_events('message')] == ['one', 'two', 'three', 'four']
+
+
+def test_cancelled_fanout_is_not_delivered(harness):
+    members = [harness.join(f"user{index}") for index in range(4)]
+    scheduler = harness.chat_server.fanout
+
+    scheduler.submit('General', [member.session.id for member in members], b'{"type": "cancelled"}')
+    scheduler.cancel('General')
+    harness.pump()
+    assert not scheduler.is_busy('General')
+    assert all(member.take_events('cancelled') == [] for member in members)
@@ -0,0 +1,63 @@
+import os
+import json
+
+from admin import AdminApi
+from flight_recorder import FlightRecorder
+
+
+def read_dump(path):
+    with open(path, encoding='utf-8') as dump_file:
+        header, *events = [json.loads(line) for line in dump_file]
+    return header, events
+
+
+def test_ring_keeps_the_newest_events():
+    recorder = FlightRecorder(size=3)
+    for index in range(5):
+        recorder.record('call', index, 'method', index)
+
+    assert [event[2] for event in recorder.recent()] == [2, 3, 4]
+    assert [event[2] for event in recorder.recent(2)] == [3, 4]
+    assert recorder.recorded == 5
+
+
+def test_dump_writes_a_header_and_one_line_per_event(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    recorder = FlightRecorder(size=8)
+    recorder.record('accept', 1, '127.0.0.1:5000')
+    recorder.record('error', 1, object())  # Not JSON: written as its repr
+
+    header, events = read_dump(recorder.dump('test', 'details'))
+    assert (header['reason'], header['events'], header['details']) == ('test', 2, 'details')
+    assert [event[1] for event in events] == ['accept', 'error']
+
+
+def test_server_records_connections_and_calls(harness):
+    alice = harness.join('alice')
+    alice.close()
+    harness.pump()
+
+    kinds = [(kind, session_id, detail) for _, kind, session_id, detail, _ in harness.rpc_server.recorder.recent()]
+    assert ('call', alice.session.id, 'join_chat') in kinds
+    assert ('close', alice.session.id, 'alice') in kinds
+
+
+def test_loop_crash_is_dumped(harness, monkeypatch):
+    def crash():
+        raise RuntimeError('boom')
+    monkeypatch.setattr(harness.rpc_server, '_remove_closing', crash)
+    harness.run_once()
+
+    dump, = os.listdir('flight_records')
+    header, events = read_dump(os.path.join('flight_records', dump))
+    assert header['reason'] == 'crash' and 'RuntimeError: boom' in header['details']
+    assert events[-1][1] == 'crash'
+
+
+def test_admin_method_returns_and_dumps_recent_events(harness):
+    AdminApi(harness.chat_server, harness.rpc_server, 'token')
+    admin = harness.connect()
+
+    reply = admin.call('admin_flight_recorder', token='token', limit=1, dump=True)
+    assert len(reply['events']) == 1 and reply['events'][0][1] == 'accept'
+    assert os.path.exists(reply['dump_path'])
@@ -0,0 +1,83 @@
+import json
+import random
+import socket
+
+from constants import ErrorCodes, RpcServerConfig
+from framing import RequestFramer
+
+
+def test_frames_split_anywhere_are_reassembled():
+    requests = [{'method': 'send_message', 'params': {'message': text}}
+                for text in ('plain', 'quote " and brace }', 'back\\slash\\', 'Xin chào 👋', '[{]}')]
+    stream = b' \n'.join(json.dumps(request, ensure_ascii=False).encode('utf-8') for request in requests)
+    rng = random.Random(7)
+
+    for _ in range(200):
+        framer = RequestFramer()
+        frames = []
+        pos = 0
+        while pos < len(stream):
+            size = rng.randint(1, 9)
+            frames += framer.feed(stream[pos:pos + size])
+            pos += size
+        assert [json.loads(frame) for frame in frames] == requests
+        assert framer.pending() == 0
+
+
+def test_unfinished_frame_is_held_back():
+    framer = RequestFramer()
+    assert framer.feed(b'{"method": "a"} {"method": "b", "params": {"x": "}') == [b'{"method": "a"}']
+    assert framer.pending() == len(b'{"method": "b", "params": {"x": "}')
+    assert framer.feed(b'"}}') == [b'{"method": "b", "params": {"x": "}"}}']
+
+
+def test_text_that_is_not_an_object_is_one_frame():
+    assert RequestFramer().feed(b'  hello {"method": "a"}') == [b'hello {"method": "a"}']
+
+
+def test_multibyte_character_split_between_reads(harness):
+    alice = harness.join('alice')
+    bob = harness.join('bob')
+    request = json.dumps({'method': 'send_message', 'params': {'message': 'chào 👋'}}, ensure_ascii=False)
+    data = request.encode('utf-8')
+    split = data.index('👋'.encode('utf-8')) + 2
+
+    alice.send_raw(data[:split])
+    harness.pump()
+    alice.send_raw(data[split:])
+    assert alice.receive()[0]['status'] == 'success'
+    assert bob.take_events('message')[0]['message'] == 'chào 👋'
+
+
+def test_malformed_request_gets_parse_error_and_the_next_one_is_served(harness):
+    alice = harness.join('alice')
+
+    alice.send_raw(b'{"method": "get_users", "params": {]}{"method": "get_groups", "params": {}}')
+    replies = alice.receive()
+    assert replies[0] == {'error': 'Invalid JSON', 'code': ErrorCodes.PARSE_ERROR}
+    assert 'groups' in replies[1]
+
+
+def test_invalid_utf8_gets_parse_error(harness):
+    alice = harness.join('alice')
+
+    alice.send_raw(b'{"method": "send_message", "params": {"message": "\xff"}}')
+    assert alice.receive() == [{'error': 'Invalid JSON', 'code': ErrorCodes.PARSE_ERROR}]
+    assert alice.session.id in harness.rpc_server.clients
+
+
+def test_plain_text_is_rejected(harness):
+    alice = harness.join('alice')
+
+    alice.send_raw(b'hello\n')
+    assert alice.receive() == [{'error': 'Only JSON RPC messages are supported', 'code': ErrorCodes.INVALID_REQUEST}]
+    assert alice.call('get_groups')['status'] == 'success'
+
+
+def test_oversized_request_closes_the_connection(harness):
+    alice = harness.join('alice')
+
+    alice.send_raw(b'{"method": "send_message", "params": {"message": "' + b'x' * (RpcServerConfig.MAX_REQUEST_SIZE + 1))
+    assert alice.receive() == [{'error': 'Request too large', 'code': ErrorCodes.PARSE_ERROR}]
+    assert alice.session.id not in harness.rpc_server.clients
+    assert alice.socket.recv(1, socket.MSG_DONTWAIT) == b''
@@ -0,0 +1,114 @@
+import time
+import errno
+import socket
+import threading
+
+import pytest
+
+import handoff
+from constants import ChatServerConfig
+
+
+@pytest.fixture
+def old_server(harness, monkeypatch):
+    monkeypatch.setattr(ChatServerConfig, 'HANDOFF_TIMEOUT', 5.0)
+    harness.chat_server.enable_handoff()
+    return harness
+
+
+def successor(acknowledge: bool):
+    """Take over in a thread, like main.py --takeover; returns the thread and what it received"""
+    received = {}
+
+    def run():
+        conn, received['state'], received['sockets'] = handoff.receive_state(ChatServerConfig.HANDOFF_PATH, 5.0)
+        if acknowledge:
+            conn.sendall(handoff.ACK)
+        conn.close()
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread, received
+
+
+def run_until(harness, condition):
+    deadline = time.monotonic() + 5.0
+    while not condition():
+        assert time.monotonic() < deadline, "condition not reached"
+        harness.run_once()
+
+
+def test_successor_takes_every_connection(old_server):
+    alice = old_server.join('alice')
+    old_server.join('bob')
+    thread, received = successor(acknowledge=True)
+
+    run_until(old_server, lambda: old_server.chat_server.handed_off)
+    thread.join()
+    assert old_server.rpc_server.clients == {}
+    assert [session[4] for session in received['state']['rpc']['sessions']] == ['alice', 'bob']
+
+    received['sockets'][0].sendall(b'{"from": "successor"}')
+    assert alice.receive()[-1] == {'from': 'successor'}
+    for sock in received['sockets']:
+        sock.close()
+
+
+def test_server_carries_on_when_the_successor_does_not_acknowledge(old_server):
+    alice = old_server.join('alice')
+    thread, _ = successor(acknowledge=False)
+
+    run_until(old_server, lambda: not thread.is_alive() and old_server.chat_server.handoff_listener is not None)
+    assert not old_server.chat_server.handed_off
+    assert old_server.rpc_server.pause_selector is None
+    assert alice.call('get_groups')['status'] == 'success'
+
+
+def test_requests_wait_while_the_loop_is_paused(harness):
+    alice = harness.join('alice')
+    watched, peer = socket.socketpair()
+    replied_while_paused = []
+
+    def on_readable():
+        watched.recv(1)
+        try:
+            alice.socket.recv(1, socket.MSG_DONTWAIT)
+            replied_while_paused.append(True)
+        except BlockingIOError:
+            replied_while_paused.append(False)
+        harness.rpc_server.resume()
+
+    harness.rpc_server.pause(watched, on_readable, 5.0, lambda: None)
+    alice.send('get_groups')
+    peer.send(b'x')
+    assert alice.call('get_users')['status'] == 'success'
+    assert replied_while_paused == [False]
+    watched.close()
+    peer.close()
+
+
+def test_pause_ends_after_its_timeout(harness):
+    alice = harness.join('alice')
+    watched, peer = socket.socketpair()
+    timed_out = []
+
+    harness.rpc_server.pause(watched, lambda: None, 0.05, lambda: timed_out.append(True))
+    assert alice.call('get_groups')['status'] == 'success'
+    assert timed_out == [True] and harness.rpc_server.pause_selector is None
+    watched.close()
+    peer.close()
+
+
+def test_listen_keeps_a_live_socket(old_server):
+    with pytest.raises(OSError) as raised:
+        handoff.listen(ChatServerConfig.HANDOFF_PATH)
+    assert raised.value.errno == errno.EADDRINUSE
+
+    old_server.pump()  # The probe connection sent no hello, so nothing is handed off
+    assert old_server.chat_server.handoff_conn is None
+    assert old_server.chat_server.handoff_listener is not None
+
+
+def test_listen_replaces_a_stale_socket(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    handoff.listen('stale.handoff').close()
+    handoff.listen('stale.handoff').close()
@@ -0,0 +1,41 @@
+import json
+import socket
+
+from constants import Lane, RpcServerConfig
+
+
+def test_control_frames_overtake_queued_bulk_frames(harness):
+    client = harness.connect()
+    rpc_server = harness.rpc_server
+    for index in range(3):
+        rpc_server.send_encoded(client.session, json.dumps({'type': 'message', 'n': index}).encode(), Lane.BULK)
+    rpc_server.send_json_to_client(client.session, {'type': 'system', 'n': 'control'})
+
+    assert [message['n'] for message in client.receive()] == ['control', 0, 1, 2]
+
+
+def test_bulk_gets_a_turn_after_a_burst_of_control(harness, monkeypatch):
+    monkeypatch.setattr(RpcServerConfig, 'CONTROL_BURST', 2)
+    session = harness.connect().session
+    rpc_server = harness.rpc_server
+    for index in range(2):
+        rpc_server._queue_frame(session, b'b%d' % index, Lane.BULK)
+    for index in range(5):
+        rpc_server._queue_frame(session, b'c%d' % index, Lane.CONTROL)
+
+    order = []
+    while (frame := rpc_server._next_frame(session)) is not None:
+        order.append(frame)
+    assert order == [b'c0', b'c1', b'b0', b'c2', b'c3', b'b1', b'c4']
+
+
+def test_slow_reader_is_disconnected(harness, monkeypatch):
+    monkeypatch.setattr(RpcServerConfig, 'MAX_OUTBOUND_BYTES', 1000)
+    client = harness.join('alice')
+    client.socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1024)
+    for _ in range(2000):
+        harness.rpc_server.send_encoded(client.session, b'x' * 100)
+        harness.run_once()
+        if client.session.id not in harness.rpc_server.clients:
+            break
+    assert client.session.id not in harness.rpc_server.clients
@@ -0,0 +1,63 @@
+import pytest
+
+from constants import ChatServerConfig
+
+
+@pytest.fixture(autouse=True)
+def immediate_presence(monkeypatch):
+    monkeypatch.setattr(ChatServerConfig, 'PRESENCE_FLUSH_INTERVAL', 0.0)
+
+
+def test_join_and_leave_arrive_as_versioned_deltas(harness):
+    alice = harness.connect()
+    version = alice.join('alice')['member_version']
+    alice.take_events()
+    bob = harness.join('bob')
+
+    joined, = alice.take_events('members_delta')
+    assert joined['added'] == ['bob'] and joined['removed'] == []
+    assert joined['base_version'] == version and joined['member_version'] == version + 1
+    assert joined['count'] == 2
+
+    bob.call('leave_chat')
+    left, = alice.take_events('members_delta')
+    assert left['removed'] == ['bob'] and left['base_version'] == joined['member_version']
+
+
+def test_replies_carry_the_member_version(harness):
+    alice = harness.join('alice')
+    reply = alice.call('create_group', group_name='Team')
+    assert reply['members'] == ['alice'] and reply['member_version'] == 1
+
+    bob = harness.join('bob')
+    reply = bob.call('join_group', group_name='Team')
+    assert sorted(reply['members']) == ['alice', 'bob'] and reply['member_version'] == 2
+    assert alice.take_events('members_delta')[-1]['member_version'] == 2
+
+
+def test_rename_is_a_leave_and_a_join(harness):
+    alice = harness.join('alice')
+    bob = harness.join('bob')
+    alice.take_events()
+
+    bob.join('robert')
+    left, joined = alice.take_events('members_delta')
+    assert left['removed'] == ['bob'] and joined['added'] == ['robert']
+    assert joined['base_version'] == left['member_version']
+
+
+def test_switching_groups_leaves_the_previous_one(harness):
+    alice = harness.join('alice')
+    bob = harness.join('bob')
+    bob.take_events()
+
+    alice.call('create_group', group_name='Team')
+    left, = bob.take_events('members_delta')
+    assert left['removed'] == ['alice']
+    harness.join('carol').call('create_group', group_name='Side')
+    alice.call('join_group', group_name='Side')
+    assert 'Team' not in harness.chat_server.groups  # Alice was its last member
+
+    alice.close()
+    harness.pump()
+    assert bob.call('get_group_members')['members'] == ['bob']
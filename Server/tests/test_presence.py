@@ -0,0 +1,55 @@
+import time
+
+import pytest
+
+from constants import ChatServerConfig
+
+INTERVAL = 0.05
+
+
+@pytest.fixture(autouse=True)
+def short_interval(monkeypatch):
+    monkeypatch.setattr(ChatServerConfig, 'PRESENCE_FLUSH_INTERVAL', INTERVAL)
+
+
+def wait_for_flush(harness):
+    time.sleep(INTERVAL * 1.5)
+    harness.pump()
+
+
+def test_burst_is_aggregated_into_one_event(harness):
+    alice = harness.join('alice')
+    wait_for_flush(harness)
+    alice.take_events()
+
+    bob = harness.join('bob')  # First change after a quiet interval goes out at once
+    assert [delta['added'] for delta in alice.take_events('members_delta')] == [['bob']]
+
+    for name in ('carol', 'dave', 'erin'):
+        harness.join(name)
+    bob.call('leave_chat')
+    assert alice.take_events('members_delta') == []
+
+    wait_for_flush(harness)
+    delta, = alice.take_events('members_delta')
+    assert sorted(delta['added']) == ['carol', 'dave', 'erin'] and delta['removed'] == ['bob']
+    assert delta['message'] == 'carol, dave and erin have joined the chat! bob has left the chat!'
+    assert delta['count'] == 4
+
+
+def test_join_and_leave_within_an_interval_cancel_out(harness):
+    alice = harness.join('alice')
+    harness.join('bob')
+    wait_for_flush(harness)
+    alice.take_events()
+
+    carol = harness.join('carol')
+    carol.call('leave_chat')
+    wait_for_flush(harness)
+    assert alice.take_events('members_delta') == []
+
+
+def test_long_name_lists_are_shortened(harness):
+    names = [f"user{index}" for index in range(5)]
+    assert harness.chat_server._format_presence_message(names, []) == \
+        'user0, user1, user2 and 2 others have joined the chat!'
@@ -0,0 +1,61 @@
+def test_resume_replays_missed_messages(harness):
+    alice = harness.join('alice')
+    bob = harness.join('bob')
+    token = alice.call('join_chat', username='alice')['session_token']
+    bob.call('send_message', message='first')
+    seen = alice.take_events('message')[-1]['seq']
+    alice.close()
+    harness.pump()
+    bob.call('send_message', message='while you were away')
+
+    again = harness.connect()
+    reply = again.call('resume', session_token=token, last_seen={'General': seen})
+    assert reply['status'] == 'success' and reply['username'] == 'alice'
+    assert [message['message'] for message in reply['missed_messages']] == ['while you were away']
+    assert reply['history_truncated'] is False
+    assert harness.chat_server.user_sessions['alice'] is again.session
+
+
+def test_detached_name_is_reserved_until_resumed(harness):
+    alice = harness.connect()
+    token = alice.join('alice')['session_token']
+    alice.close()
+    harness.pump()
+
+    assert harness.join('alice').session.username != 'alice'
+    assert harness.connect().call('resume', session_token=token)['username'] == 'alice'
+
+
+def test_resume_with_unknown_token_fails(harness):
+    client = harness.connect()
+    assert client.call('resume', session_token='nope')['status'] == 'error'
+    assert client.call('resume', session_token=42)['status'] == 'error'
+
+
+def test_resume_takes_over_a_stale_connection(harness):
+    old = harness.connect()
+    token = old.join('alice')['session_token']
+
+    new = harness.connect()
+    assert new.call('resume', session_token=token)['status'] == 'success'
+    assert old.session.id not in harness.rpc_server.clients
+    assert harness.chat_server.groups['General']['members'] == {new.session.id}
+
+
+def test_resume_after_join_leaves_the_joined_group(harness):
+    alice = harness.connect()
+    token = alice.join('alice')['session_token']
+    alice.call('create_group', group_name='Team')
+    harness.join('bob').call('join_group', group_name='Team')  # Keeps Team alive
+    alice.close()
+    harness.pump()
+
+    again = harness.connect()
+    again.join('carol')
+    reply = again.call('resume', session_token=token)
+
+    groups = harness.chat_server.groups
+    assert reply['group_name'] == 'Team'
+    assert again.session.id in groups['Team']['members']
+    assert again.session.id not in groups['General']['members']
+    assert 'carol' not in harness.chat_server.user_sessions
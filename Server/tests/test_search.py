@@ -0,0 +1,103 @@
+from conftest import ChatHarness
+from search_index import MessageSearchIndex
+from constants import ChatServerConfig, ErrorCodes
+
+
+def test_index_matches_every_token_newest_first():
+    index = MessageSearchIndex()
+    index.add('General', 1, 'lunch at noon', 1.0)
+    index.add('General', 2, 'Lunch tomorrow?', 2.0)
+    index.add('Team', 1, 'no lunch today', 3.0)
+
+    assert index.search('lunch', None, 10) == [('Team', 1), ('General', 2), ('General', 1)]
+    assert index.search('lunch noon', None, 10) == [('General', 1)]
+    assert index.search('lunch', ['General'], 1) == [('General', 2)]
+    assert index.search('dinner', None, 10) == []
+
+
+def test_index_folds_case_and_diacritics():
+    index = MessageSearchIndex()
+    index.add('General', 1, 'Đường Phố', 1.0)
+
+    assert index.search('duong pho', None, 10) == [('General', 1)]
+
+
+def test_index_forgets_removed_messages():
+    index = MessageSearchIndex()
+    index.add('General', 1, 'hello world', 1.0)
+    index.add('Team', 1, 'hello team', 2.0)
+
+    index.remove('General', 1)
+    assert index.search('hello', None, 10) == [('Team', 1)]
+    index.remove_group('Team')
+    assert index.search('hello', None, 10) == []
+    assert index.postings == {} and index.documents == {}
+
+
+def test_search_messages_rpc(harness):
+    alice = harness.join('alice')
+    bob = harness.join('bob')
+    alice.call('send_message', message='Deploy finished')
+    bob.call('send_message', message='deploy failed again')
+
+    reply = alice.call('search_messages', query='DEPLOY')
+    assert reply['status'] == 'success'
+    assert [(result['username'], result['is_own_message']) for result in reply['results']] == [
+        ('bob', False), ('alice', True)]
+
+    reply = alice.call('search_messages', query='deploy', group_name='General', limit=1)
+    assert reply['count'] == 1 and reply['results'][0]['message'] == 'deploy failed again'
+
+
+def test_search_messages_rejects_bad_requests(harness):
+    alice = harness.join('alice')
+
+    assert alice.call('search_messages', query='  ')['status'] == 'error'
+    assert alice.call('search_messages', query='x', group_name='Nope')['message'] == 'Group not found'
+
+
+def test_search_skips_evicted_history(harness, monkeypatch):
+    monkeypatch.setattr(ChatServerConfig, 'MAX_HISTORY_LENGTH', 2)
+    alice = harness.join('alice')
+    for text in ('one needle', 'two needle', 'three needle'):
+        alice.call('send_message', message=text)
+
+    results = alice.call('search_messages', query='needle')['results']
+    assert [result['message'] for result in results] == ['three needle', 'two needle']
+
+
+def test_search_rejects_a_group_name_that_is_not_a_string(harness):
+    alice = harness.join('alice')
+
+    reply = alice.call('search_messages', query='x', group_name=['General'])
+    assert reply['status'] == 'error' and reply['code'] == ErrorCodes.INVALID_PARAMS
+
+
+def test_search_after_restart_does_not_load_every_group_at_once(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    first = ChatHarness(snapshot_dir='state')
+    alice = first.join('alice')
+    alice.call('send_message', message='needle in General')
+    alice.call('create_group', group_name='Team')
+    alice.call('send_message', message='needle in Team')
+    first.close()
+
+    second = ChatHarness(snapshot_dir='state')
+    try:
+        chat = second.chat_server
+        assert set(chat.pending_restore) == {'General', 'Team'}
+        client = second.connect()
+        client.send('search_messages', query='needle')
+        second.run_once()  # Answered before the background restore has loaded anything
+        reply, = client.receive()
+        assert reply['partial'] is True and reply['count'] == 0
+
+        reply = client.call('search_messages', query='needle', group_name='Team')
+        assert [result['message'] for result in reply['results']] == ['needle in Team']
+        assert reply['partial'] is False
+
+        second.pump()  # Background restore finishes
+        reply = client.call('search_messages', query='needle')
+        assert reply['count'] == 2 and reply['partial'] is False
+    finally:
+        second.close()
@@ -0,0 +1,118 @@
+import os
+import json
+import pickle
+
+import pytest
+
+from conftest import ChatHarness
+from snapshot import SnapshotStore, loads_plain
+
+
+@pytest.fixture
+def state_dir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return 'state'
+
+
+def crash(harness):
+    """Stop without writing the final snapshot, so a restart has to replay the log"""
+    harness.chat_server.snapshots.close()
+    harness.rpc_server._cleanup()
+
+
+def test_graceful_restart_restores_groups_history_and_sessions(state_dir):
+    first = ChatHarness(snapshot_dir=state_dir)
+    alice = first.connect()
+    token = alice.join('alice')['session_token']
+    alice.call('create_group', group_name='Team')
+    alice.call('send_message', message='remember me')
+    first.close()
+
+    second = ChatHarness(snapshot_dir=state_dir)
+    try:
+        client = second.connect()
+        reply = client.call('resume', session_token=token, last_seen={'Team': 0})
+        assert reply['username'] == 'alice' and reply['group_name'] == 'Team'
+        assert [message['message'] for message in reply['missed_messages']] == ['remember me']
+        assert client.call('search_messages', query='remember')['count'] == 1
+    finally:
+        second.close()
+
+
+def test_log_is_flushed_once_per_loop_iteration(state_dir):
+    harness = ChatHarness(snapshot_dir=state_dir)
+    alice = harness.join('alice')
+    flushes = []
+    real_flush = harness.chat_server.snapshots.flush
+    harness.chat_server.snapshots.flush = lambda: flushes.append(1) or real_flush()
+
+    alice.send_raw(b''.join(json.dumps({'method': 'send_message', 'params': {'message': f"m{index}"}}).encode()
+                            for index in range(5)))
+    harness.run_once()
+    assert len(flushes) == 1
+
+    crash(harness)
+    restarted = ChatHarness(snapshot_dir=state_dir)
+    try:
+        restarted.chat_server._ensure_restored('General')
+        history = restarted.chat_server.groups['General']['message_history']
+        assert [record['message'] for record in history] == [f"m{index}" for index in range(5)]
+    finally:
+        restarted.close()
+
+
+def test_restart_after_crash_replays_the_log(state_dir):
+    first = ChatHarness(snapshot_dir=state_dir)
+    alice = first.join('alice')
+    alice.call('create_group', group_name='Team')
+    alice.call('send_message', message='logged')
+    crash(first)
+
+    second = ChatHarness(snapshot_dir=state_dir)
+    try:
+        chat = second.chat_server
+        assert 'Team' in chat.groups
+        chat._ensure_restored('Team')
+        assert [record['message'] for record in chat.groups['Team']['message_history']] == ['logged']
+        assert chat.groups['Team']['next_seq'] == 2
+    finally:
+        second.close()
+
+
+class Exploit:
+    def __reduce__(self):
+        return (print, ('code ran',))
+
+
+def test_records_naming_a_callable_are_refused(state_dir, capsys):
+    store = SnapshotStore(state_dir)
+    store.open_log()
+    store.append(('group', 'Team', 'alice', []))
+    store.append(('message', 'Team', 1, Exploit(), 1.0, 'x'))
+    store.append(('delete', 'Team'))
+    store.close()
+
+    records = []
+    SnapshotStore(state_dir).restore(records.append)
+    assert records == [('group', 'Team', 'alice', [])]
+    assert 'code ran' not in capsys.readouterr().out
+
+
+def test_snapshot_header_naming_a_callable_is_refused(state_dir):
+    store = SnapshotStore(state_dir)
+    with open(os.path.join(state_dir, SnapshotStore.SNAPSHOT_FILE), 'wb') as f:
+        pickle.dump(Exploit(), f)
+
+    with pytest.raises(pickle.UnpicklingError):
+        store.restore(lambda record: None)
+
+
+def test_handoff_state_is_plain_data(harness):
+    alice = harness.join('alice')
+    alice.call('send_direct_message', to='alice', message='x')
+    harness.join('bob').call('send_direct_message', to='alice', message='hi')
+    alice.send_raw(b'{"method": "get_us')
+    harness.pump()
+
+    _, state = harness.chat_server._handoff_state()
+    assert loads_plain(pickle.dumps(state, pickle.HIGHEST_PROTOCOL)) == state
@@ -0,0 +1,55 @@
+import pytest
+
+from constants import ChatServerConfig
+
+
+@pytest.fixture(autouse=True)
+def immediate_presence(monkeypatch):
+    monkeypatch.setattr(ChatServerConfig, 'PRESENCE_FLUSH_INTERVAL', 0.0)
+
+
+def test_subscribe_replies_with_a_snapshot(harness):
+    alice = harness.join('alice')
+    harness.join('bob')
+
+    presence = alice.call('subscribe_presence')['presence']
+    assert sorted(presence['users']) == ['alice', 'bob']
+    assert presence['users_version'] == harness.chat_server.users_version
+    assert presence['group_name'] == 'General'
+    assert sorted(presence['members']) == ['alice', 'bob']
+
+
+def test_changes_are_pushed_as_users_delta(harness):
+    alice = harness.join('alice')
+    version = alice.call('subscribe_presence')['presence']['users_version']
+
+    bob = harness.join('bob')
+    joined, = alice.take_events('users_delta')
+    assert joined['added'] == ['bob'] and joined['removed'] == []
+    assert joined['base_version'] == version and joined['count'] == 2
+
+    bob.call('leave_chat')
+    left, = alice.take_events('users_delta')
+    assert left['removed'] == ['bob'] and left['base_version'] == joined['users_version']
+
+
+def test_only_subscribers_receive_users_delta(harness):
+    alice = harness.join('alice')
+    bob = harness.join('bob')
+    alice.call('subscribe_presence')
+    bob.call('subscribe_presence')
+    assert bob.call('subscribe_presence', users=False)['status'] == 'success'
+
+    harness.join('carol')
+    assert len(alice.take_events('users_delta')) == 1
+    assert bob.take_events('users_delta') == []
+
+
+def test_disconnect_ends_the_subscription(harness):
+    alice = harness.join('alice')
+    alice.call('subscribe_presence')
+    alice.close()
+    harness.pump()
+
+    harness.join('bob')
+    assert harness.chat_server.presence_subscribers == set()
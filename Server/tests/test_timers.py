@@ -0,0 +1,92 @@
+import pytest
+
+import timers
+from timers import TimerQueue
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(timers, 'time', fake)
+    return fake
+
+
+def test_idle_queue_lets_select_sleep(clock):
+    queue = TimerQueue()
+    assert queue.timeout() is None
+    queue.call_later(2.0, print)
+    assert queue.timeout() == 2.0
+    queue.call_soon(print)
+    assert queue.timeout() == 0.0
+
+
+def test_timers_run_in_deadline_order(clock):
+    queue = TimerQueue()
+    calls = []
+    queue.call_later(2.0, calls.append, 'late')
+    queue.call_later(1.0, calls.append, 'first')
+    queue.call_later(1.0, calls.append, 'second')
+
+    clock.now += 1.0
+    queue.run()
+    assert calls == ['first', 'second']
+    assert queue.timeout() == 1.0
+    clock.now += 1.0
+    queue.run()
+    assert calls == ['first', 'second', 'late']
+
+
+def test_call_soon_queued_while_running_waits_for_the_next_run(clock):
+    queue = TimerQueue()
+    calls = []
+    queue.call_soon(lambda: (calls.append(1), queue.call_soon(calls.append, 2)))
+    queue.run()
+    assert calls == [1]
+    queue.run()
+    assert calls == [1, 2]
+
+
+def test_repeating_timer_does_not_catch_up(clock):
+    queue = TimerQueue()
+    calls = []
+    timer = queue.call_every(1.0, calls.append, 'tick')
+    clock.now += 5.5
+    queue.run()
+    assert calls == ['tick']
+    assert queue.timeout() == 1.0  # Not five runs at once to catch up
+
+    clock.now += 0.25
+    queue.run()
+    clock.now += 0.75
+    queue.run()
+    assert calls == ['tick', 'tick']
+
+    timer.cancel()
+    clock.now += 10.0
+    queue.run()
+    assert calls == ['tick', 'tick'] and queue.timeout() is None
+
+
+def test_failing_callback_does_not_stop_the_others(clock):
+    queue = TimerQueue()
+    calls = []
+    queue.call_soon(lambda: 1 / 0)
+    queue.call_soon(calls.append, 'after')
+    queue.run()
+    assert calls == ['after']
+
+
+def test_server_loop_runs_due_timers(harness):
+    calls = []
+    harness.rpc_server.call_soon(calls.append, 'soon')
+    harness.rpc_server.call_later(0.0, calls.append, 'later')
+    harness.run_once()
+    assert calls == ['soon', 'later']
@@ -0,0 +1,61 @@
+import json
+import pickle
+
+import pytest
+
+from constants import Lane
+from snapshot import loads_plain
+from tracing import Trace, TracedFrame
+
+
+@pytest.fixture
+def tracer(harness):
+    harness.rpc_server.enable_tracing(1.0, 'trace.json')
+    return harness.rpc_server.tracer
+
+
+def read_events(tracer):
+    tracer.close()
+    with open('trace.json', encoding='utf-8') as trace_file:
+        return json.load(trace_file)
+
+
+def sent_sessions(events, method):
+    track, = [event['tid'] for event in events if event['ph'] == 'M' and event['args']['name'].startswith(method)]
+    return sorted(event['args']['session'] for event in events if event['tid'] == track and event['name'] == 'sent')
+
+
+def test_message_is_followed_to_every_recipient(harness, tracer):
+    alice = harness.join('alice')
+    bob = harness.join('bob')
+    alice.call('send_message', message='hello')
+    bob.take_events()
+
+    events = read_events(tracer)
+    assert sent_sessions(events, 'send_message') == sorted([alice.session.id, bob.session.id])
+    names = {event['name'] for event in events}
+    assert {'recv+parse', 'handler send_message', 'enqueue', 'sent'} <= names
+
+
+def test_reused_payload_is_not_reported_for_untraced_sends(harness, tracer):
+    alice = harness.join('alice')
+    alice.call('get_users')
+    tracer.sample_rate = 0.0
+    cached = harness.chat_server.users_response
+    alice.call('get_users')
+    alice.call('get_users')
+    assert harness.chat_server.users_response is cached  # The same bytes went out three times
+
+    assert sent_sessions(read_events(tracer), 'get_users') == [alice.session.id]
+
+
+def test_traced_frames_are_handed_off_as_plain_bytes(harness, tracer):
+    session = harness.connect().session
+    tracer.current = Trace(1, 'test', session.id)
+    harness.rpc_server.send_encoded(session, b'{"traced": true}', Lane.BULK)
+    tracer.current = None
+    assert isinstance(session.outbox[Lane.BULK][0], TracedFrame)
+
+    _, state = harness.rpc_server.export_handoff()
+    restored = loads_plain(pickle.dumps(state))
+    assert restored['sessions'][0][8] == [b'{"traced": true}']
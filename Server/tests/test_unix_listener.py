@@ -0,0 +1,62 @@
+import os
+import json
+import socket
+
+import pytest
+
+from conftest import ChatHarness
+from rpc_server import AF_UNIX
+
+pytestmark = pytest.mark.skipif(AF_UNIX is None, reason="AF_UNIX is not available")
+
+
+@pytest.fixture
+def listening(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    open('stale.sock', 'w').close()  # Left behind by a crashed server
+    chat = ChatHarness()
+    chat.listen(0, ['chat.sock', 'stale.sock'])
+    yield chat
+    chat.close()
+
+
+def call(chat, sock, method, **params):
+    sock.sendall(json.dumps({'method': method, 'params': params}).encode('utf-8'))
+    decoder = json.JSONDecoder()
+    data = ''
+    while True:
+        chat.pump()
+        try:
+            data += sock.recv(65536, socket.MSG_DONTWAIT).decode('utf-8')
+        except BlockingIOError:
+            continue
+        while data:
+            message, end = decoder.raw_decode(data)
+            data = data[end:].lstrip()
+            if 'status' in message:
+                return message
+
+
+def connect_unix(path):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.connect(path)
+    return sock
+
+
+def test_unix_and_tcp_clients_share_one_chat(listening):
+    alice = connect_unix('chat.sock')
+    bob = connect_unix('stale.sock')
+    carol = socket.create_connection(listening.rpc_server.socket.getsockname())
+
+    for sock, name in ((alice, 'alice'), (bob, 'bob'), (carol, 'carol')):
+        assert call(listening, sock, 'join_chat', username=name)['status'] == 'success'
+    users = call(listening, carol, 'get_users')['users']
+    assert sorted(user['username'] for user in users) == ['alice', 'bob', 'carol']
+    for sock in (alice, bob, carol):
+        sock.close()
+
+
+def test_socket_files_are_removed_on_shutdown(listening):
+    assert os.path.exists('chat.sock')
+    listening.close()
+    assert not os.path.exists('chat.sock') and not os.path.exists('stale.sock')
@@ -0,0 +1,43 @@
+def test_duplicate_name_gets_port_suffix(harness):
+    alice = harness.join('alice')
+    other = harness.connect()
+
+    reply = other.join('alice')
+    assert reply['message'] == f"Joined chat as alice_{other.session.address[1]}"
+    assert harness.chat_server.user_sessions['alice'] is alice.session
+
+
+def test_fallback_name_that_is_taken_is_not_overwritten(harness):
+    alice = harness.join('alice')
+    second = harness.connect()
+    port = second.session.address[1]
+    squatter = harness.join(f"alice_{port}")
+
+    second.join('alice')
+    third = harness.connect()
+    third.session.address = second.session.address  # Same port, e.g. another Unix socket numbering
+    third.join('alice')
+
+    sessions = harness.chat_server.user_sessions
+    assert sessions['alice'] is alice.session
+    assert sessions[f"alice_{port}"] is squatter.session
+    assert second.session.username == f"alice_{port}_2"
+    assert third.session.username == f"alice_{port}_3"
+    assert len({session.id for session in sessions.values()}) == len(sessions) == 4
+
+
+def test_rejoining_with_own_name_keeps_it(harness):
+    alice = harness.join('alice')
+
+    alice.join('alice')
+    assert alice.session.username == 'alice'
+    assert harness.chat_server.user_sessions == {'alice': alice.session}
+
+
+def test_name_is_freed_on_disconnect(harness):
+    alice = harness.join('alice')
+    alice.call('leave_chat')
+    alice.close()
+    harness.pump()
+
+    assert harness.join('alice').session.username == 'alice'
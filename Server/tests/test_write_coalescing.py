@@ -0,0 +1,56 @@
+import json
+import socket
+
+import pytest
+
+from constants import ChatServerConfig
+
+
+@pytest.fixture(autouse=True)
+def immediate_presence(monkeypatch):
+    monkeypatch.setattr(ChatServerConfig, 'PRESENCE_FLUSH_INTERVAL', 0.0)
+
+
+def read_now(client):
+    """What the server has written so far, without running its loop"""
+    try:
+        return client.socket.recv(1024 * 1024, socket.MSG_DONTWAIT)
+    except BlockingIOError:
+        return b''
+
+
+def test_frames_of_one_iteration_go_out_in_one_write(harness):
+    client = harness.connect()
+    client.send('join_chat', username='alice')
+    sent = []
+    real_flush = harness.rpc_server._flush_outbox
+    harness.rpc_server._flush_outbox = lambda session: (sent.append(session.id), real_flush(session))
+    harness.run_once()
+
+    assert sent == [client.session.id]
+    data = read_now(client).decode('utf-8')
+    assert '"status": "success"' in data and 'Welcome to the chat, alice!' in data
+
+
+def test_frames_queued_while_removing_a_client_go_out_in_the_same_iteration(harness):
+    alice = harness.join('alice')
+    bob = harness.join('bob')
+    harness.pump()
+    read_now(alice)
+
+    # Closed by a timer, so the removal happens after this iteration's flush
+    harness.rpc_server.call_soon(harness.rpc_server.close_later, bob.session)
+    harness.run_once()
+
+    assert harness.rpc_server.pending_flush == {} and harness.rpc_server.closing == []
+    delta = json.loads(read_now(alice))
+    assert delta['type'] == 'members_delta' and delta['removed'] == ['bob']
+
+
+def test_tcp_connections_disable_nagle(harness):
+    harness.listen(0)
+    client = socket.create_connection(harness.rpc_server.socket.getsockname())
+    harness.pump()
+    session, = harness.rpc_server.clients.values()
+    assert session.socket.getsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY)
+    client.close()
@@ -0,0 +1,88 @@
+import time
+import heapq
+import logging
+import itertools
+from collections import deque
+from typing import Any, Callable, Deque, List, Optional, Tuple
+
+
+class Timer:
+    """Handle for a callback scheduled on the event loop"""
+    __slots__ = ('when', 'callback', 'args', 'interval', 'cancelled')
+
+    def __init__(self, when: float, callback: Callable, args: Tuple[Any, ...], interval: Optional[float] = None):
+        self.when = when  # time.monotonic() deadline
+        self.callback = callback
+        self.args = args
+        self.interval = interval  # Seconds between runs of a repeating timer
+        self.cancelled = False
+
+    def cancel(self) -> None:
+        """Stop the callback from running (again); safe to call from inside it"""
+        self.cancelled = True
+
+
+class TimerQueue:
+    """Callbacks for the event loop: due at a deadline (a heap) or on the next iteration (a FIFO).
+
+    The loop sleeps in select() for ``timeout()`` and then calls ``run()``, so
+    an idle server wakes only when something is due.
+    """
+
+    def __init__(self):
+        self.heap: List[Tuple[float, int, Timer]] = []
+        self.soon: Deque[Timer] = deque()
+        self.order = itertools.count()  # Equal deadlines run in the order they were scheduled
+        self.logger = logging.getLogger(f"{self.__class__.__name__}")
+
+    def call_soon(self, callback: Callable, *args: Any) -> Timer:
+        timer = Timer(0.0, callback, args)
+        self.soon.append(timer)
+        return timer
+
+    def call_later(self, delay: float, callback: Callable, *args: Any) -> Timer:
+        timer = Timer(time.monotonic() + delay, callback, args)
+        heapq.heappush(self.heap, (timer.when, next(self.order), timer))
+        return timer
+
+    def call_every(self, interval: float, callback: Callable, *args: Any) -> Timer:
+        """Run callback every interval seconds, the first time one interval from now"""
+        timer = Timer(time.monotonic() + interval, callback, args, interval)
+        heapq.heappush(self.heap, (timer.when, next(self.order), timer))
+        return timer
+
+    def timeout(self) -> Optional[float]:
+        """Seconds select() may sleep before something is due; None when nothing is scheduled"""
+        if self.soon:
+            return 0.0
+        while self.heap and self.heap[0][2].cancelled:
+            heapq.heappop(self.heap)
+        if not self.heap:
+            return None
+        return max(0.0, self.heap[0][0] - time.monotonic())
+
+    def run(self) -> None:
+        """Run the call_soon callbacks queued so far and every timer that is due"""
+        for _ in range(len(self.soon)):  # Callbacks queued while running wait for the next iteration
+            self._call(self.soon.popleft())
+
+        now = time.monotonic()
+        while self.heap and self.heap[0][0] <= now:
+            timer = heapq.heappop(self.heap)[2]
+            if timer.cancelled:
+                continue
+            if timer.interval is not None:
+                # A run that fell behind is not repeated to catch up: the cadence restarts from now
+                timer.when += timer.interval
+                if timer.when <= now:
+                    timer.when = now + timer.interval
+                heapq.heappush(self.heap, (timer.when, next(self.order), timer))
+            self._call(timer)
+
+    def _call(self, timer: Timer) -> None:
+        if timer.cancelled:
+            return
+        try:
+            timer.callback(*timer.args)
+        except Exception as e:
+            self.logger.error(f"Error in scheduled callback {timer.callback!r}: {e}")
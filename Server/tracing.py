@@ -0,0 +1,143 @@
+import os
+import json
+import time
+import random
+import logging
+import itertools
+from typing import Any, Dict, List, Optional, Tuple
+
+from constants import RpcServerConfig
+
+
+class Trace:
+    """One sampled request followed from recv to the last recipient's write"""
+    __slots__ = ('id', 'method', 'session_id')
+
+    def __init__(self, trace_id: int, method: str, session_id: int):
+        self.id = trace_id
+        self.method = method
+        self.session_id = session_id
+
+
+class TracedFrame(bytes):
+    """A queued frame written under a trace, so its writes can be recorded against it.
+
+    Payloads are shared between recipients and reused (e.g. cached responses),
+    so the trace travels with a copy made for the traced sends only.
+    """
+
+    def __new__(cls, payload: bytes, trace: Trace) -> 'TracedFrame':
+        frame = super().__new__(cls, payload)
+        frame.trace = trace
+        return frame
+
+
+class Tracer:
+    """Record sampled requests as Chrome trace events (chrome://tracing, Perfetto).
+
+    Each sampled request gets a trace id and its own track (tid) holding a
+    recv/parse span, the handler span, fan-out enqueue and chunk events and one
+    ``sent`` event per recipient once its frame is written. Events are
+    appended to a JSON array file every TRACE_FLUSH_INTERVAL; the format lets
+    the closing bracket be missing, so a crashed server's file still loads.
+    """
+
+    def __init__(self, rpc_server, sample_rate: float, path: str):
+        self.rpc_server = rpc_server
+        self.sample_rate = sample_rate
+        self.path = path
+        self.pid = os.getpid()
+        self.trace_ids = itertools.count(1)
+        self.current: Optional[Trace] = None  # Trace of the request or fan-out chunk being processed
+        self.recv_at = 0.0  # perf_counter() when the data being parsed arrived
+        self.tagged: Optional[Tuple[bytes, TracedFrame]] = None  # Last payload tagged, reused for its other recipients
+        self.events: List[Dict[str, Any]] = []
+        self.dropped = 0
+        self.file = open(path, 'w', encoding='utf-8')
+        self.file.write('[\n')
+        self.first_event = True
+        self.logger = logging.getLogger(f"{self.__class__.__name__}")
+        self._add({'name': 'process_name', 'ph': 'M', 'pid': self.pid, 'tid': 0, 'args': {'name': 'chat server'}})
+        rpc_server.call_every(RpcServerConfig.TRACE_FLUSH_INTERVAL, self.flush)
+
+    @staticmethod
+    def timestamp() -> float:
+        return time.perf_counter() * 1e6  # Trace timestamps are microseconds
+
+    def _add(self, event: Dict[str, Any]) -> None:
+        if len(self.events) >= RpcServerConfig.TRACE_MAX_BUFFERED_EVENTS:
+            self.dropped += 1
+            return
+        self.events.append(event)
+
+    def _span(self, trace: Trace, name: str, start: float, end: float, **args: Any) -> None:
+        self._add({'name': name, 'ph': 'X', 'ts': start, 'dur': end - start, 'pid': self.pid, 'tid': trace.id,
+                   'args': args})
+
+    def _instant(self, trace: Trace, name: str, **args: Any) -> None:
+        self._add({'name': name, 'ph': 'i', 's': 't', 'ts': self.timestamp(), 'pid': self.pid, 'tid': trace.id,
+                   'args': args})
+
+    def begin(self, method: Any, session_id: int) -> Optional[Trace]:
+        """Sample a parsed request; when chosen it becomes the current trace until end()"""
+        if random.random() >= self.sample_rate:
+            return None
+        trace = Trace(next(self.trace_ids), str(method), session_id)
+        now = self.timestamp()
+        self._add({'name': 'thread_name', 'ph': 'M', 'pid': self.pid, 'tid': trace.id,
+                   'args': {'name': f"{trace.method} #{trace.id}"}})
+        self._span(trace, 'recv+parse', self.recv_at * 1e6, now, session=session_id)
+        self.current = trace
+        return trace
+
+    def end(self, trace: Trace, started: float) -> None:
+        self._span(trace, f"handler {trace.method}", started, self.timestamp(), session=trace.session_id)
+        self.current = None
+
+    def fanout_enqueued(self, trace: Trace, key: str, recipients: int) -> None:
+        self._instant(trace, 'fanout enqueue', group=key, recipients=recipients)
+
+    def fanout_chunk(self, trace: Trace, started: float, delivered: int) -> None:
+        self._span(trace, 'fanout chunk', started, self.timestamp(), recipients=delivered)
+
+    def frame_queued(self, payload: bytes, session_id: int) -> TracedFrame:
+        """Tag a frame queued under the current trace; queue the returned frame so its write is recorded"""
+        trace = self.current
+        tagged = self.tagged
+        if tagged is not None and tagged[0] is payload and tagged[1].trace is trace:
+            frame = tagged[1]  # Same fan-out payload for another recipient
+        else:
+            frame = TracedFrame(payload, trace)
+            self.tagged = (payload, frame)
+        self._instant(trace, 'enqueue', session=session_id, bytes=len(payload))
+        return frame
+
+    def frame_sent(self, frame: TracedFrame, session_id: int) -> None:
+        self._instant(frame.trace, 'sent', session=session_id)
+
+    def flush(self) -> None:
+        """Append buffered events to the trace file"""
+        self.tagged = None  # Lets go of the last tagged payload
+        if self.dropped:
+            self.logger.warning(f"Dropped {self.dropped} trace events; lower the sample rate")
+            self.dropped = 0
+        if not self.events or self.file.closed:
+            return
+
+        events, self.events = self.events, []
+        text = ',\n'.join(json.dumps(event, separators=(',', ':')) for event in events)
+        if not self.first_event:
+            text = ',\n' + text
+        self.first_event = False
+        try:
+            self.file.write(text)
+            self.file.flush()
+        except OSError as e:
+            self.logger.error(f"Could not write trace file {self.path}: {e}")
+
+    def close(self) -> None:
+        if self.file.closed:
+            return
+        self.flush()
+        self.file.write('\n]\n')
+        self.file.close()